@@ -2,6 +2,7 @@ from django.shortcuts import render, redirect
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from orders.models import Cart
+from orders.utils import cart_lines_with_products
 
 from .forms import CustomUserRegistrationForm
 
@@ -67,7 +68,7 @@ def buyer_dashboard(request):
     except Cart.DoesNotExist:
         cart = Cart.objects.create(user=request.user)
 
-    items = cart.items.select_related("product")
+    items = cart_lines_with_products(cart)
 
     return render(
         request,
@@ -0,0 +1,159 @@
+# ecommerce/instrumentation.py
+#
+# Per-request cost accounting: SQL query count/time (via
+# connection.execute_wrapper), template render time and total time. The
+# numbers go out as a Server-Timing header and a structured log line keyed
+# by URL name.
+#
+# The current request's metrics live in a ContextVar, which asgiref copies
+# into sync_to_async threads, so under ASGI the queries a view runs on its
+# worker thread (with that thread's own connection) are counted too.
+
+import json
+import logging
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.backends.django import DjangoTemplates, Template
+
+logger = logging.getLogger("ecommerce.requests")
+
+_current = ContextVar("request_metrics", default=None)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.template_seconds = 0.0
+        self._template_depth = 0
+
+
+def _record_query(execute, sql, params, many, context):
+    """execute_wrapper installed on every connection; a no-op outside requests."""
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.db_seconds += time.perf_counter() - start
+
+
+def _install(connection):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def _connection_created(sender, connection, **kwargs):
+    _install(connection)
+
+
+# Connections are per thread: cover every connection opened from now on.
+connection_created.connect(_connection_created, dispatch_uid="request_metrics")
+
+
+class InstrumentedTemplate(Template):
+    """Adds top-level render time to the current request's metrics."""
+
+    def render(self, context=None, request=None):
+        metrics = _current.get()
+        if metrics is None:
+            return super().render(context, request)
+
+        metrics._template_depth += 1
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            metrics._template_depth -= 1
+            if not metrics._template_depth:
+                metrics.template_seconds += time.perf_counter() - start
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    """The stock Django template backend, with render timing."""
+
+    def from_string(self, template_code):
+        return InstrumentedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return InstrumentedTemplate(template.template, self)
+
+
+class RequestMetricsMiddleware:
+    """
+    Record the cost of every request. Template time is only measured when
+    TEMPLATES uses InstrumentedDjangoTemplates. The Server-Timing header is
+    sent when REQUEST_METRICS_SERVER_TIMING is true (defaults to DEBUG).
+    Works in both sync (WSGI) and async (ASGI) middleware chains.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.server_timing = getattr(settings, "REQUEST_METRICS_SERVER_TIMING", settings.DEBUG)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        # Connections opened before this module was imported have no wrapper yet.
+        for connection in connections.all(initialized_only=True):
+            _install(connection)
+
+        metrics, token, start = self._start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, metrics, start)
+
+    async def __acall__(self, request):
+        metrics, token, start = self._start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(request, response, metrics, start)
+
+    def _start(self, request):
+        metrics = RequestMetrics()
+        request.metrics = metrics
+        return metrics, _current.set(metrics), time.perf_counter()
+
+    def _finish(self, request, response, metrics, start):
+        total = time.perf_counter() - start
+
+        match = getattr(request, "resolver_match", None)
+        url_name = match.view_name if match else None
+
+        if self.server_timing:
+            response["Server-Timing"] = ", ".join([
+                f'db;dur={metrics.db_seconds * 1000:.2f};desc="{metrics.queries} queries"',
+                f"tpl;dur={metrics.template_seconds * 1000:.2f}",
+                f"total;dur={total * 1000:.2f}",
+            ])
+
+        record = {
+            "url_name": url_name,
+            "method": request.method,
+            "status": response.status_code,
+            "queries": metrics.queries,
+            "db_ms": round(metrics.db_seconds * 1000, 2),
+            "template_ms": round(metrics.template_seconds * 1000, 2),
+            "total_ms": round(total * 1000, 2),
+        }
+        logger.info(json.dumps(record, sort_keys=True), extra={"metrics": record})
+        return response
@@ -0,0 +1,133 @@
+# ecommerce/replicas.py
+#
+# Read replicas for the catalog. PrimaryReplicaRouter sends reads of the
+# products, stores and reviews apps to one of DATABASE_REPLICAS; everything
+# else (orders, accounts, sessions), every write, and every read inside a
+# transaction stays on the primary (`default`).
+#
+# Replicas lag, so a client that has just changed catalog data reads it back
+# from the primary: ReplicaRoutingMiddleware notes catalog writes and sets a
+# cookie that pins the client's reads to the primary for
+# REPLICA_STICKY_SECONDS. Unsafe requests (POST and friends) read the
+# primary too, so a form never validates against stale rows.
+#
+# Replica reads only happen inside a request handled by the middleware;
+# management commands and other code outside requests use the primary.
+# Code that stores what it reads for other requests (the full-page cache)
+# calls read_primary() first, so a lagging replica is never cached.
+
+import random
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+REPLICATED_APPS = {"products", "stores", "reviews"}
+STICKY_COOKIE_NAME = "db_primary"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+_current = ContextVar("replica_routing", default=None)
+
+
+class RoutingState:
+    def __init__(self, primary=False):
+        self.primary = primary  # read from the primary for the rest of the request
+        self.wrote = False      # wrote catalog data: pin the client
+
+
+def replicas():
+    return list(getattr(settings, "DATABASE_REPLICAS", []))
+
+
+def read_primary():
+    """Send the rest of the current request's reads to the primary."""
+    state = _current.get()
+    if state is not None:
+        state.primary = True
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _current.get()
+        aliases = replicas()
+        if (
+            state is None
+            or state.primary
+            or not aliases
+            or model._meta.app_label not in REPLICATED_APPS
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return DEFAULT_DB_ALIAS
+        return random.choice(aliases)
+
+    def db_for_write(self, model, **hints):
+        state = _current.get()
+        if state is not None and model._meta.app_label in REPLICATED_APPS:
+            state.primary = state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        pool = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get their schema from the primary.
+        if db in replicas():
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Route the request's catalog reads to the replicas, unless the client
+    is pinned to the primary, and pin it after a catalog write. Works in
+    both sync (WSGI) and async (ASGI) middleware chains.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+
+        state, token = self._start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(state, response)
+
+    async def __acall__(self, request):
+        state, token = self._start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self._finish(state, response)
+
+    def _start(self, request):
+        state = RoutingState(
+            primary=request.method not in SAFE_METHODS or STICKY_COOKIE_NAME in request.COOKIES
+        )
+        return state, _current.set(state)
+
+    def _finish(self, state, response):
+        if state.wrote and replicas():
+            response.set_cookie(
+                STICKY_COOKIE_NAME, "1",
+                max_age=getattr(settings, "REPLICA_STICKY_SECONDS", 10),
+                secure=settings.SESSION_COOKIE_SECURE,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
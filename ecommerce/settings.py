@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 import pymysql
 pymysql.install_as_MySQLdb()
@@ -53,8 +54,11 @@ AUTH_USER_MODEL = 'accounts.CustomUser'
 
 
 MIDDLEWARE = [
+    'ecommerce.instrumentation.RequestMetricsMiddleware',
+    'ecommerce.replicas.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'orders.guest_cart.GuestCartMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -66,7 +70,8 @@ ROOT_URLCONF = 'ecommerce.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates plus render timing for RequestMetricsMiddleware
+        'BACKEND': 'ecommerce.instrumentation.InstrumentedDjangoTemplates',
         'DIRS': [BASE_DIR / "templates"],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -74,6 +79,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'orders.context_processors.cart',
             ],
         },
     },
@@ -81,6 +87,11 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'ecommerce.wsgi.application'
 
+# Send per-request SQL/template/total timings as a Server-Timing header
+# (see ecommerce/instrumentation.py). They are always logged to the
+# "ecommerce.requests" logger.
+REQUEST_METRICS_SERVER_TIMING = DEBUG
+
 
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
@@ -97,6 +108,36 @@ DATABASES = {
     }
 }
 
+# Read replicas (ecommerce/replicas.py): catalog reads go to the aliases in
+# DATABASE_REPLICAS; a client that writes catalog data reads the primary for
+# REPLICA_STICKY_SECONDS after. To try this out locally, copy ecommerce_db
+# to another file and name it in the DATABASE_REPLICA_NAME environment
+# variable. Without it "replica" is an unused in-memory database, so that
+# no file is created, and the tests use it as their replica.
+DATABASE_REPLICA_NAME = os.environ.get('DATABASE_REPLICA_NAME')
+DATABASES['replica'] = {
+    'ENGINE': 'django.db.backends.sqlite3',
+    'NAME': DATABASE_REPLICA_NAME or ':memory:',
+}
+DATABASE_REPLICAS = ['replica'] if DATABASE_REPLICA_NAME else []
+DATABASE_ROUTERS = ['ecommerce.replicas.PrimaryReplicaRouter']
+REPLICA_STICKY_SECONDS = 10
+
+
+# Cache
+# Local memory for development and tests; point this at Redis/Memcached in
+# production so every worker shares the product cache (products/cache.py).
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+PRODUCT_CACHE_TIMEOUT = 60 * 60
+
+# Anonymous catalog pages (products/page_cache.py). Changes purge them;
+# the timeout bounds how long a page can miss a hold that simply expired.
+PAGE_CACHE_TIMEOUT = 10 * 60
 
 
 # Password validation
@@ -123,6 +164,27 @@ DEFAULT_FROM_EMAIL = "no-reply@yourdomain.com"
 
 EMAIL_BACKEND = "django.core.mail.backends.console.EmailBackend"
 
+# Invoice outbox (see orders/emails.py and `manage.py send_invoice_emails`)
+INVOICE_EMAIL_MAX_ATTEMPTS = 5
+INVOICE_EMAIL_BACKOFF_SECONDS = 60
+INVOICE_EMAIL_MAX_BACKOFF_SECONDS = 3600
+
+# Stock reservations taken at add-to-cart (see orders/reservations.py and
+# `manage.py release_expired_reservations`)
+STOCK_RESERVATION_TTL_SECONDS = 15 * 60
+# Guest carts only check stock until checkout, so guest cart edits write
+# nothing to the database. True holds their stock like a logged-in cart's.
+STOCK_RESERVATION_GUEST_HOLDS = False
+
+# How a guest cart merges into a saved cart at login: "sum", "max",
+# "guest" or "user" (see orders/merge.py)
+CART_MERGE_STRATEGY = "sum"
+
+# Guest carts live in a signed cookie (orders/guest_cart.py), falling back
+# to the session for carts that pack to more than the cap.
+GUEST_CART_STORAGE = "orders.guest_cart.SignedCookieCartStorage"
+GUEST_CART_COOKIE_MAX_BYTES = 2048
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/6.0/topics/i18n/
@@ -140,3 +202,13 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/6.0/howto/static-files/
 
 STATIC_URL = 'static/'
+
+# Uploaded files (product images and their renditions)
+MEDIA_URL = 'media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
+# Product image renditions (products/renditions.py): widths in pixels,
+# each written as WebP and JPEG by PRODUCT_IMAGE_WORKERS processes.
+PRODUCT_IMAGE_WIDTHS = [160, 320, 640, 1280]
+PRODUCT_IMAGE_QUALITY = 80
+PRODUCT_IMAGE_WORKERS = 2
@@ -0,0 +1,104 @@
+# ecommerce/testing.py
+#
+# Test helpers shared by the apps' test suites.
+
+import re
+
+from django.db import connection, connections
+from django.test.utils import CaptureQueriesContext, override_settings
+
+
+class QueryBudgetMixin:
+    """
+    Mixin for TestCase: assertQueryBudget() requests a URL with self.client
+    and fails if it runs more than `budget` SQL queries, listing them. Use
+    it to pin the cost of a view so N+1 regressions fail CI, e.g.
+
+        self.assertQueryBudget(4, reverse("view_cart"))
+    """
+
+    def assertQueryBudget(self, budget, url, method="get", data=None, **extra):
+        with CaptureQueriesContext(connection) as ctx:
+            response = getattr(self.client, method)(url, data or {}, **extra)
+
+        if len(ctx.captured_queries) > budget:
+            queries = "\n".join(
+                f"{n}. {query['sql']}" for n, query in enumerate(ctx.captured_queries, start=1)
+            )
+            self.fail(
+                f"{method.upper()} {url} ran {len(ctx.captured_queries)} queries, "
+                f"budget is {budget}:\n{queries}"
+            )
+        return response
+
+
+# A line of SQLite's EXPLAIN QUERY PLAN that reads a whole table: "SCAN t"
+# or "SCAN t AS alias", but not "SCAN t USING [COVERING] INDEX i".
+_FULL_SCAN = re.compile(r"^SCAN (\w+)(?: AS \w+)?$")
+
+
+class QueryPlanMixin:
+    """
+    Mixin for TestCase: assertIndexedQueries() requests a URL with
+    self.client, runs EXPLAIN QUERY PLAN on every SELECT the view issued and
+    fails if any reads a whole table instead of going through an index, e.g.
+
+        self.assertIndexedQueries(reverse("product_list"))
+
+    Tables that are small by design (categories, a user's stores) can be
+    let through with `allow`. SQLite only; skipped on other databases.
+    """
+
+    def assertIndexedQueries(self, url, method="get", data=None, allow=(), **extra):
+        if connection.vendor != "sqlite":
+            self.skipTest("EXPLAIN QUERY PLAN checks are written for SQLite")
+
+        statements = []
+
+        def record(execute, sql, params, many, context):
+            if sql.lstrip().upper().startswith("SELECT"):
+                statements.append((sql, params))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(record):
+            response = getattr(self.client, method)(url, data or {}, **extra)
+
+        scans = []
+        with connection.cursor() as cursor:
+            for sql, params in statements:
+                cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+                for *_, detail in cursor.fetchall():
+                    match = _FULL_SCAN.match(detail)
+                    if match and match.group(1) not in allow:
+                        scans.append(f"{detail}\n    in: {sql}")
+
+        if scans:
+            self.fail(f"{method.upper()} {url} scanned whole tables:\n" + "\n".join(scans))
+        return response
+
+
+class ReplicaTestMixin:
+    """
+    Mixin for TransactionTestCase: routes catalog reads to the "replica"
+    test database, which starts each test as a copy of the primary.
+    sync_replicas() copies the primary over it again (SQLite's backup API),
+    standing in for replication, so a test decides exactly when the replica
+    catches up.
+    """
+
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        super().setUp()
+        routing = override_settings(DATABASE_REPLICAS=["replica"])
+        routing.enable()
+        self.addCleanup(routing.disable)
+        self.sync_replicas()
+
+    def sync_replicas(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("replica syncing is written for SQLite")
+        primary, replica = connections["default"], connections["replica"]
+        primary.ensure_connection()
+        replica.ensure_connection()
+        primary.connection.backup(replica.connection)
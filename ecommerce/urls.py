@@ -14,6 +14,8 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
+from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
 from django.contrib.auth import views as auth_views
@@ -48,3 +50,6 @@ urlpatterns = [
 
 
 ]
+
+# Uploaded media in development (no-op when DEBUG is off)
+urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
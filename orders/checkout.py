@@ -0,0 +1,154 @@
+# orders/checkout.py
+#
+# Set-based checkout shared by the logged-in and guest checkout views.
+
+from django.db import transaction
+from django.db.models import Case, F, PositiveIntegerField, Q, When
+
+from products import cache as product_cache
+from products import facets, inventory, page_cache
+from products.models import Product
+from .models import Order, OrderItem, Purchase, StockReservation
+from .rollups import record_order
+
+
+class InsufficientStock(Exception):
+    """
+    Raised when one or more lines cannot be covered by the current stock.
+
+    `shortages` is a list of (product, available) tuples.
+    """
+
+    def __init__(self, shortages):
+        self.shortages = shortages
+        names = ", ".join(product.name for product, _ in shortages)
+        super().__init__(f"Not enough stock for: {names}")
+
+
+class _StockGuardFailed(Exception):
+    pass
+
+
+def _merge_lines(lines):
+    """Collapse (product, quantity) lines so each product appears once."""
+    products = {}
+    quantities = {}
+    for product, quantity in lines:
+        products[product.id] = product
+        quantities[product.id] = quantities.get(product.id, 0) + quantity
+    return products, quantities
+
+
+def place_order(lines, holder=None, **order_fields):
+    """
+    Create an Order from (product, quantity) lines.
+
+    Stock for every line is decremented by one guarded UPDATE
+    (stock = stock - qty WHERE stock - held_by_others >= qty) and the
+    OrderItems are written with one bulk INSERT, so the number of queries
+    does not grow with the size of the cart. Products with sharded stock
+    (products/inventory.py) are instead taken from their shards, usually
+    in one query each, without touching the product row. Units held by
+    other carts' active reservations are not sold; `holder`'s own
+    reservations are consumed by the order. If any line is short the whole
+    order is rolled back and InsufficientStock is raised. The sale is added
+    to the daily sales rollups (orders/rollups.py) in the same transaction.
+    """
+    products, quantities = _merge_lines(lines)
+    if not quantities:
+        raise ValueError("Cannot place an order without any lines.")
+
+    total = sum(products[pid].price * qty for pid, qty in quantities.items())
+
+    sharded = {pid: qty for pid, qty in quantities.items() if products[pid].stock_shards}
+    plain = {pid: qty for pid, qty in quantities.items() if pid not in sharded}
+
+    try:
+        with transaction.atomic():
+            held = StockReservation.objects.held_quantity(exclude_holder=holder)
+            if plain:
+                guard = Q()
+                for pid, qty in plain.items():
+                    guard |= Q(id=pid, stock_shards=0, stock__gte=F("held") + qty)
+
+                updated = Product.objects.alias(held=held).filter(guard).update(
+                    stock=Case(
+                        *[When(id=pid, then=F("stock") - qty) for pid, qty in plain.items()],
+                        default=F("stock"),
+                        output_field=PositiveIntegerField(),
+                    )
+                )
+                if updated != len(plain):
+                    raise _StockGuardFailed
+            if sharded:
+                _take_sharded(sharded, products, holder)
+
+            order = Order.objects.create(total_price=total, **order_fields)
+
+            OrderItem.objects.bulk_create([
+                OrderItem(
+                    order=order,
+                    product=products[pid],
+                    product_name=products[pid].name,
+                    quantity=qty,
+                    price_at_purchase=products[pid].price,
+                )
+                for pid, qty in quantities.items()
+            ])
+
+            if order.user_id:
+                Purchase.objects.bulk_create(
+                    [
+                        Purchase(user_id=order.user_id, product_id=pid, first_purchased_at=order.created_at)
+                        for pid in quantities
+                    ],
+                    ignore_conflicts=True,
+                )
+
+            record_order(order, products, quantities)
+
+            if holder:
+                StockReservation.objects.filter(holder=holder).delete()
+
+            # The guard needs stock >= qty, so any line now at zero just
+            # sold out. (Sharded products check in inventory.take.)
+            facets.stock_sold_out(plain)
+
+            # Stock changed without a save(): drop the cached rows and pages ourselves.
+            transaction.on_commit(lambda: _stock_changed(list(quantities)))
+    except _StockGuardFailed:
+        raise InsufficientStock(_find_shortages(products, quantities, holder)) from None
+
+    return order
+
+
+def _stock_changed(product_ids):
+    product_cache.invalidate(product_ids)
+    page_cache.purge_products(product_ids)
+
+
+def _take_sharded(quantities, products, holder):
+    """
+    Take sharded products' lines from their shards. The shard UPDATEs
+    themselves check that units held by other carts leave enough, so the
+    product row is neither read for the check nor written.
+    """
+    held = StockReservation.objects.held_quantity(exclude_holder=holder, product="product_id")
+    for pid, qty in quantities.items():
+        if not inventory.take(pid, qty, products[pid].stock_shards, held):
+            raise _StockGuardFailed
+
+
+def _find_shortages(products, quantities, holder=None):
+    """Look up which lines failed the stock guard (only runs on failure)."""
+    held = StockReservation.objects.held_quantity(exclude_holder=holder)
+    available = dict(
+        Product.objects.filter(id__in=quantities)
+        .annotate(available=inventory.live_stock() - held)
+        .values_list("id", "available")
+    )
+    return [
+        (products[pid], max(available.get(pid, 0), 0))
+        for pid, qty in quantities.items()
+        if available.get(pid, 0) < qty
+    ]
@@ -0,0 +1,23 @@
+# orders/context_processors.py
+
+from django.utils.functional import SimpleLazyObject
+
+from .guest_cart import get_storage as get_guest_cart_storage
+from .models import Cart
+
+
+def cart(request):
+    """
+    `cart_item_count` for the nav badge. Logged-in buyers read the stored
+    Cart.item_count (cached on request.user once a view has touched
+    `user.cart`); guests sum their guest cart. Evaluated only if rendered.
+    """
+    def item_count():
+        if request.user.is_authenticated:
+            try:
+                return request.user.cart.item_count
+            except Cart.DoesNotExist:
+                return 0
+        return sum(get_guest_cart_storage().load(request).values())
+
+    return {"cart_item_count": SimpleLazyObject(item_count)}
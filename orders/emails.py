@@ -0,0 +1,150 @@
+# orders/emails.py
+#
+# Invoice email outbox. Checkout only writes an InvoiceEmail row; the
+# `send_invoice_emails` management command renders and delivers them in
+# batches over a single mail connection. Each run claims its batch first
+# (claim_due_invoices), so concurrent runs never send the same invoice.
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.db.models import Prefetch
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import InvoiceEmail, Order
+from .utils import with_items
+
+
+MAX_ATTEMPTS = getattr(settings, "INVOICE_EMAIL_MAX_ATTEMPTS", 5)
+BACKOFF_SECONDS = getattr(settings, "INVOICE_EMAIL_BACKOFF_SECONDS", 60)
+MAX_BACKOFF_SECONDS = getattr(settings, "INVOICE_EMAIL_MAX_BACKOFF_SECONDS", 3600)
+# How long a claimed batch is left to its worker before others may retry it
+CLAIM_SECONDS = getattr(settings, "INVOICE_EMAIL_CLAIM_SECONDS", 300)
+
+
+def queue_order_invoice_email(order):
+    """
+    Add the invoice for `order` to the outbox.
+
+    Call this inside the checkout transaction so the outbox row is committed
+    (or rolled back) together with the order.
+    """
+    to_email = order.billing_email or order.guest_email
+    if not to_email:
+        return None  # nothing to send to
+
+    return InvoiceEmail.objects.create(order=order, to_email=to_email)
+
+
+def build_invoice_message(invoice, connection=None):
+    """
+    Render the invoice. The order should come from orders.utils.with_items
+    (deliver_pending_invoices loads a whole batch that way), otherwise
+    rendering its items costs a query per line.
+    """
+    order = invoice.order
+    context = {"order": order}
+
+    message = EmailMultiAlternatives(
+        subject=f"Your Order #{order.id} Invoice",
+        body=render_to_string("orders/email_invoice.txt", context),
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[invoice.to_email],
+        connection=connection,
+    )
+    message.attach_alternative(
+        render_to_string("orders/email_invoice.html", context), "text/html"
+    )
+    return message
+
+
+def backoff_delay(attempts):
+    """Exponential backoff: BACKOFF_SECONDS, 2x, 4x, ... capped."""
+    return timedelta(
+        seconds=min(BACKOFF_SECONDS * 2 ** (attempts - 1), MAX_BACKOFF_SECONDS)
+    )
+
+
+def claim_due_invoices(batch_size):
+    """
+    Claim up to `batch_size` due invoices by moving their next attempt to
+    the end of the claim period, and return them with their orders loaded.
+    Rows locked or claimed by another run are skipped; a claim that is
+    never settled (the worker died) runs out and the invoices are retried.
+    """
+    now = timezone.now()
+    claimed_until = now + timedelta(seconds=CLAIM_SECONDS)
+    due = InvoiceEmail.objects.filter(status="PENDING", next_attempt_at__lte=now)
+    with transaction.atomic():
+        ids = list(
+            due.select_for_update(skip_locked=True)
+            .order_by("next_attempt_at", "id")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        # Still due: a backend without row locks may have let another run claim some
+        if not ids:
+            return []
+        due.filter(id__in=ids).update(next_attempt_at=claimed_until)
+    return list(
+        InvoiceEmail.objects
+        .filter(id__in=ids, status="PENDING", next_attempt_at=claimed_until)
+        .prefetch_related(Prefetch("order", queryset=with_items(Order.objects.all())))
+        .order_by("id")
+    )
+
+
+def deliver_pending_invoices(batch_size=100, max_attempts=MAX_ATTEMPTS):
+    """
+    Send one batch of due invoices over one reused connection.
+
+    Returns (sent, failed) counts for the batch. Failed messages are
+    rescheduled with exponential backoff until `max_attempts` is reached,
+    after which they are marked FAILED.
+    """
+    batch = claim_due_invoices(batch_size)
+    if not batch:
+        return 0, 0
+
+    sent = []
+    failed = []
+    connection = get_connection()
+    try:
+        connection.open()
+        for invoice in batch:
+            try:
+                connection.send_messages([build_invoice_message(invoice, connection)])
+            except Exception as exc:
+                invoice.last_error = f"{type(exc).__name__}: {exc}"
+                failed.append(invoice)
+            else:
+                sent.append(invoice)
+    except Exception as exc:
+        # Could not even open the connection: the whole batch is retried.
+        for invoice in batch:
+            if invoice not in sent:
+                invoice.last_error = f"{type(exc).__name__}: {exc}"
+                if invoice not in failed:
+                    failed.append(invoice)
+    finally:
+        connection.close()
+
+    now = timezone.now()
+    for invoice in sent:
+        invoice.status = "SENT"
+        invoice.attempts += 1
+        invoice.sent_at = now
+    for invoice in failed:
+        invoice.attempts += 1
+        if invoice.attempts >= max_attempts:
+            invoice.status = "FAILED"
+        else:
+            invoice.next_attempt_at = now + backoff_delay(invoice.attempts)
+
+    InvoiceEmail.objects.bulk_update(
+        sent + failed,
+        ["status", "attempts", "sent_at", "next_attempt_at", "last_error"],
+    )
+    return len(sent), len(failed)
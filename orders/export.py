@@ -0,0 +1,127 @@
+# orders/export.py
+#
+# Order export for finance: one CSV row per order line, with the order's
+# billing/guest fields and the product joined in. Rows are read in chunks
+# as plain tuples and written one at a time, so memory stays flat however
+# many orders are exported: the view streams them out of an async iterator
+# (acsv_lines), which the ASGI server sends as it goes, and the management
+# command writes them from a sync one (csv_lines).
+#
+# A seller's export shows their own share of each order: order_total is the
+# sum of the seller's lines in the order, not what the buyer paid overall.
+
+import csv
+from datetime import datetime, time, timedelta
+
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum
+from django.utils import timezone
+
+from .models import OrderItem
+
+
+EXPORT_CHUNK_SIZE = 2000
+
+COLUMNS = [
+    ("order_id", "order_id"),
+    ("order_created_at", "order__created_at"),
+    ("order_status", "order__status"),
+    ("order_total", "order__total_price"),
+    ("user_id", "order__user_id"),
+    ("billing_email", "order__billing_email"),
+    ("guest_name", "order__guest_name"),
+    ("guest_email", "order__guest_email"),
+    ("guest_address", "order__guest_address"),
+    ("guest_city", "order__guest_city"),
+    ("guest_state", "order__guest_state"),
+    ("guest_zip", "order__guest_zip"),
+    ("guest_phone", "order__guest_phone"),
+    ("item_id", "id"),
+    ("product_id", "product_id"),
+    ("sku", "product__sku"),
+    ("product_name", "product_name"),
+    ("seller_id", "product__seller_id"),
+    ("quantity", "quantity"),
+    ("price_at_purchase", "price_at_purchase"),
+]
+HEADER = [name for name, _ in COLUMNS] + ["line_total"]
+
+# Cells starting with these are treated as formulas by spreadsheet apps.
+_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def _day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def order_lines(seller=None, start=None, end=None, status=None):
+    """
+    OrderItems matching the filters, as (named) value tuples in COLUMNS
+    order, ordered by order then line. `start`/`end` are dates, both inclusive.
+    """
+    items = OrderItem.objects.all()
+    lookups = [lookup for _, lookup in COLUMNS]
+    if seller is not None:
+        items = items.filter(product__seller=seller).annotate(seller_total=_seller_total(seller))
+        lookups[lookups.index("order__total_price")] = "seller_total"
+    if start is not None:
+        items = items.filter(order__created_at__gte=_day_start(start))
+    if end is not None:
+        items = items.filter(order__created_at__lt=_day_start(end + timedelta(days=1)))
+    if status:
+        items = items.filter(order__status=status)
+    # named=True: aiterator() over a plain values_list() would run the
+    # query on the event loop rather than in a thread.
+    return items.order_by("order_id", "id").values_list(*lookups, named=True)
+
+
+TOTAL_FIELD = DecimalField(max_digits=12, decimal_places=2)
+
+
+def _seller_total(seller):
+    """Subquery: the total of `seller`'s lines in the row's order."""
+    lines = (
+        OrderItem.objects.filter(order=OuterRef("order_id"), product__seller=seller)
+        .order_by()
+        .values("order")
+        .annotate(total=Sum(F("price_at_purchase") * F("quantity"), output_field=TOTAL_FIELD))
+        .values("total")
+    )
+    return Subquery(lines, output_field=TOTAL_FIELD)
+
+
+def _cell(value):
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, str) and value.startswith(_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+class _Echo:
+    """File-like object whose write() returns the line instead of storing it."""
+
+    def write(self, value):
+        return value
+
+
+def _line(writer, row):
+    quantity, price = row[-2:]
+    return writer.writerow([_cell(value) for value in row] + [price * quantity])
+
+
+def csv_lines(rows, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield the CSV header and then one line per row, with its line total."""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(HEADER)
+    for row in rows.iterator(chunk_size=chunk_size):
+        yield _line(writer, row)
+
+
+async def acsv_lines(rows, chunk_size=EXPORT_CHUNK_SIZE):
+    """Async csv_lines, for StreamingHttpResponse under ASGI."""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(HEADER)
+    async for row in rows.aiterator(chunk_size=chunk_size):
+        yield _line(writer, row)
@@ -2,6 +2,8 @@
 
 from django import forms
 
+from .models import Order
+
 class GuestCheckoutForm(forms.Form):
     full_name = forms.CharField(max_length=255, label="Full name")
     email = forms.EmailField(label="Email")
@@ -9,4 +11,24 @@ class GuestCheckoutForm(forms.Form):
     city = forms.CharField(max_length=100, label="City")
     state = forms.CharField(max_length=100, label="State")
     zip_code = forms.CharField(max_length=20, label="ZIP / Postal code")
-    phone = forms.CharField(max_length=20, required=False, label="Phone (optional)")
\ No newline at end of file
+    phone = forms.CharField(max_length=20, required=False, label="Phone (optional)")
+
+class SalesRangeForm(forms.Form):
+    """Window and ranking for the seller sales endpoints."""
+    days = forms.IntegerField(min_value=1, max_value=366, required=False)
+    limit = forms.IntegerField(min_value=1, max_value=50, required=False)
+    by = forms.ChoiceField(choices=[("revenue", "Revenue"), ("units", "Units")], required=False)
+
+class OrderExportForm(forms.Form):
+    """Filters for the order CSV export; `seller` is only honoured for staff."""
+    start = forms.DateField(required=False)
+    end = forms.DateField(required=False)
+    status = forms.ChoiceField(choices=[("", "Any")] + Order.STATUS_CHOICES, required=False)
+    seller = forms.IntegerField(min_value=1, required=False)
+
+    def clean(self):
+        cleaned = super().clean()
+        start, end = cleaned.get("start"), cleaned.get("end")
+        if start and end and start > end:
+            raise forms.ValidationError("The start date must not be after the end date.")
+        return cleaned
@@ -0,0 +1,181 @@
+# orders/guest_cart.py
+#
+# Where a guest's cart lives. The views read and write it through
+# get_storage() (GUEST_CART_STORAGE):
+#
+#   SessionCartStorage      - request.session["cart"]; every cart change is
+#                             a session save, i.e. a django_session write.
+#   SignedCookieCartStorage - a signed cookie of packed "id-qty" pairs, so a
+#                             guest's cart edits touch no table at all. A
+#                             cart packing to more than
+#                             GUEST_CART_COOKIE_MAX_BYTES falls back to the
+#                             session until it shrinks again.
+#
+# Both also keep the guest's stock reservation holder token
+# (orders/reservations.py). GuestCartMiddleware writes the cookie.
+
+import uuid
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.http import base36_to_int, int_to_base36
+from django.utils.module_loading import import_string
+
+
+GUEST_CART_COOKIE_NAME = getattr(settings, "GUEST_CART_COOKIE_NAME", "guest_cart")
+GUEST_CART_COOKIE_MAX_BYTES = getattr(settings, "GUEST_CART_COOKIE_MAX_BYTES", 2048)
+COOKIE_SALT = "orders.guest_cart"
+
+
+class SessionCartStorage:
+    """
+    The cart as {"<product id>": quantity} in request.session["cart"], and
+    the holder token in request.session["cart_holder"].
+    """
+
+    def load(self, request):
+        return dict(request.session.get("cart", {}))
+
+    def save(self, request, cart):
+        if cart or request.session.get("cart"):
+            request.session["cart"] = dict(cart)
+
+    def holder(self, request, create=True):
+        """The guest's holder token; None if they have none and not `create`."""
+        if "cart_holder" not in request.session and create:
+            request.session["cart_holder"] = uuid.uuid4().hex
+        return request.session.get("cart_holder")
+
+    def clear(self, request):
+        """Forget the cart and the holder token (after login)."""
+        for key in ("cart", "cart_holder"):
+            request.session.pop(key, None)
+
+    def process_response(self, request, response):
+        return response
+
+
+def pack(holder, cart):
+    """'<holder>~<id>-<qty>.<id>-<qty>...' with ids and quantities in base 36."""
+    lines = ".".join(
+        f"{int_to_base36(int(pid))}-{int_to_base36(qty)}" for pid, qty in cart.items() if qty > 0
+    )
+    return f"{holder or ''}~{lines}"
+
+
+def unpack(value):
+    """(holder or None, cart) from a pack() string; ValueError if malformed."""
+    holder, _, lines = value.partition("~")
+    cart = {}
+    for line in filter(None, lines.split(".")):
+        pid, qty = line.split("-")
+        cart[str(base36_to_int(pid))] = base36_to_int(qty)
+    return holder or None, cart
+
+
+class _CookieCart:
+    def __init__(self, holder, lines, dirty=False):
+        self.holder = holder
+        self.lines = lines
+        self.dirty = dirty
+
+
+class SignedCookieCartStorage(SessionCartStorage):
+    """
+    The cart and holder token packed into one signed cookie. Without a valid
+    cookie the session is read instead, which covers overflowing carts and
+    carts saved before this storage was used.
+    """
+
+    def _cart(self, request):
+        if not hasattr(request, "_guest_cart"):
+            value = request.get_signed_cookie(GUEST_CART_COOKIE_NAME, default=None, salt=COOKIE_SALT)
+            try:
+                holder, lines = unpack(value) if value is not None else (None, None)
+            except ValueError:
+                holder, lines = None, None
+            if lines is None:
+                holder = super().holder(request, create=False)
+                lines = super().load(request)
+            request._guest_cart = _CookieCart(holder, lines)
+        return request._guest_cart
+
+    def load(self, request):
+        return dict(self._cart(request).lines)
+
+    def save(self, request, cart):
+        state = self._cart(request)
+        state.lines = {pid: qty for pid, qty in cart.items() if qty > 0}
+        state.dirty = True
+
+    def holder(self, request, create=True):
+        state = self._cart(request)
+        if state.holder is None and create:
+            state.holder = uuid.uuid4().hex
+            state.dirty = True
+        return state.holder
+
+    def clear(self, request):
+        state = self._cart(request)
+        state.holder, state.lines, state.dirty = None, {}, True
+        super().clear(request)
+
+    def process_response(self, request, response):
+        state = getattr(request, "_guest_cart", None)
+        if state is None or not state.dirty:
+            return response
+
+        if state.holder is None and not state.lines:
+            response.delete_cookie(GUEST_CART_COOKIE_NAME)
+            return response
+
+        packed = pack(state.holder, state.lines)
+        if len(packed) > GUEST_CART_COOKIE_MAX_BYTES:
+            super().save(request, state.lines)
+            request.session["cart_holder"] = state.holder
+            response.delete_cookie(GUEST_CART_COOKIE_NAME)
+            return response
+
+        # Back under the cap: drop any copy left in the session.
+        if "cart" in request.session or "cart_holder" in request.session:
+            super().clear(request)
+        response.set_signed_cookie(
+            GUEST_CART_COOKIE_NAME, packed, salt=COOKIE_SALT,
+            max_age=settings.SESSION_COOKIE_AGE,
+            secure=settings.SESSION_COOKIE_SECURE,
+            httponly=True,
+            samesite="Lax",
+        )
+        return response
+
+
+_storage = None
+
+
+def get_storage():
+    global _storage
+    if _storage is None:
+        path = getattr(settings, "GUEST_CART_STORAGE", "orders.guest_cart.SignedCookieCartStorage")
+        _storage = import_string(path)()
+    return _storage
+
+
+class GuestCartMiddleware:
+    """Let the guest cart storage write its cookie. Goes after SessionMiddleware."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return get_storage().process_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        return get_storage().process_response(request, response)
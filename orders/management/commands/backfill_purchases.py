@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+
+from orders.models import OrderItem, Purchase
+
+
+class Command(BaseCommand):
+    help = "Build the purchase ledger from existing OrderItems, in id batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        last_id = 0
+        written = 0
+
+        while True:
+            rows = list(
+                OrderItem.objects.filter(
+                    id__gt=last_id,
+                    order__user__isnull=False,
+                    product__isnull=False,
+                )
+                .order_by("id")
+                .values_list("id", "order__user_id", "product_id", "order__created_at")
+                [:options["batch_size"]]
+            )
+            if not rows:
+                break
+            last_id = rows[-1][0]
+
+            # Items are walked in id (and so purchase) order: the first row
+            # written for a (user, product) pair is its earliest purchase,
+            # and ignore_conflicts keeps it.
+            first_seen = {}
+            for _, user_id, product_id, created_at in rows:
+                first_seen.setdefault((user_id, product_id), created_at)
+
+            Purchase.objects.bulk_create(
+                [
+                    Purchase(user_id=user_id, product_id=product_id, first_purchased_at=created_at)
+                    for (user_id, product_id), created_at in first_seen.items()
+                ],
+                ignore_conflicts=True,
+            )
+            written += len(first_seen)
+
+        self.stdout.write(self.style.SUCCESS(f"Processed {written} purchase rows"))
@@ -0,0 +1,43 @@
+from datetime import date
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from orders.export import EXPORT_CHUNK_SIZE, csv_lines, order_lines
+from orders.models import Order
+
+
+class Command(BaseCommand):
+    help = "Write order lines as CSV, streaming rows so memory stays flat for any export size."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seller", help="Username of the seller whose lines to export (default: all).")
+        parser.add_argument("--start", type=date.fromisoformat, help="First order day, YYYY-MM-DD.")
+        parser.add_argument("--end", type=date.fromisoformat, help="Last order day, YYYY-MM-DD.")
+        parser.add_argument("--status", choices=[value for value, _ in Order.STATUS_CHOICES])
+        parser.add_argument("--output", help="File to write; defaults to stdout.")
+        parser.add_argument("--chunk-size", type=int, default=EXPORT_CHUNK_SIZE,
+                            help="Rows fetched from the database at a time.")
+
+    def handle(self, *args, **options):
+        seller = None
+        if options["seller"]:
+            try:
+                seller = get_user_model().objects.get(username=options["seller"], is_seller=True)
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"No seller named {options['seller']!r}")
+
+        rows = order_lines(seller=seller, start=options["start"], end=options["end"], status=options["status"])
+        lines = csv_lines(rows, chunk_size=options["chunk_size"])
+
+        if not options["output"]:
+            for line in lines:
+                self.stdout.write(line, ending="")
+            return
+
+        count = -1  # header
+        with open(options["output"], "w", encoding="utf-8", newline="") as out:
+            for line in lines:
+                out.write(line)
+                count += 1
+        self.stdout.write(self.style.SUCCESS(f"Wrote {count} order lines to {options['output']}"))
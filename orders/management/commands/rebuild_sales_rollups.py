@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from orders.models import Order, OrderItem, ProductDailySales, SellerDailySales
+from orders.rollups import add_sales
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily seller and product sales rollups from OrderItem, in order-id batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=2000, help="Orders per batch.")
+
+    def handle(self, *args, **options):
+        # Orders placed from here on add themselves to the fresh rollups
+        # (orders/rollups.py), so the backfill stops at the last order
+        # that existed when they were cleared.
+        with transaction.atomic():
+            ProductDailySales.objects.all().delete()
+            SellerDailySales.objects.all().delete()
+            max_id = Order.objects.aggregate(max_id=Max("id"))["max_id"] or 0
+
+        last_id = 0
+        orders = 0
+
+        while True:
+            order_ids = list(
+                Order.objects.filter(id__gt=last_id, id__lte=max_id)
+                .order_by("id")
+                .values_list("id", flat=True)[:options["batch_size"]]
+            )
+            if not order_ids:
+                break
+            last_id = order_ids[-1]
+
+            # A batch holds whole orders, so per-day order counts add up
+            # correctly across batches.
+            items = (
+                OrderItem.objects.filter(order_id__gte=order_ids[0], order_id__lte=last_id, product__isnull=False)
+                .values_list(
+                    "order_id", "order__created_at", "product_id", "product__seller_id",
+                    "quantity", "price_at_purchase",
+                )
+            )
+            with transaction.atomic():
+                add_sales(
+                    (order_id, timezone.localdate(created_at), product_id, seller_id, quantity, price * quantity)
+                    for order_id, created_at, product_id, seller_id, quantity, price in items
+                )
+            orders += len(order_ids)
+
+        self.stdout.write(self.style.SUCCESS(f"Rolled up {orders} orders"))
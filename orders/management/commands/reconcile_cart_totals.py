@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from orders.models import Cart
+
+
+class Command(BaseCommand):
+    help = "Repair carts whose stored item_count/subtotal drifted from their lines."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report how many carts have drifted.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        last_id = 0
+        repaired = 0
+
+        while True:
+            ids = list(
+                Cart.objects.filter(id__gt=last_id)
+                .order_by("id")
+                .values_list("id", flat=True)[:batch_size]
+            )
+            if not ids:
+                break
+            last_id = ids[-1]
+
+            drifted = Cart.objects.filter(id__in=ids).drifted()
+            if options["dry_run"]:
+                repaired += drifted.count()
+            else:
+                repaired += drifted.refresh_totals()
+
+        verb = "Found" if options["dry_run"] else "Repaired"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {repaired} drifted carts"))
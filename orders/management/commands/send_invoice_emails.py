@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from orders.emails import MAX_ATTEMPTS, deliver_pending_invoices
+
+
+class Command(BaseCommand):
+    help = "Deliver queued order invoice emails in batches over one mail connection."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=100)
+        parser.add_argument("--max-attempts", type=int, default=MAX_ATTEMPTS)
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep polling the outbox instead of exiting once it is drained.",
+        )
+        parser.add_argument(
+            "--interval",
+            type=float,
+            default=5.0,
+            help="Seconds to sleep between polls when --loop is set.",
+        )
+
+    def handle(self, *args, **options):
+        total_sent = total_failed = 0
+
+        while True:
+            sent, failed = deliver_pending_invoices(
+                batch_size=options["batch_size"],
+                max_attempts=options["max_attempts"],
+            )
+            total_sent += sent
+            total_failed += failed
+
+            if sent or failed:
+                self.stdout.write(f"Batch: {sent} sent, {failed} failed")
+            if sent + failed == options["batch_size"]:
+                continue  # a full batch: more may be waiting
+
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Done: {total_sent} sent, {total_failed} failed"
+        ))
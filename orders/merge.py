@@ -0,0 +1,82 @@
+# orders/merge.py
+#
+# Merge a guest's cart into their DB cart when they log in, with a
+# constant number of queries for the cart itself however many lines the
+# guest cart has. Stock holds are then re-set per merged product.
+
+from django.conf import settings
+from django.db import transaction
+
+from products import cache as product_cache
+from .checkout import InsufficientStock
+from .guest_cart import get_storage as get_guest_cart_storage
+from .models import Cart, CartItem
+from .reservations import release, reserve
+
+
+# How to combine a product that is in both carts:
+#   "sum"   - add the quantities
+#   "max"   - keep the larger quantity
+#   "guest" - the session cart wins
+#   "user"  - the saved cart wins
+MERGE_STRATEGIES = {
+    "sum": lambda guest, saved: guest + saved,
+    "max": max,
+    "guest": lambda guest, saved: guest,
+    "user": lambda guest, saved: saved,
+}
+
+CART_MERGE_STRATEGY = getattr(settings, "CART_MERGE_STRATEGY", "sum")
+
+
+def merge_session_cart(request, user, strategy=None):
+    """
+    Upsert every line of the guest cart into `user`'s Cart with one bulk
+    INSERT ... ON CONFLICT, hold the merged quantities for the user, then
+    empty the guest cart. Returns the number of lines merged.
+    """
+    combine = MERGE_STRATEGIES[strategy or CART_MERGE_STRATEGY]
+    storage = get_guest_cart_storage()
+    session_cart = storage.load(request)
+    products = product_cache.get_many(session_cart.keys())
+    guest_lines = {
+        int(pid): qty for pid, qty in session_cart.items()
+        if int(pid) in products and qty > 0
+    }
+    if not guest_lines:
+        return 0
+
+    with transaction.atomic():
+        cart, _ = Cart.objects.get_or_create(user=user)
+        saved = dict(
+            cart.items.filter(product_id__in=guest_lines).values_list("product_id", "quantity")
+        )
+        merged = {
+            pid: combine(qty, saved[pid]) if pid in saved else qty
+            for pid, qty in guest_lines.items()
+        }
+        CartItem.objects.bulk_create(
+            [CartItem(cart=cart, product_id=pid, quantity=qty) for pid, qty in merged.items()],
+            update_conflicts=True,
+            unique_fields=["cart", "product"],
+            update_fields=["quantity"],
+        )
+        # bulk_create skips CartItem.save(), so recompute the stored totals.
+        Cart.objects.filter(pk=cart.pk).refresh_totals()
+
+        # The guest's holds no longer match any cart: drop them first so they
+        # don't count against the user, then hold each merged quantity, or
+        # as much of it as is left (checkout reports the shortfall).
+        guest_holder = storage.holder(request, create=False)
+        if guest_holder:
+            release(f"session:{guest_holder}")
+        user_holder = f"user:{user.pk}"
+        for pid, qty in merged.items():
+            try:
+                reserve(products[pid], user_holder, qty)
+            except InsufficientStock as exc:
+                (_, available), = exc.shortages
+                reserve(products[pid], user_holder, available)
+
+    storage.clear(request)
+    return len(guest_lines)
@@ -0,0 +1,30 @@
+# Generated by Django 6.0 on 2026-10-17 17:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0002_invoiceemail'),
+        ('products', '0002_product_store'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('holder', models.CharField(max_length=64)),
+                ('quantity', models.PositiveIntegerField()),
+                ('expires_at', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='products.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['product', 'expires_at', 'quantity'], name='orders_stoc_product_01f35a_idx'), models.Index(fields=['expires_at'], name='orders_stoc_expires_f55a9e_idx'), models.Index(fields=['holder'], name='orders_stoc_holder_234d31_idx')],
+                'unique_together': {('product', 'holder')},
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 6.0 on 2026-10-17 17:15
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def backfill_cart_totals(apps, schema_editor):
+    Cart = apps.get_model('orders', 'Cart')
+    CartItem = apps.get_model('orders', 'CartItem')
+
+    lines = CartItem.objects.filter(cart=OuterRef('pk')).order_by().values('cart')
+    count = lines.annotate(n=Sum('quantity')).values('n')
+    subtotal = lines.annotate(
+        s=Sum(F('quantity') * F('product__price'), output_field=models.DecimalField())
+    ).values('s')
+    Cart.objects.update(
+        item_count=Coalesce(Subquery(count), 0),
+        subtotal=Coalesce(Subquery(subtotal), Decimal('0'), output_field=models.DecimalField()),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_stockreservation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='subtotal',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.RunPython(backfill_cart_totals, migrations.RunPython.noop),
+    ]
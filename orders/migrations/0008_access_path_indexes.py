@@ -0,0 +1,18 @@
+# Generated by Django 6.0 on 2026-10-17 18:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0007_order_history_index'),
+        ('products', '0007_stock_shards'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='orderitem',
+            index=models.Index(fields=['product', 'order'], name='orders_orde_product_d9c1ab_idx'),
+        ),
+    ]
@@ -1,9 +1,53 @@
+from decimal import Decimal
+
 from django.db import models
+from django.db.models import F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.conf import settings
+from django.utils import timezone
 from products.models import Product
 from django.contrib.auth.models import User
 
 
+class CartQuerySet(models.QuerySet):
+    def _line_totals(self):
+        lines = CartItem.objects.filter(cart=OuterRef("pk")).order_by().values("cart")
+        count = lines.annotate(n=Sum("quantity")).values("n")
+        subtotal = lines.annotate(
+            s=Sum(F("quantity") * F("product__price"), output_field=models.DecimalField())
+        ).values("s")
+        return (
+            Coalesce(Subquery(count), 0),
+            Coalesce(Subquery(subtotal), Decimal("0"), output_field=models.DecimalField()),
+        )
+
+    def drifted(self):
+        """Carts whose stored item_count/subtotal no longer match their lines."""
+        count, subtotal = self._line_totals()
+        return self.alias(actual_count=count, actual_subtotal=subtotal).filter(
+            ~Q(item_count=F("actual_count")) | ~Q(subtotal=F("actual_subtotal"))
+        )
+
+    def apply_delta(self, quantity, product_id):
+        """
+        Add `quantity` units of a product to the stored totals in one UPDATE.
+        The price is read in the statement itself so a stale in-memory
+        product can never skew the subtotal.
+        """
+        if not quantity:
+            return 0
+        price = Product.objects.filter(pk=product_id).values("price")
+        return self.update(
+            item_count=F("item_count") + quantity,
+            subtotal=F("subtotal") + Subquery(price) * quantity,
+        )
+
+    def refresh_totals(self):
+        """Recompute item_count/subtotal from the cart lines with one UPDATE."""
+        count, subtotal = self._line_totals()
+        return self.update(item_count=count, subtotal=subtotal)
+
+
 class Cart(models.Model):
     user = models.OneToOneField(
         settings.AUTH_USER_MODEL,
@@ -12,12 +56,25 @@ class Cart(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Maintained by CartItem.save()/delete() and the product price signal
+    # (see orders/signals.py); repaired by `manage.py reconcile_cart_totals`.
+    item_count = models.PositiveIntegerField(default=0)
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    objects = CartQuerySet.as_manager()
+
     def __str__(self):
         return f"Cart ({self.user.username})"
 
     @property
     def total_price(self):
-        return sum(item.total for item in self.items.all())
+        return self.subtotal
+
+    def clear(self):
+        """Delete every line and zero the totals (two queries)."""
+        self.items.all().delete()
+        Cart.objects.filter(pk=self.pk).update(item_count=0, subtotal=0)
+        self.item_count, self.subtotal = 0, Decimal("0")
 
 
 class CartItem(models.Model):
@@ -35,6 +92,24 @@ class CartItem(models.Model):
     def __str__(self):
         return f"{self.quantity} × {self.product.name}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._saved_quantity = instance.__dict__.get("quantity", 0)
+        return instance
+
+    def save(self, *args, **kwargs):
+        previous = 0 if self._state.adding else getattr(self, "_saved_quantity", 0)
+        super().save(*args, **kwargs)
+        Cart.objects.filter(pk=self.cart_id).apply_delta(self.quantity - previous, self.product_id)
+        self._saved_quantity = self.quantity
+
+    def delete(self, *args, **kwargs):
+        quantity = getattr(self, "_saved_quantity", self.quantity)
+        result = super().delete(*args, **kwargs)
+        Cart.objects.filter(pk=self.cart_id).apply_delta(-quantity, self.product_id)
+        return result
+
     @property
     def total(self):
         return self.product.price * self.quantity
@@ -71,6 +146,12 @@ class Order(models.Model):
     guest_zip = models.CharField(max_length=20, null=True, blank=True)
     guest_phone = models.CharField(max_length=20, null=True, blank=True)
 
+    class Meta:
+        indexes = [
+            # Buyer order history, newest first (keyset-paginated)
+            models.Index(fields=['user', 'created_at', 'id']),
+        ]
+
     def __str__(self):
         return f"Order #{self.id}"
 
@@ -86,9 +167,20 @@ class OrderItem(models.Model):
     quantity = models.PositiveIntegerField(default=1)
     price_at_purchase = models.DecimalField(max_digits=10, decimal_places=2)
 
+    class Meta:
+        indexes = [
+            # "Has this buyer bought this product": product first, then the
+            # buyer's orders by id, without touching the table rows
+            models.Index(fields=['product', 'order']),
+        ]
+
     def __str__(self):
         return f"{self.quantity} x {self.product_name}"
 
+    @property
+    def subtotal(self):
+        return self.price_at_purchase * self.quantity
+
 
 class ShippingAddress(models.Model):
     user = models.ForeignKey(
@@ -109,4 +201,177 @@ class ShippingAddress(models.Model):
     country = models.CharField(max_length=100, default='USA')
 
     def __str__(self):
-        return f"{self.address_line1}, {self.city}"
\ No newline at end of file
+        return f"{self.address_line1}, {self.city}"
+
+
+class InvoiceEmail(models.Model):
+    """
+    Outbox row for an order invoice. Written in the same transaction as the
+    order and delivered later by `manage.py send_invoice_emails`.
+    """
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('SENT', 'Sent'),
+        ('FAILED', 'Failed'),
+    ]
+
+    order = models.ForeignKey(
+        Order,
+        on_delete=models.CASCADE,
+        related_name='invoice_emails'
+    )
+    to_email = models.EmailField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at']),
+        ]
+
+    def __str__(self):
+        return f"Invoice for Order #{self.order_id} to {self.to_email} ({self.status})"
+
+
+class StockReservationQuerySet(models.QuerySet):
+    def active(self):
+        return self.filter(expires_at__gt=timezone.now())
+
+    def expired(self):
+        return self.filter(expires_at__lte=timezone.now())
+
+    def held_quantity(self, exclude_holder=None, product="id"):
+        """
+        Correlated subquery: units of OuterRef(product) (a Product id,
+        "product_id" from a row pointing at one) held by active
+        reservations, optionally ignoring one holder's own holds.
+        """
+        holds = self.active().filter(product=OuterRef(product))
+        if exclude_holder:
+            holds = holds.exclude(holder=exclude_holder)
+        total = (
+            holds.order_by()
+            .values("product")
+            .annotate(total=Sum("quantity"))
+            .values("total")
+        )
+        return Coalesce(
+            Subquery(total, output_field=models.IntegerField()), 0
+        )
+
+
+class StockReservation(models.Model):
+    """
+    A time-bounded hold on product stock taken when an item goes into a cart.
+
+    `holder` identifies the cart: "user:<id>" for logged-in buyers and
+    "session:<key>" for guests. Checkout turns the holder's reservations into
+    a sale; expired rows are removed by `manage.py release_expired_reservations`.
+    """
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='reservations'
+    )
+    holder = models.CharField(max_length=64)
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = StockReservationQuerySet.as_manager()
+
+    class Meta:
+        unique_together = ('product', 'holder')
+        indexes = [
+            models.Index(fields=['product', 'expires_at', 'quantity']),
+            models.Index(fields=['expires_at']),
+            models.Index(fields=['holder']),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} × {self.product_id} held by {self.holder}"
+
+
+class Purchase(models.Model):
+    """
+    Ledger of products each user has bought, one row per (user, product).
+    Written by place_order; answers "did this user buy this?" with a single
+    unique-index lookup instead of joining OrderItem to Order.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='purchases'
+    )
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='purchases'
+    )
+    first_purchased_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('user', 'product')
+
+    def __str__(self):
+        return f"{self.user_id} bought {self.product_id} on {self.first_purchased_at:%Y-%m-%d}"
+
+    @classmethod
+    def has_purchased(cls, user, product_id):
+        if not user.is_authenticated:
+            return False
+        return cls.objects.filter(user=user, product_id=product_id).exists()
+
+
+class SellerDailySales(models.Model):
+    """
+    Per-seller sales for one day: units sold, revenue (at purchase price)
+    and number of orders. Incremented by place_order (orders/rollups.py) and
+    rebuilt by `manage.py rebuild_sales_rollups`.
+    """
+    seller = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='daily_sales'
+    )
+    day = models.DateField()
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal("0.00"))
+    orders = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('seller', 'day')
+
+    def __str__(self):
+        return f"{self.seller_id} on {self.day}: {self.units} units, ${self.revenue}"
+
+
+class ProductDailySales(models.Model):
+    """Per-product sales for one day; same measures as SellerDailySales."""
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.CASCADE,
+        related_name='daily_sales'
+    )
+    seller = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='product_daily_sales'
+    )
+    day = models.DateField()
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal("0.00"))
+    orders = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('product', 'day')
+        indexes = [
+            models.Index(fields=['seller', 'day']),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} on {self.day}: {self.units} units, ${self.revenue}"
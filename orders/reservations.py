@@ -0,0 +1,151 @@
+# orders/reservations.py
+#
+# Time-bounded stock holds taken when items are added to a cart. Available
+# stock is `stock - active holds`; checkout turns the buyer's own holds into
+# a sale (see place_order) and expired holds are swept in bulk.
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from products import page_cache
+from products.inventory import live_stock
+from products.models import Product
+from .checkout import InsufficientStock
+from .guest_cart import get_storage as get_guest_cart_storage
+from .models import StockReservation
+
+
+RESERVATION_TTL_SECONDS = getattr(settings, "STOCK_RESERVATION_TTL_SECONDS", 15 * 60)
+
+# Whether guest carts hold stock too. Off, a guest's cart edits only check
+# the stock, so they write nothing to the database; the stock is then taken
+# at checkout, against what other carts hold.
+GUEST_HOLDS = getattr(settings, "STOCK_RESERVATION_GUEST_HOLDS", False)
+
+
+def holder_for_request(request):
+    """
+    Reservation holder key for the cart behind `request`. Guests get a
+    random token kept with their cart (orders/guest_cart.py) rather than
+    the session key, which changes at login; see orders/merge.py.
+    """
+    if request.user.is_authenticated:
+        return f"user:{request.user.pk}"
+    return f"session:{get_guest_cart_storage().holder(request)}"
+
+
+def with_available_stock(queryset, holder=None):
+    """
+    Annotate `available` (stock minus other carts' active holds) onto a
+    Product queryset with one correlated aggregate over the indexed
+    (product, expires_at, quantity) reservation columns. Sharded stock is
+    read as the sum of its shards.
+    """
+    return queryset.annotate(
+        available=live_stock() - StockReservation.objects.held_quantity(exclude_holder=holder)
+    )
+
+
+def available_stock(product_ids, holder=None):
+    """{product_id: available} for the given ids, in one query."""
+    return dict(
+        with_available_stock(Product.objects.filter(id__in=product_ids), holder)
+        .order_by()
+        .values_list("id", "available")
+    )
+
+
+def _holds_changed(product_ids):
+    # Only the product pages count holds: their validators read the stock
+    # each time, so just drop their cached copies. The list shows stock
+    # without holds and keeps its version.
+    page_cache.purge_product_pages(product_ids)
+
+
+def reserve(product, holder, quantity, ttl=None):
+    """
+    Set `holder`'s hold on `product` to exactly `quantity` units.
+
+    Raises InsufficientStock if the stock not held by other carts cannot
+    cover the quantity. A quantity of zero or less releases the hold.
+    """
+    if quantity <= 0:
+        release(holder, [product.id])
+        return
+
+    ttl = RESERVATION_TTL_SECONDS if ttl is None else ttl
+    expires_at = timezone.now() + timedelta(seconds=ttl)
+
+    with transaction.atomic():
+        # Lock the product row so concurrent holds on it are serialised.
+        row = (
+            with_available_stock(Product.objects.select_for_update(), holder)
+            .filter(id=product.id)
+            .values_list("available", flat=True)
+            .first()
+        )
+        available = max(row or 0, 0)
+        if available < quantity:
+            raise InsufficientStock([(product, available)])
+
+        StockReservation.objects.update_or_create(
+            product=product,
+            holder=holder,
+            defaults={"quantity": quantity, "expires_at": expires_at},
+        )
+        transaction.on_commit(lambda: _holds_changed([product.id]))
+
+
+def release(holder, product_ids=None):
+    """Drop `holder`'s holds, either all of them or just for `product_ids`."""
+    holds = StockReservation.objects.filter(holder=holder)
+    if product_ids is not None:
+        holds = holds.filter(product_id__in=product_ids)
+    released = list(holds.values_list("product_id", flat=True))
+    if released:
+        holds.delete()
+        transaction.on_commit(lambda: _holds_changed(released))
+
+
+def holds_stock(request):
+    """Whether the cart behind `request` holds its stock (see GUEST_HOLDS)."""
+    return request.user.is_authenticated or GUEST_HOLDS
+
+
+def hold_for_request(request, product, quantity):
+    """
+    reserve() `quantity` of `product` for the cart behind `request`. A cart
+    that does not hold stock only checks it, raising InsufficientStock all
+    the same.
+    """
+    holder = holder_for_request(request)
+    if holds_stock(request):
+        reserve(product, holder, quantity)
+        return
+    available = max(available_stock([product.id], holder).get(product.id, 0), 0)
+    if available < quantity:
+        raise InsufficientStock([(product, available)])
+
+
+def release_for_request(request, product_ids=None):
+    """release() the holds of the cart behind `request`, if it takes any."""
+    if holds_stock(request):
+        release(holder_for_request(request), product_ids)
+
+
+def release_expired(batch_size=1000):
+    """Delete expired holds in batches. Returns the number released."""
+    released = 0
+    while True:
+        rows = list(
+            StockReservation.objects.expired()
+            .order_by("expires_at")
+            .values_list("id", "product_id")[:batch_size]
+        )
+        if not rows:
+            return released
+        released += StockReservation.objects.filter(id__in=[id for id, _ in rows]).delete()[0]
+        _holds_changed({product_id for _, product_id in rows})
@@ -0,0 +1,117 @@
+# orders/rollups.py
+#
+# Daily sales rollups per seller and per product. place_order adds each
+# order to them as it is placed, so seller dashboards read a few rows per
+# day instead of aggregating OrderItem over all history.
+
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import models
+from django.db.models import Case, F, Q, Sum, When
+from django.utils import timezone
+
+from .models import ProductDailySales, SellerDailySales
+
+
+# Keys per UPDATE ... CASE statement, to stay well inside SQL parameter limits.
+UPDATE_BATCH_SIZE = 100
+
+
+def _increment(model, deltas, defaults=None):
+    """
+    Add (units, revenue, orders) deltas to rollup rows, creating missing
+    rows first. `deltas` maps a tuple of lookup kwargs (as sorted items) to
+    the amounts; `defaults` maps the same key to extra fields for creation.
+    Two queries per batch, however many rows are touched.
+    """
+    keys = list(deltas)
+    for start in range(0, len(keys), UPDATE_BATCH_SIZE):
+        batch = keys[start:start + UPDATE_BATCH_SIZE]
+        model.objects.bulk_create(
+            [model(**dict(key), **(defaults or {}).get(key, {})) for key in batch],
+            ignore_conflicts=True,
+        )
+
+        condition = Q()
+        cases = {"units": [], "revenue": [], "orders": []}
+        for key in batch:
+            match = Q(**dict(key))
+            condition |= match
+            units, revenue, orders = deltas[key]
+            cases["units"].append(When(match, then=F("units") + units))
+            cases["revenue"].append(When(match, then=F("revenue") + revenue))
+            cases["orders"].append(When(match, then=F("orders") + orders))
+
+        model.objects.filter(condition).update(**{
+            name: Case(*whens, default=F(name), output_field=model._meta.get_field(name))
+            for name, whens in cases.items()
+        })
+
+
+def add_sales(lines):
+    """
+    Add sold lines to the rollups. Each line is
+    (order_id, day, product_id, seller_id, quantity, revenue).
+    """
+    products = defaultdict(lambda: [0, Decimal("0.00"), set()])
+    sellers = defaultdict(lambda: [0, Decimal("0.00"), set()])
+    product_seller = {}
+    for order_id, day, product_id, seller_id, quantity, revenue in lines:
+        product_key = (("day", day), ("product_id", product_id))
+        seller_key = (("day", day), ("seller_id", seller_id))
+        product_seller[product_key] = {"seller_id": seller_id}
+        for totals in (products[product_key], sellers[seller_key]):
+            totals[0] += quantity
+            totals[1] += revenue
+            totals[2].add(order_id)
+
+    def counted(totals):
+        return {key: (units, revenue, len(orders)) for key, (units, revenue, orders) in totals.items()}
+
+    _increment(ProductDailySales, counted(products), defaults=product_seller)
+    _increment(SellerDailySales, counted(sellers))
+
+
+def record_order(order, products, quantities):
+    """Add a just-placed order's lines (product id -> quantity) to the rollups."""
+    day = timezone.localdate(order.created_at)
+    add_sales(
+        (order.pk, day, pid, products[pid].seller_id, qty, products[pid].price * qty)
+        for pid, qty in quantities.items()
+    )
+
+
+def seller_timeseries(seller, start, end):
+    """
+    One {"day", "units", "revenue", "orders"} dict per day from `start` to
+    `end` inclusive, zero-filled, from SellerDailySales.
+    """
+    rows = {
+        row["day"]: row
+        for row in SellerDailySales.objects.filter(seller=seller, day__range=(start, end))
+        .values("day", "units", "revenue", "orders")
+    }
+    series = []
+    day = start
+    while day <= end:
+        series.append(rows.get(day, {"day": day, "units": 0, "revenue": Decimal("0.00"), "orders": 0}))
+        day += timedelta(days=1)
+    return series
+
+
+def top_products(seller, start, end, limit=10, by="revenue"):
+    """The seller's best products between `start` and `end`, by revenue or units."""
+    if by not in ("revenue", "units"):
+        raise ValueError(f"Cannot rank products by {by!r}")
+    return list(
+        ProductDailySales.objects.filter(seller=seller, day__range=(start, end))
+        .values("product_id", "product__name")
+        .annotate(
+            total_units=Sum("units"),
+            total_revenue=Sum("revenue", output_field=models.DecimalField()),
+            total_orders=Sum("orders"),
+        )
+        .order_by(f"-total_{by}", "product_id")[:limit]
+    )
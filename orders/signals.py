@@ -0,0 +1,39 @@
+# orders/signals.py
+#
+# Keep denormalized cart totals in step with product price changes, and
+# fold a guest's session cart into their saved cart when they log in.
+
+from django.contrib.auth.signals import user_logged_in
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from products.models import Product
+from .merge import merge_session_cart
+from .models import Cart
+
+
+@receiver(post_save, sender=Product)
+def refresh_cart_totals_on_price_change(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields is not None and "price" not in update_fields):
+        return
+    Cart.objects.filter(items__product=instance).refresh_totals()
+
+
+@receiver(pre_delete, sender=Product)
+def remember_carts_holding_product(sender, instance, **kwargs):
+    instance._cart_ids = list(
+        Cart.objects.filter(items__product=instance).values_list("id", flat=True)
+    )
+
+
+@receiver(post_delete, sender=Product)
+def refresh_cart_totals_on_product_delete(sender, instance, **kwargs):
+    cart_ids = getattr(instance, "_cart_ids", None)
+    if cart_ids:
+        Cart.objects.filter(id__in=cart_ids).refresh_totals()
+
+
+@receiver(user_logged_in)
+def merge_guest_cart_on_login(sender, request, user, **kwargs):
+    if request is not None and hasattr(request, "session"):
+        merge_session_cart(request, user)
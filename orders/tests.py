@@ -1,3 +1,752 @@
-from django.test import TestCase
+import csv
+import io
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from ecommerce.testing import QueryBudgetMixin, QueryPlanMixin
+from products.models import Product
+from stores.models import Store
+from .checkout import place_order, InsufficientStock
+from .emails import claim_due_invoices, deliver_pending_invoices, queue_order_invoice_email
+from .models import (
+    Cart, CartItem, InvoiceEmail, Order, ProductDailySales, Purchase, SellerDailySales, StockReservation,
+)
+from .merge import merge_session_cart
+from .reservations import release_expired, reserve, with_available_stock
+from .rollups import add_sales, seller_timeseries, top_products
+from .utils import load_order
+
+User = get_user_model()
+
+
+def make_products(seller, store, count, stock=10, price=Decimal("5.00")):
+    return Product.objects.bulk_create([
+        Product(
+            seller=seller,
+            store=store,
+            name=f"Product {i}",
+            price=price,
+            stock=stock,
+            sku=f"SKU-{store.id}-{i}",
+        )
+        for i in range(count)
+    ])
+
+
+class CheckoutEngineTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", password="pw", is_seller=True)
+        cls.buyer = User.objects.create_user("buyer", email="buyer@example.com", password="pw")
+        cls.store = Store.objects.create(name="Store", owner=cls.seller)
+
+    def test_place_order_decrements_stock_and_writes_items(self):
+        a, b = make_products(self.seller, self.store, 2, stock=5)
+
+        order = place_order([(a, 2), (b, 5)], user=self.buyer, status="PAID")
+
+        a.refresh_from_db()
+        b.refresh_from_db()
+        self.assertEqual((a.stock, b.stock), (3, 0))
+        self.assertEqual(order.items.count(), 2)
+        self.assertEqual(str(order.total_price), "35.00")
+
+    def test_short_line_rolls_back_whole_order(self):
+        a, b = make_products(self.seller, self.store, 2, stock=3)
+
+        with self.assertRaises(InsufficientStock) as ctx:
+            place_order([(a, 1), (b, 4)], user=self.buyer, status="PAID")
+
+        self.assertEqual(ctx.exception.shortages, [(b, 3)])
+        a.refresh_from_db()
+        self.assertEqual(a.stock, 3)
+        self.assertFalse(Order.objects.exists())
+
+    def _checkout_queries(self, cart_size):
+        store = Store.objects.create(name=f"Store {cart_size}", owner=self.seller)
+        cart, _ = Cart.objects.get_or_create(user=self.buyer)
+        CartItem.objects.bulk_create([
+            CartItem(cart=cart, product=product, quantity=1)
+            for product in make_products(self.seller, store, cart_size)
+        ])
+        self.client.force_login(self.buyer)
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(reverse("checkout"))
+
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(cart.items.exists())
+        return len(ctx.captured_queries)
+
+    def test_checkout_query_count_is_constant_in_cart_size(self):
+        counts = {size: self._checkout_queries(size) for size in (1, 10, 30)}
+
+        self.assertEqual(len(set(counts.values())), 1, counts)
+
+    def test_guest_checkout_uses_engine(self):
+        a, = make_products(self.seller, self.store, 1, stock=2)
+        session = self.client.session
+        session["cart"] = {str(a.id): 2}
+        session.save()
+
+        response = self.client.post(reverse("guest_checkout"), {
+            "full_name": "Guest",
+            "email": "guest@example.com",
+            "address": "1 Main St",
+            "city": "Town",
+            "state": "ST",
+            "zip_code": "12345",
+        })
+
+        self.assertEqual(response.status_code, 302)
+        a.refresh_from_db()
+        self.assertEqual(a.stock, 0)
+        self.assertEqual(Order.objects.get().guest_email, "guest@example.com")
+
+    def test_guest_checkout_checks_stock_held_by_other_carts(self):
+        a, = make_products(self.seller, self.store, 1, stock=3)
+        reserve(a, "another-cart", 2)
+        session = self.client.session
+        session["cart"] = {str(a.id): 2}
+        session.save()
+
+        response = self.client.get(reverse("guest_checkout"), follow=True)
+
+        self.assertRedirects(response, reverse("view_cart"))
+        self.assertContains(response, f"Not enough stock for {a.name}. Available: 1")
+
+
+class FailingEmailBackend(BaseEmailBackend):
+    def send_messages(self, email_messages):
+        raise ConnectionError("SMTP unavailable")
+
+
+class InvoiceOutboxTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", password="pw", is_seller=True)
+        cls.buyer = User.objects.create_user("buyer", email="buyer@example.com", password="pw")
+        cls.store = Store.objects.create(name="Store", owner=cls.seller)
+
+    def test_checkout_queues_invoice_without_sending(self):
+        product, = make_products(self.seller, self.store, 1)
+        cart = Cart.objects.create(user=self.buyer)
+        CartItem.objects.create(cart=cart, product=product)
+        self.client.force_login(self.buyer)
+
+        self.client.post(reverse("checkout"))
+
+        self.assertEqual(len(mail.outbox), 0)
+        invoice = InvoiceEmail.objects.get()
+        self.assertEqual((invoice.to_email, invoice.status), ("buyer@example.com", "PENDING"))
+
+    def test_worker_sends_batch_and_marks_sent(self):
+        for _ in range(3):
+            order = Order.objects.create(billing_email="a@example.com", total_price=1)
+            queue_order_invoice_email(order)
+
+        call_command("send_invoice_emails", "--batch-size", "2", stdout=open("/dev/null", "w"))
+
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(InvoiceEmail.objects.filter(status="SENT").count(), 3)
+
+    @override_settings(EMAIL_BACKEND="orders.tests.FailingEmailBackend")
+    def test_failed_delivery_is_retried_with_backoff(self):
+        order = Order.objects.create(billing_email="a@example.com", total_price=1)
+        queue_order_invoice_email(order)
+
+        self.assertEqual(deliver_pending_invoices(max_attempts=2), (0, 1))
+        invoice = InvoiceEmail.objects.get()
+        self.assertEqual((invoice.status, invoice.attempts), ("PENDING", 1))
+        self.assertIn("SMTP unavailable", invoice.last_error)
+
+        # Not due yet: backoff keeps it out of the next batch.
+        self.assertEqual(deliver_pending_invoices(max_attempts=2), (0, 0))
+
+        InvoiceEmail.objects.update(next_attempt_at=invoice.created_at)
+        deliver_pending_invoices(max_attempts=2)
+        self.assertEqual(InvoiceEmail.objects.get().status, "FAILED")
+
+    def test_claimed_invoices_are_skipped_until_the_claim_runs_out(self):
+        for _ in range(3):
+            queue_order_invoice_email(Order.objects.create(billing_email="a@example.com", total_price=1))
+
+        claimed = claim_due_invoices(batch_size=2)
+        self.assertEqual(len(claimed), 2)
+        # A concurrent run gets only the invoice left over
+        self.assertEqual(deliver_pending_invoices(), (1, 0))
+        self.assertEqual(len(mail.outbox), 1)
+
+        # The first worker died: its claim runs out and the invoices are sent
+        InvoiceEmail.objects.filter(status="PENDING").update(next_attempt_at=timezone.now())
+        self.assertEqual(deliver_pending_invoices(), (2, 0))
+
+
+class StockReservationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", password="pw", is_seller=True)
+        cls.buyer = User.objects.create_user("buyer", email="buyer@example.com", password="pw")
+        cls.store = Store.objects.create(name="Store", owner=cls.seller)
+
+    def test_holds_reduce_available_stock_for_other_carts(self):
+        product, = make_products(self.seller, self.store, 1, stock=3)
+
+        reserve(product, "session:a", 2)
+
+        with self.assertRaises(InsufficientStock) as ctx:
+            reserve(product, "session:b", 2)
+        self.assertEqual(ctx.exception.shortages, [(product, 1)])
+        self.assertEqual(with_available_stock(Product.objects.all()).get().available, 1)
+        # The holder's own hold does not count against it.
+        reserve(product, "session:a", 3)
+
+    def test_checkout_consumes_own_holds_and_respects_others(self):
+        product, = make_products(self.seller, self.store, 1, stock=3)
+        reserve(product, "session:guest", 2)
+
+        with self.assertRaises(InsufficientStock):
+            place_order([(product, 2)], holder=f"user:{self.buyer.pk}", user=self.buyer)
+
+        place_order([(product, 2)], holder="session:guest")
+
+        product.refresh_from_db()
+        self.assertEqual(product.stock, 1)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_add_to_cart_takes_hold_and_sweeper_releases_expired(self):
+        product, = make_products(self.seller, self.store, 1, stock=1)
+        self.client.force_login(self.buyer)
+
+        self.client.get(reverse("add_to_cart", args=[product.id]))
+        self.client.get(reverse("add_to_cart", args=[product.id]))
+
+        self.assertEqual(CartItem.objects.get().quantity, 1)
+        hold = StockReservation.objects.get()
+        self.assertEqual((hold.holder, hold.quantity), (f"user:{self.buyer.pk}", 1))
+
+        StockReservation.objects.update(expires_at=timezone.now())
+        self.assertEqual(release_expired(batch_size=1), 1)
+        self.assertFalse(StockReservation.objects.exists())
+
+
+class CartTotalsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", password="pw", is_seller=True)
+        cls.buyer = User.objects.create_user("buyer", email="buyer@example.com", password="pw")
+        cls.store = Store.objects.create(name="Store", owner=cls.seller)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_totals_follow_line_changes_and_price_changes(self):
+        a, b = make_products(self.seller, self.store, 2, price=Decimal("2.50"))
+        cart = Cart.objects.create(user=self.buyer)
+
+        item = CartItem.objects.create(cart=cart, product=a, quantity=2)
+        CartItem.objects.create(cart=cart, product=b)
+        item = CartItem.objects.get(id=item.id)
+        item.quantity = 4
+        item.save()
+        cart.refresh_from_db()
+        self.assertEqual((cart.item_count, cart.subtotal), (5, Decimal("12.50")))
+
+        a.price = Decimal("1.00")
+        a.save()
+        cart.refresh_from_db()
+        self.assertEqual(cart.subtotal, Decimal("6.50"))
+
+        item.delete()
+        cart.refresh_from_db()
+        self.assertEqual((cart.item_count, cart.subtotal), (1, Decimal("2.50")))
+
+    def test_reconcile_repairs_drift(self):
+        product, = make_products(self.seller, self.store, 1)
+        cart = Cart.objects.create(user=self.buyer)
+        CartItem.objects.bulk_create([CartItem(cart=cart, product=product, quantity=3)])
+        self.assertEqual(Cart.objects.drifted().count(), 1)
+
+        call_command("reconcile_cart_totals", stdout=open("/dev/null", "w"))
+
+        cart.refresh_from_db()
+        self.assertEqual((cart.item_count, cart.subtotal), (3, Decimal("15.00")))
+        self.assertFalse(Cart.objects.drifted().exists())
+
+    def test_cart_page_totals_cost_no_extra_queries(self):
+        products = make_products(self.seller, self.store, 5)
+        cart = Cart.objects.create(user=self.buyer)
+        for product in products:
+            CartItem.objects.create(cart=cart, product=product)
+        self.client.force_login(self.buyer)
+        self.client.get(reverse("view_cart"))  # warm the product cache
+
+        # session, user, cart, cart lines
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse("view_cart"))
+        self.assertContains(response, "Total: $25.00")
+        self.assertContains(response, "Cart (<span data-cart-count>5</span>)")
+
+
+class PurchaseLedgerTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", password="pw", is_seller=True)
+        cls.buyer = User.objects.create_user("buyer", email="buyer@example.com", password="pw")
+        cls.store = Store.objects.create(name="Store", owner=cls.seller)
+
+    def test_checkout_records_first_purchase_only(self):
+        a, b = make_products(self.seller, self.store, 2)
+
+        first = place_order([(a, 1)], user=self.buyer)
+        place_order([(a, 1), (b, 1)], user=self.buyer)
+        place_order([(b, 1)], user=None, guest_email="guest@example.com")
+
+        self.assertEqual(Purchase.objects.count(), 2)
+        self.assertEqual(Purchase.objects.get(product=a).first_purchased_at, first.created_at)
+        self.assertTrue(Purchase.has_purchased(self.buyer, b.id))
+
+    def test_backfill_builds_ledger_from_order_items(self):
+        a, b = make_products(self.seller, self.store, 2)
+        first = place_order([(a, 1)], user=self.buyer)
+        place_order([(a, 2), (b, 1)], user=self.buyer)
+        Purchase.objects.all().delete()
+
+        call_command("backfill_purchases", "--batch-size", "1", stdout=open("/dev/null", "w"))
+
+        self.assertEqual(
+            sorted(Purchase.objects.values_list("product_id", "first_purchased_at")),
+            sorted([(a.id, first.created_at), (b.id, Order.objects.latest("id").created_at)]),
+        )
+
+    def test_review_is_verified_from_ledger(self):
+        product, = make_products(self.seller, self.store, 1)
+        place_order([(product, 1)], user=self.buyer)
+        self.client.force_login(self.buyer)
+
+        self.client.post(reverse("leave_review", args=[product.id]), {"rating": 5, "comment": "Great"})
+
+        self.assertTrue(product.reviews.get().verified)
+
+
+class GuestCartMergeTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", password="pw", is_seller=True)
+        cls.buyer = User.objects.create_user("buyer", email="buyer@example.com", password="pw")
+        cls.store = Store.objects.create(name="Store", owner=cls.seller)
+
+    def setUp(self):
+        cache.clear()
+
+    def _build_guest_cart(self, products):
+        for product in products:
+            self.client.get(reverse("add_to_cart", args=[product.id]))
+
+    def test_login_merges_session_cart_with_one_upsert(self):
+        a, b, c = make_products(self.seller, self.store, 3, price=Decimal("2.00"))
+        cart = Cart.objects.create(user=self.buyer)
+        CartItem.objects.create(cart=cart, product=a, quantity=2)
+        with mock.patch("orders.reservations.GUEST_HOLDS", True):
+            self._build_guest_cart([a, b, c])
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.post(reverse("login"), {"username": "buyer", "password": "pw"})
+
+        inserts = [q for q in ctx.captured_queries if 'INSERT INTO "orders_cartitem"' in q["sql"]]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(
+            dict(cart.items.values_list("product_id", "quantity")),
+            {a.id: 3, b.id: 1, c.id: 1},
+        )
+        cart.refresh_from_db()
+        self.assertEqual((cart.item_count, cart.subtotal), (5, Decimal("10.00")))
+        self.assertEqual(self.client.cookies["guest_cart"].value, "")
+        self.assertEqual(
+            set(StockReservation.objects.values_list("holder", "product_id", "quantity")),
+            {(f"user:{self.buyer.pk}", a.id, 3), (f"user:{self.buyer.pk}", b.id, 1), (f"user:{self.buyer.pk}", c.id, 1)},
+        )
+
+    def test_merged_quantities_are_held_for_the_user(self):
+        a, b = make_products(self.seller, self.store, 2)
+        cart = Cart.objects.create(user=self.buyer)
+        CartItem.objects.create(cart=cart, product=a, quantity=2)
+        CartItem.objects.create(cart=cart, product=b, quantity=2)
+        reserve(a, f"user:{self.buyer.pk}", 2)
+        reserve(b, "another-cart", 8)
+        with mock.patch("orders.reservations.GUEST_HOLDS", True):
+            self._build_guest_cart([a, b])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("login"), {"username": "buyer", "password": "pw"})
+
+        self.assertEqual(dict(cart.items.values_list("product_id", "quantity")), {a.id: 3, b.id: 3})
+        # b is held only as far as the other cart leaves stock for it
+        self.assertEqual(
+            set(StockReservation.objects.values_list("holder", "product_id", "quantity")),
+            {(f"user:{self.buyer.pk}", a.id, 3), (f"user:{self.buyer.pk}", b.id, 2), ("another-cart", b.id, 8)},
+        )
+
+    def test_user_strategy_keeps_saved_quantity(self):
+        a, = make_products(self.seller, self.store, 1)
+        cart = Cart.objects.create(user=self.buyer)
+        CartItem.objects.create(cart=cart, product=a, quantity=4)
+        self._build_guest_cart([a])
+
+        request = RequestFactory().get("/")
+        request.session = self.client.session
+        request.COOKIES = {name: morsel.value for name, morsel in self.client.cookies.items()}
+        self.assertEqual(merge_session_cart(request, self.buyer, strategy="user"), 1)
+
+        self.assertEqual(cart.items.get().quantity, 4)
+
+
+class GuestCartStorageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", password="pw", is_seller=True)
+        cls.store = Store.objects.create(name="Store", owner=cls.seller)
+
+    def setUp(self):
+        cache.clear()
+
+    def edit_cart(self, a, b):
+        self.client.get(reverse("add_to_cart", args=[a.id]))
+        self.client.get(reverse("add_to_cart", args=[a.id]))
+        self.client.get(reverse("add_to_cart", args=[b.id]))
+        self.client.post(reverse("update_guest_cart_item", args=[a.id]), {"quantity": 3})
+        self.client.post(reverse("remove_guest_cart_item", args=[b.id]))
+        return self.client.get(reverse("view_cart"))
+
+    def test_guest_cart_edits_write_nothing_to_the_database(self):
+        a, b = make_products(self.seller, self.store, 2)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.edit_cart(a, b)
+
+        writes = [q["sql"] for q in ctx.captured_queries if q["sql"].startswith(("INSERT", "UPDATE", "DELETE"))]
+        self.assertEqual(writes, [])
+        self.assertEqual([(i["product"], i["quantity"]) for i in response.context["items"]], [(a, 3)])
+        self.assertFalse(StockReservation.objects.exists())
+
+        # The stock is still checked
+        response = self.client.post(reverse("update_guest_cart_item", args=[a.id]), {"quantity": 11}, follow=True)
+        self.assertContains(response, "Available: 10")
+
+    def test_guest_holds_when_enabled(self):
+        a, b = make_products(self.seller, self.store, 2)
+        with mock.patch("orders.reservations.GUEST_HOLDS", True), CaptureQueriesContext(connection) as ctx:
+            response = self.edit_cart(a, b)
+
+        self.assertFalse([q for q in ctx.captured_queries if "django_session" in q["sql"]])
+        self.assertEqual([(i["product"], i["quantity"]) for i in response.context["items"]], [(a, 3)])
+        holder = self.client.cookies["guest_cart"].value.split("~")[0]
+        self.assertEqual(
+            list(StockReservation.objects.values_list("holder", "product_id", "quantity")),
+            [(f"session:{holder}", a.id, 3)],
+        )
+
+    def test_tampered_cookie_is_ignored(self):
+        self.client.cookies["guest_cart"] = "abc~1-5"
+        self.assertEqual(self.client.get(reverse("view_cart")).context["items"], [])
+
+    def test_oversized_cart_falls_back_to_the_session(self):
+        products = make_products(self.seller, self.store, 3)
+        with (
+            mock.patch("orders.guest_cart.GUEST_CART_COOKIE_MAX_BYTES", 40),
+            mock.patch("orders.reservations.GUEST_HOLDS", True),
+        ):
+            for product in products:
+                self.client.get(reverse("add_to_cart", args=[product.id]))
+            self.assertEqual(self.client.cookies["guest_cart"].value, "")
+            self.assertEqual(self.client.session["cart"], {str(p.id): 1 for p in products})
+            self.assertEqual(len(self.client.get(reverse("view_cart")).context["items"]), 3)
+
+            # Small enough again: back in the cookie, out of the session
+            self.client.post(reverse("remove_guest_cart_item", args=[products[0].id]))
+            self.client.post(reverse("remove_guest_cart_item", args=[products[1].id]))
+        self.assertNotIn("cart", self.client.session)
+        self.assertEqual(self.client.get(reverse("view_cart")).context["items"][0]["product"], products[2])
+        self.assertEqual(StockReservation.objects.values("holder").distinct().count(), 1)
+
+
+class SalesRollupTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", password="pw", is_seller=True)
+        cls.other_seller = User.objects.create_user("other", password="pw", is_seller=True)
+        cls.buyer = User.objects.create_user("buyer", email="buyer@example.com", password="pw")
+        cls.store = Store.objects.create(name="Store", owner=cls.seller)
+        cls.other_store = Store.objects.create(name="Other", owner=cls.other_seller)
+
+    def rollups(self):
+        return (
+            sorted(SellerDailySales.objects.values_list("seller_id", "day", "units", "revenue", "orders")),
+            sorted(ProductDailySales.objects.values_list("product_id", "seller_id", "day", "units", "revenue", "orders")),
+        )
+
+    def test_checkout_updates_rollups_and_rebuild_matches(self):
+        a, b = make_products(self.seller, self.store, 2, price=Decimal("5.00"))
+        c, = make_products(self.other_seller, self.other_store, 1, price=Decimal("7.00"))
+        today = timezone.localdate()
+
+        place_order([(a, 2), (b, 1), (c, 1)], user=self.buyer)
+        place_order([(a, 1)], user=self.buyer)
+
+        self.assertEqual(
+            SellerDailySales.objects.values_list("units", "revenue", "orders").get(seller=self.seller, day=today),
+            (4, Decimal("20.00"), 2),
+        )
+        self.assertEqual(ProductDailySales.objects.get(product=a).orders, 2)
+
+        incremental = self.rollups()
+        call_command("rebuild_sales_rollups", "--batch-size", "1", stdout=open("/dev/null", "w"))
+        self.assertEqual(self.rollups(), incremental)
+
+    def test_orders_placed_during_a_rebuild_are_counted_once(self):
+        a, = make_products(self.seller, self.store, 1, price=Decimal("5.00"))
+        place_order([(a, 1)], user=self.buyer)
+
+        def add_sales_then_order(lines):
+            add_sales(lines)
+            if Order.objects.filter(user=self.buyer).count() == 1:
+                place_order([(a, 2)], user=self.buyer)
+
+        with mock.patch(
+            "orders.management.commands.rebuild_sales_rollups.add_sales", side_effect=add_sales_then_order
+        ):
+            call_command("rebuild_sales_rollups", "--batch-size", "1", stdout=open("/dev/null", "w"))
+        self.assertEqual(
+            SellerDailySales.objects.values_list("units", "revenue", "orders").get(seller=self.seller),
+            (3, Decimal("15.00"), 2),
+        )
+
+    def test_timeseries_is_zero_filled_and_top_products_ranked(self):
+        a, b = make_products(self.seller, self.store, 2, price=Decimal("5.00"))
+        place_order([(a, 1), (b, 3)], user=self.buyer)
+        today = timezone.localdate()
+        start = today - timezone.timedelta(days=6)
+
+        with self.assertNumQueries(1):
+            series = seller_timeseries(self.seller, start, today)
+        self.assertEqual([row["units"] for row in series], [0] * 6 + [4])
+
+        self.assertEqual([row["product_id"] for row in top_products(self.seller, start, today)], [b.id, a.id])
+        self.assertEqual(top_products(self.seller, start, today, limit=1, by="units")[0]["total_units"], 3)
+
+    def test_sales_endpoints_are_for_sellers_only(self):
+        a, = make_products(self.seller, self.store, 1)
+        place_order([(a, 2)], user=self.buyer)
+
+        self.client.force_login(self.seller)
+        response = self.client.get(reverse("seller_sales"), {"days": 7})
+        self.assertEqual(len(response.json()["days"]), 7)
+        self.assertEqual(response.json()["days"][-1]["revenue"], "10.00")
+        response = self.client.get(reverse("seller_top_products"), {"by": "units"})
+        self.assertEqual(response.json()["products"][0]["id"], a.id)
+        self.assertEqual(self.client.get(reverse("seller_sales"), {"days": 0}).status_code, 400)
+
+        self.client.force_login(self.buyer)
+        self.assertEqual(self.client.get(reverse("seller_sales")).status_code, 403)
+
+
+class OrderHistoryTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", password="pw", is_seller=True)
+        cls.buyer = User.objects.create_user("buyer", email="buyer@example.com", password="pw")
+        cls.store = Store.objects.create(name="Store", owner=cls.seller)
+        cls.products = make_products(cls.seller, cls.store, 10, stock=100)
+
+    def place(self, lines=3):
+        return place_order([(p, 2) for p in self.products[:lines]], user=self.buyer, billing_email="buyer@example.com")
+
+    def test_loader_fetches_order_items_and_products_in_two_queries(self):
+        order = self.place(lines=10)
+
+        with self.assertNumQueries(2):
+            loaded = load_order(order.id)
+            names = [(item.product.name, item.subtotal) for item in loaded.items.all()]
+
+        self.assertEqual(len(names), 10)
+        self.assertEqual(names[0][1], Decimal("10.00"))
+        with self.assertRaises(Order.DoesNotExist):
+            load_order(order.id, user=self.seller)
+
+    def test_order_detail_cost_does_not_grow_with_lines(self):
+        small, large = self.place(lines=1), self.place(lines=10)
+        self.client.force_login(self.buyer)
+
+        # session, user, order (+ address), items (+ products), cart badge
+        self.assertQueryBudget(5, reverse("order_detail", args=[small.id]))
+        response = self.assertQueryBudget(5, reverse("order_detail", args=[large.id]))
+        self.assertContains(response, "$100.00")
+        self.assertContains(response, "Product 9")
+
+    def test_history_pages_newest_first_in_bounded_queries(self):
+        orders = [self.place(lines=n) for n in range(1, 6)]
+        other = place_order([(self.products[0], 1)], user=self.seller)
+        self.client.force_login(self.buyer)
+
+        with mock.patch("orders.views.ORDERS_PER_PAGE", 2):
+            # session, user, orders (+ addresses), items (+ products), cart badge
+            first = self.assertQueryBudget(5, reverse("order_history"))
+            second = self.client.get(reverse("order_history"), {"cursor": first.context["page"].next_cursor})
+
+        self.assertEqual(list(first.context["orders"]), [orders[4], orders[3]])
+        self.assertEqual(list(second.context["orders"]), [orders[2], orders[1]])
+        self.assertNotContains(first, f"Order #{other.id}<")
+        self.assertEqual(self.client.get(reverse("order_history"), {"cursor": "junk"}).status_code, 404)
+
+    def test_invoice_batch_renders_items_without_per_order_queries(self):
+        for _ in range(3):
+            queue_order_invoice_email(self.place(lines=4))
+
+        # the claim (ids and UPDATE, in a savepoint here), invoices, orders
+        # (+ addresses), items (+ products), final bulk update
+        with self.assertNumQueries(8):
+            self.assertEqual(deliver_pending_invoices(), (3, 0))
+        self.assertIn("Product 3 x 2: $10.00", mail.outbox[0].body)
+
+
+class OrderQueryPlanTests(QueryPlanMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", password="pw", is_seller=True)
+        cls.buyer = User.objects.create_user("buyer", email="buyer@example.com", password="pw")
+        cls.store = Store.objects.create(name="Store", owner=cls.seller)
+        cls.products = make_products(cls.seller, cls.store, 5, stock=100)
+        cls.orders = [
+            place_order([(p, 1) for p in cls.products[:n]], user=cls.buyer, billing_email="buyer@example.com")
+            for n in range(1, 4)
+        ]
+        place_order([(cls.products[0], 1)], user=cls.seller)
+
+    def test_buyer_views_use_indexes(self):
+        self.client.force_login(self.buyer)
+        self.client.post(reverse("add_to_cart", args=[self.products[0].id]))
+
+        with mock.patch("orders.views.ORDERS_PER_PAGE", 2):
+            first = self.assertIndexedQueries(reverse("order_history"))
+            self.assertIndexedQueries(reverse("order_history"), data={"cursor": first.context["page"].next_cursor})
+        self.assertIndexedQueries(reverse("order_detail", args=[self.orders[-1].id]))
+        self.assertIndexedQueries(reverse("view_cart"))
+
+
+class OrderExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", password="pw", is_seller=True)
+        cls.other_seller = User.objects.create_user("other", password="pw", is_seller=True)
+        cls.staff = User.objects.create_user("staff", password="pw", is_staff=True)
+        cls.buyer = User.objects.create_user("buyer", email="buyer@example.com", password="pw")
+        cls.store = Store.objects.create(name="Store", owner=cls.seller)
+        cls.other_store = Store.objects.create(name="Other", owner=cls.other_seller)
+
+    def get(self, **params):
+        return self.client.get(reverse("export_orders"), params)
+
+    def export(self, **params):
+        response = self.get(**params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertFalse(response.is_async)
+        return list(csv.DictReader(io.StringIO(b"".join(response.streaming_content).decode())))
+
+    def test_seller_exports_only_their_lines_with_order_fields(self):
+        a, = make_products(self.seller, self.store, 1, price=Decimal("5.00"))
+        c, = make_products(self.other_seller, self.other_store, 1)
+        order = place_order([(a, 2), (c, 1)], guest_name="=HYPERLINK(1)", guest_email="g@example.com")
+
+        self.client.force_login(self.seller)
+        rows = self.export()
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]["order_id"], str(order.id))
+        self.assertEqual(rows[0]["sku"], a.sku)
+        self.assertEqual(rows[0]["line_total"], "10.00")
+        # Their share of the order, not what the buyer paid the other seller
+        self.assertEqual(Decimal(rows[0]["order_total"]), Decimal("10.00"))
+        self.assertEqual(rows[0]["guest_email"], "g@example.com")
+        self.assertEqual(rows[0]["guest_name"], "'=HYPERLINK(1)")
+
+        self.client.force_login(self.staff)
+        self.assertEqual({Decimal(row["order_total"]) for row in self.export()}, {order.total_price})
+
+        self.client.force_login(self.buyer)
+        self.assertEqual(self.get().status_code, 403)
+
+    def test_staff_filters_by_seller_status_and_dates(self):
+        a, = make_products(self.seller, self.store, 1)
+        c, = make_products(self.other_seller, self.other_store, 1)
+        place_order([(a, 1)], user=self.buyer)
+        shipped = place_order([(c, 1)], user=self.buyer)
+        Order.objects.filter(pk=shipped.pk).update(status="SHIPPED")
+        today = timezone.localdate()
+
+        self.client.force_login(self.staff)
+        self.assertEqual(len(self.export()), 2)
+        self.assertEqual([r["product_id"] for r in self.export(seller=self.seller.id)], [str(a.id)])
+        self.assertEqual([r["order_id"] for r in self.export(status="SHIPPED")], [str(shipped.id)])
+        self.assertEqual(len(self.export(start=today, end=today)), 2)
+        self.assertEqual(self.export(end=today - timezone.timedelta(days=1)), [])
+        self.assertEqual(self.get(start=today, end=today - timezone.timedelta(days=1)).status_code, 400)
+
+    def test_served_over_asgi_the_rows_stream_asynchronously(self):
+        a, = make_products(self.seller, self.store, 1)
+        order = place_order([(a, 1)], user=self.buyer)
+
+        self.async_client.force_login(self.seller)
+        response = async_to_sync(self.async_client.get)(reverse("export_orders"))
+        self.assertTrue(response.is_async)
+
+        async def read():
+            return b"".join([chunk async for chunk in response.streaming_content])
+
+        rows = list(csv.DictReader(io.StringIO(async_to_sync(read)().decode())))
+        self.assertEqual([row["order_id"] for row in rows], [str(order.id)])
+
+    def test_command_reads_rows_in_chunks(self):
+        a, = make_products(self.seller, self.store, 1, stock=100)
+        for _ in range(5):
+            place_order([(a, 1)], user=self.buyer)
+        out = io.StringIO()
+        # the seller lookup, then one cursor read in chunks
+        with CaptureQueriesContext(connection) as queries:
+            call_command("export_orders", "--seller", "seller", "--chunk-size", "2", stdout=out)
+        self.assertLessEqual(len(queries), 4)
+        rows = list(csv.reader(io.StringIO(out.getvalue())))
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[0][0], "order_id")
+
+
+class OrderQueryBudgetTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", password="pw", is_seller=True)
+        cls.buyer = User.objects.create_user("buyer", email="buyer@example.com", password="pw")
+        cls.store = Store.objects.create(name="Store", owner=cls.seller)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_cart_and_checkout_stay_within_budget(self):
+        cart = Cart.objects.create(user=self.buyer)
+        for product in make_products(self.seller, self.store, 20):
+            CartItem.objects.create(cart=cart, product=product)
+        self.client.force_login(self.buyer)
+
+        # session, user, cart, lines, products (cold cache)
+        self.assertQueryBudget(5, reverse("view_cart"))
+        # includes two upserts for the daily sales rollups
+        self.assertQueryBudget(21, reverse("checkout"), method="post")
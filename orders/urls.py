@@ -22,6 +22,14 @@ urlpatterns = [
 
     # Orders
     path("order/<int:order_id>/", views.order_detail, name="order_detail"),
+    path("history/", views.order_history, name="order_history"),
+
+    # Seller sales
+    path("seller/sales/", views.seller_sales, name="seller_sales"),
+    path("seller/sales/top-products/", views.seller_top_products, name="seller_top_products"),
+
+    # Order export (CSV)
+    path("export/", views.export_orders, name="export_orders"),
 ]
 
 
@@ -1,7 +1,41 @@
-from .models import Cart
+from django.db.models import Prefetch
+
+from products import cache as product_cache
+from .models import Cart, Order, OrderItem
 
 def get_user_cart(user):
     try:
         return user.cart  # always the correct cart
     except Cart.DoesNotExist:
         return Cart.objects.create(user=user)
+
+
+def cart_lines_with_products(cart):
+    """
+    The cart's CartItems with `product` filled from the product cache, so
+    rendering a cart costs one query for the lines and none for products.
+    """
+    items = list(cart.items.all())
+    products = product_cache.get_many(item.product_id for item in items)
+    for item in items:
+        item.product = products[item.product_id]
+    return items
+
+
+def with_items(queryset):
+    """
+    Orders with their shipping address joined and their items (and each
+    item's product) prefetched: two queries however many orders or lines.
+    """
+    return queryset.select_related("shipping_address").prefetch_related(
+        Prefetch("items", queryset=OrderItem.objects.select_related("product").order_by("id"))
+    )
+
+
+def load_order(order_id, **filters):
+    """
+    One order, ready to render (see with_items). Raises Order.DoesNotExist,
+    including when `filters` (e.g. user=...) exclude it.
+    """
+    return with_items(Order.objects.filter(**filters)).get(pk=order_id)
+
@@ -2,14 +2,31 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.db import transaction
-from django.core.mail import send_mail
-from django.conf import settings
-from django.template.loader import render_to_string
-
-from .models import Cart, CartItem, Order, OrderItem
-from .forms import GuestCheckoutForm
+from django.contrib.auth import get_user_model
+from django.core.handlers.asgi import ASGIRequest
+from django.http import (
+    Http404, HttpResponseBadRequest, HttpResponseForbidden, JsonResponse, StreamingHttpResponse,
+)
+from django.utils import timezone
+from datetime import timedelta
+
+from .models import Cart, CartItem, Order
+from .forms import GuestCheckoutForm, OrderExportForm, SalesRangeForm
+from .checkout import place_order, InsufficientStock
+from .emails import queue_order_invoice_email
+from .guest_cart import get_storage as get_guest_cart_storage
+from .export import acsv_lines, csv_lines, order_lines
+from .reservations import (
+    available_stock, hold_for_request, holder_for_request, release, release_for_request, reserve,
+)
+from .rollups import seller_timeseries, top_products
+from .utils import cart_lines_with_products, load_order, with_items
+from products import cache as product_cache
 from products.models import Product
+from products.pagination import InvalidCursor, paginate_keyset
+
 
+ORDERS_PER_PAGE = 20
 
 # -----------------------------
 # Helper: Get or create cart DB cart: logged-in
@@ -25,18 +42,18 @@ def get_user_cart(user):
 # ============================
 def get_session_cart(request):
     """
-    Session cart structure:
+    Guest cart structure (kept by orders/guest_cart.py, by default in a
+    signed cookie):
     {
         "product_id_as_str": quantity_int,
         ...
     }
     """
-    return request.session.get("cart", {})
+    return get_guest_cart_storage().load(request)
 
 
 def save_session_cart(request, cart):
-    request.session["cart"] = cart
-    request.session.modified = True
+    get_guest_cart_storage().save(request, cart)
 
 
 def add_to_session_cart(request, product_id, quantity=1):
@@ -76,12 +93,10 @@ def get_session_cart_items_with_totals(request):
         }
     """
     cart = get_session_cart(request)
-    product_ids = [int(pid) for pid in cart.keys()]
-    products = Product.objects.filter(id__in=product_ids)
+    product_map = product_cache.get_many(cart.keys())
 
     items = []
     total = 0
-    product_map = {p.id: p for p in products}
 
     for pid_str, qty in cart.items():
         pid = int(pid_str)
@@ -108,13 +123,27 @@ def add_to_cart(request, product_id):
     if request.user.is_authenticated:
         # Logged-in: use DB cart
         cart = get_user_cart(request.user)
-        item, created = CartItem.objects.get_or_create(cart=cart, product=product)
+        item = CartItem.objects.filter(cart=cart, product=product).first()
+        quantity = (item.quantity if item else 0) + 1
+    else:
+        # Guest: use session cart
+        quantity = get_session_cart(request).get(str(product_id), 0) + 1
+
+    # Hold the stock for this cart (guests: check it) before adding the line
+    try:
+        hold_for_request(request, product, quantity)
+    except InsufficientStock as exc:
+        _, available = exc.shortages[0]
+        messages.error(request, f"Not enough stock for {product.name}. Available: {available}")
+        return redirect("view_cart")
 
-        if not created:
-            item.quantity += 1
+    if request.user.is_authenticated:
+        if item:
+            item.quantity = quantity
             item.save()
+        else:
+            CartItem.objects.create(cart=cart, product=product, quantity=quantity)
     else:
-        # Guest: use session cart
         add_to_session_cart(request, product_id, quantity=1)
 
     messages.success(request, f"{product.name} added to your cart.")
@@ -125,18 +154,13 @@ def add_to_cart(request, product_id):
 # VIEW CART (handles both)
 # ============================
 def view_cart(request):
-    print(">>> view_cart CALLED")
-    print(">>> request.user:", request.user)
-    print(">>> is_authenticated:", request.user.is_authenticated)
-
     if request.user.is_authenticated:
         try:
             cart = request.user.cart
         except Cart.DoesNotExist:
             cart = Cart.objects.create(user=request.user)
 
-        items = cart.items.select_related("product")
-        print(">>> CART ITEMS IN DB:", list(items))
+        items = cart_lines_with_products(cart)
         return render(request, "orders/cart.html", {"cart": cart, "items": items})
 
     # Guest cart
@@ -157,13 +181,24 @@ def update_cart_item(request, item_id):
     except ValueError:
         new_qty = 1
 
+    holder = holder_for_request(request)
+
     if new_qty <= 0:
+        release(holder, [item.product_id])
         item.delete()
         messages.info(request, "Item removed from cart.")
-    else:
-        item.quantity = new_qty
-        item.save()
-        messages.success(request, "Cart updated.")
+        return redirect("view_cart")
+
+    try:
+        reserve(item.product, holder, new_qty)
+    except InsufficientStock as exc:
+        _, available = exc.shortages[0]
+        messages.error(request, f"Not enough stock for {item.product.name}. Available: {available}")
+        return redirect("view_cart")
+
+    item.quantity = new_qty
+    item.save()
+    messages.success(request, "Cart updated.")
 
     return redirect("view_cart")
 
@@ -173,6 +208,7 @@ def remove_from_cart(request, item_id):
     cart = get_user_cart(request.user)
     item = get_object_or_404(CartItem, id=item_id, cart=cart)
 
+    release(holder_for_request(request), [item.product_id])
     item.delete()
     messages.info(request, "Item removed from cart.")
 
@@ -188,6 +224,17 @@ def update_guest_cart_item(request, product_id):
     except ValueError:
         new_qty = 1
 
+    if new_qty > 0:
+        product = get_object_or_404(Product, id=product_id)
+        try:
+            hold_for_request(request, product, new_qty)
+        except InsufficientStock as exc:
+            _, available = exc.shortages[0]
+            messages.error(request, f"Not enough stock for {product.name}. Available: {available}")
+            return redirect("view_cart")
+    else:
+        release_for_request(request, [product_id])
+
     update_session_cart_item(request, product_id, new_qty)
 
     if new_qty <= 0:
@@ -199,6 +246,7 @@ def update_guest_cart_item(request, product_id):
 
 
 def remove_guest_cart_item(request, product_id):
+    release_for_request(request, [product_id])
     remove_from_session_cart(request, product_id)
     messages.info(request, "Item removed from cart.")
     return redirect("view_cart")
@@ -210,50 +258,36 @@ def remove_guest_cart_item(request, product_id):
 @login_required
 @transaction.atomic
 def checkout(request):
-    print(">>> CHECKOUT VIEW CALLED <<<")
     cart = get_user_cart(request.user)
     items = cart.items.select_related("product")
 
-    if not items.exists():
+    lines = list(items)
+    if not lines:
         messages.error(request, "Your cart is empty.")
         return redirect("view_cart")
 
-    # 1. Validate stock
-    for item in items:
-        if item.quantity > item.product.stock:
+    # 1. Create Order + OrderItems and deduct stock (all or nothing)
+    try:
+        order = place_order(
+            [(item.product, item.quantity) for item in lines],
+            holder=holder_for_request(request),
+            user=request.user,
+            billing_email=request.user.email,
+            status="PAID",
+        )
+    except InsufficientStock as exc:
+        for product, available in exc.shortages:
             messages.error(
                 request,
-                f"Not enough stock for {item.product.name}. Available: {item.product.stock}"
+                f"Not enough stock for {product.name}. Available: {available}"
             )
-            return redirect("view_cart")
-
-    # 2. Create Order
-    total = sum(item.total for item in items)
-    order = Order.objects.create(
-        user=request.user,
-        billing_email=request.user.email,
-        total_price=total,
-        status="PAID",
-    )
-
-    # 3. Create OrderItems + deduct stock
-    for item in items:
-        OrderItem.objects.create(
-            order=order,
-            product=item.product,
-            product_name=item.product.name,
-            quantity=item.quantity,
-            price_at_purchase=item.product.price,
-        )
-
-        item.product.stock -= item.quantity
-        item.product.save()
+        return redirect("view_cart")
 
-    # 4. Clear cart
-    items.delete()
+    # 2. Clear cart
+    cart.clear()
 
-    # 5. Send invoice email
-    send_order_invoice_email(order)
+    # 3. Queue invoice email (delivered by `manage.py send_invoice_emails`)
+    queue_order_invoice_email(order)
 
     messages.success(request, "Checkout successful! Your order has been placed.")
     return redirect("order_detail", order_id=order.id)
@@ -270,14 +304,17 @@ def guest_checkout(request):
         messages.error(request, "Your cart is empty.")
         return redirect("view_cart")
 
-    # Validate stock
+    # Validate stock: what other carts' holds leave, read live (the cart's
+    # product rows come from the cache)
+    holder = holder_for_request(request)
+    available = available_stock([item["product"].id for item in items], holder)
     for item in items:
         product = item["product"]
         quantity = item["quantity"]
-        if quantity > product.stock:
+        if quantity > available.get(product.id, 0):
             messages.error(
                 request,
-                f"Not enough stock for {product.name}. Available: {product.stock}"
+                f"Not enough stock for {product.name}. Available: {max(available.get(product.id, 0), 0)}"
             )
             return redirect("view_cart")
 
@@ -286,42 +323,35 @@ def guest_checkout(request):
         if form.is_valid():
             cd = form.cleaned_data
 
-            # Create guest order (no user)
-            order = Order.objects.create(
-                user=None,
-                billing_email=cd["email"],  # still fill this
-                total_price=total,
-                status="PAID",
-                guest_name=cd["full_name"],
-                guest_email=cd["email"],
-                guest_address=cd["address"],
-                guest_city=cd["city"],
-                guest_state=cd["state"],
-                guest_zip=cd["zip_code"],
-                guest_phone=cd.get("phone") or "",
-            )
-
-            # Create OrderItems + deduct stock
-            for item in items:
-                product = item["product"]
-                quantity = item["quantity"]
-
-                OrderItem.objects.create(
-                    order=order,
-                    product=product,
-                    product_name=product.name,
-                    quantity=quantity,
-                    price_at_purchase=product.price,
+            # Create guest order (no user) + OrderItems and deduct stock
+            try:
+                order = place_order(
+                    [(item["product"], item["quantity"]) for item in items],
+                    holder=holder,
+                    user=None,
+                    billing_email=cd["email"],  # still fill this
+                    status="PAID",
+                    guest_name=cd["full_name"],
+                    guest_email=cd["email"],
+                    guest_address=cd["address"],
+                    guest_city=cd["city"],
+                    guest_state=cd["state"],
+                    guest_zip=cd["zip_code"],
+                    guest_phone=cd.get("phone") or "",
                 )
-
-                product.stock -= quantity
-                product.save()
+            except InsufficientStock as exc:
+                for product, available in exc.shortages:
+                    messages.error(
+                        request,
+                        f"Not enough stock for {product.name}. Available: {available}"
+                    )
+                return redirect("view_cart")
 
             # Clear session cart
             save_session_cart(request, {})
 
-            # Send invoice email
-            send_order_invoice_email(order)
+            # Queue invoice email (delivered by `manage.py send_invoice_emails`)
+            queue_order_invoice_email(order)
 
             messages.success(request, "Checkout successful! Your order has been placed.")
             return redirect("order_detail", order_id=order.id)
@@ -339,11 +369,14 @@ def guest_checkout(request):
 # ORDER DETAIL
 # ============================
 def order_detail(request, order_id):
-    order = get_object_or_404(Order, id=order_id)
+    try:
+        order = load_order(order_id)
+    except Order.DoesNotExist:
+        raise Http404("No such order")
 
     # Optional: restrict so only the owner or guests with link can see
-    if order.user and request.user.is_authenticated:
-        if order.user != request.user:
+    if order.user_id and request.user.is_authenticated:
+        if order.user_id != request.user.pk:
             messages.error(request, "You do not have permission to view this order.")
             return redirect("product_list")
 
@@ -351,25 +384,110 @@ def order_detail(request, order_id):
 
 
 # ============================
-# EMAIL INVOICE
+# ORDER HISTORY (logged-in)
 # ============================
-def send_order_invoice_email(order):
-    subject = f"Your Order #{order.id} Invoice"
-    context = {"order": order}
+@login_required
+def order_history(request):
+    try:
+        page = paginate_keyset(
+            with_items(Order.objects.filter(user=request.user)),
+            cursor=request.GET.get("cursor"),
+            per_page=ORDERS_PER_PAGE,
+        )
+    except InvalidCursor:
+        raise Http404("Invalid page cursor")
 
-    message = render_to_string("orders/email_invoice.txt", context)
-    html_message = render_to_string("orders/email_invoice.html", context)
+    return render(request, "orders/order_history.html", {"orders": page, "page": page})
 
-    # Decide email target
-    to_email = order.billing_email or order.guest_email
 
-    if not to_email:
-        return  # nothing to send to
+# ============================
+# SELLER SALES (served from the daily rollups)
+# ============================
+def _seller_sales_window(request):
+    """(form, start, end) for the last ?days= days, today included."""
+    form = SalesRangeForm(request.GET)
+    if not form.is_valid():
+        return form, None, None
+    end = timezone.localdate()
+    start = end - timedelta(days=(form.cleaned_data["days"] or 30) - 1)
+    return form, start, end
+
+
+@login_required
+def seller_sales(request):
+    """Daily units, revenue and orders for the seller, as JSON."""
+    if not request.user.is_seller:
+        return HttpResponseForbidden("Sellers only")
+    form, start, end = _seller_sales_window(request)
+    if not form.is_valid():
+        return HttpResponseBadRequest("Invalid range")
+
+    series = seller_timeseries(request.user, start, end)
+    return JsonResponse({
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "days": [
+            {"day": row["day"].isoformat(), "units": row["units"],
+             "revenue": str(row["revenue"]), "orders": row["orders"]}
+            for row in series
+        ],
+    })
 
-    send_mail(
-        subject,
-        message,
-        settings.DEFAULT_FROM_EMAIL,
-        [to_email],
-        html_message=html_message,
+
+@login_required
+def seller_top_products(request):
+    """The seller's best-selling products over the window, as JSON."""
+    if not request.user.is_seller:
+        return HttpResponseForbidden("Sellers only")
+    form, start, end = _seller_sales_window(request)
+    if not form.is_valid():
+        return HttpResponseBadRequest("Invalid range")
+
+    rows = top_products(
+        request.user, start, end,
+        limit=form.cleaned_data["limit"] or 10,
+        by=form.cleaned_data["by"] or "revenue",
     )
+    return JsonResponse({
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "products": [
+            {"id": row["product_id"], "name": row["product__name"], "units": row["total_units"],
+             "revenue": str(row["total_revenue"]), "orders": row["total_orders"]}
+            for row in rows
+        ],
+    })
+
+
+# ============================
+# ORDER EXPORT (streamed CSV)
+# ============================
+@login_required
+def export_orders(request):
+    """
+    Stream order lines as CSV. Sellers get the lines for their own products,
+    with order totals covering only those lines; staff get every line, or
+    one seller's with ?seller=<id>.
+    """
+    user = request.user
+    if not (user.is_staff or user.is_seller):
+        return HttpResponseForbidden("Sellers and staff only")
+    form = OrderExportForm(request.GET)
+    if not form.is_valid():
+        return HttpResponseBadRequest("Invalid filters")
+
+    filters = form.cleaned_data
+    seller = user
+    if user.is_staff:
+        seller = None
+        if filters["seller"]:
+            seller = get_object_or_404(get_user_model(), pk=filters["seller"], is_seller=True)
+
+    rows = order_lines(seller=seller, start=filters["start"], end=filters["end"], status=filters["status"])
+    # Each server streams its own kind of iterator; given the other it buffers
+    # the whole export first.
+    lines = acsv_lines(rows) if isinstance(request, ASGIRequest) else csv_lines(rows)
+    response = StreamingHttpResponse(lines, content_type="text/csv")
+    filename = f"orders-{timezone.localdate():%Y%m%d}.csv"
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
@@ -1,6 +1,15 @@
 from django.contrib import admin
+from . import inventory
 from .models import Product, Category
 
+
+class ProductAdmin(admin.ModelAdmin):
+    def get_object(self, request, object_id, from_field=None):
+        # Edit sharded stock from the shards, not the last consolidated figure
+        product = super().get_object(request, object_id, from_field)
+        return product and inventory.use_live_stock(product)
+
+
 # Register your models here.
-admin.site.register(Product)
+admin.site.register(Product, ProductAdmin)
 admin.site.register(Category)
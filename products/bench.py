@@ -0,0 +1,496 @@
+# products/bench.py
+#
+# End-to-end load benchmark: seeds a dataset and drives the real URLconf with
+# the Django test client through browse -> cart -> checkout scenarios,
+# recording latency and SQL query counts per URL name. Used by
+# `manage.py bench`, which runs it against a throwaway test database.
+#
+# compare_deployments() instead calls the WSGI and ASGI handlers directly
+# (no test client) to compare the catalog read path under each at high
+# concurrency, and stock_contention() has many threads buy one hot product
+# to compare single-row and sharded stock (products/inventory.py).
+
+import asyncio
+import html
+import io
+import json
+import random
+import re
+import statistics
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections
+from django.db.models import Sum
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+
+from orders.checkout import InsufficientStock, place_order
+from orders.models import OrderItem
+from reviews.models import ProductRatingSummary, Review
+from stores.models import Store
+from . import cache as product_cache, facets, inventory, page_cache
+from .models import Category, Product
+
+User = get_user_model()
+
+
+# ============================
+# DATASET
+# ============================
+def seed(products=1000, reviews_per_product=5, buyers=20, sellers=5, batch_size=1000):
+    """
+    Bulk-load a catalog for benchmarking. Returns a dict describing it.
+    Buyers are bench-buyer-<n> and sellers bench-seller-<n>, all with
+    password "bench".
+    """
+    password = make_password("bench")
+    seller_objs = User.objects.bulk_create([
+        User(username=f"bench-seller-{i}", password=password, is_seller=True, is_buyer=False)
+        for i in range(sellers)
+    ])
+    buyer_objs = User.objects.bulk_create([
+        User(username=f"bench-buyer-{i}", email=f"buyer{i}@example.com", password=password)
+        for i in range(buyers)
+    ])
+    stores = Store.objects.bulk_create([
+        Store(name=f"Bench Store {i}", owner=seller) for i, seller in enumerate(seller_objs)
+    ])
+    categories = Category.objects.bulk_create([
+        Category(name=f"Bench Category {i}", slug=f"bench-category-{i}") for i in range(10)
+    ])
+
+    rng = random.Random(0)
+    product_objs = Product.objects.bulk_create(
+        [
+            Product(
+                seller=stores[i % sellers].owner,
+                store=stores[i % sellers],
+                category=categories[i % len(categories)],
+                name=f"Bench Product {i}",
+                description="Benchmark product " * 5,
+                price=Decimal(rng.randint(100, 10000)) / 100,
+                stock=1_000_000,
+                sku=f"BENCH-{i}",
+            )
+            for i in range(products)
+        ],
+        batch_size=batch_size,
+    )
+
+    Review.objects.bulk_create(
+        (
+            Review(
+                product=product,
+                user=buyer_objs[(product.id + n) % buyers],
+                rating=rng.randint(1, 5),
+                comment="Benchmark review",
+            )
+            for product in product_objs
+            for n in range(reviews_per_product)
+        ),
+        batch_size=batch_size,
+    )
+    ProductRatingSummary.rebuild([p.id for p in product_objs])
+    facets.rebuild()
+    # bulk_create sends no post_save, so index the products for search too.
+    call_command("rebuild_search_index", stdout=io.StringIO())
+
+    return {
+        "products": [p.id for p in product_objs],
+        "buyers": [u.id for u in buyer_objs],
+        "sellers": [u.id for u in seller_objs],
+    }
+
+
+# ============================
+# SCENARIOS
+# ============================
+class Recorder:
+    """Per-URL-name latency and query samples for one worker."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+
+    def request(self, client, method, url, **data):
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = getattr(client, method)(url, data)
+            elapsed = time.perf_counter() - start
+        if response.status_code >= 400:
+            raise RuntimeError(f"{method.upper()} {url} returned {response.status_code}")
+        self.samples[resolve(url).url_name].append((elapsed, len(queries)))
+        return response
+
+
+NEXT_CURSOR = re.compile(r'href="\?cursor=([^"]+)">Next')
+
+
+def browse_catalog(recorder, dataset, rng):
+    """
+    First catalog page and the two pages after it. The cursor is read from
+    the rendered page: a page served from the page cache has no context.
+    """
+    client = Client()
+    url = reverse("product_list")
+    response = recorder.request(client, "get", url)
+    for _ in range(2):
+        found = NEXT_CURSOR.search(response.content.decode())
+        if found is None:
+            break
+        response = recorder.request(client, "get", url, cursor=html.unescape(found.group(1)))
+
+
+def product_detail(recorder, dataset, rng):
+    client = Client()
+    product_id = rng.choice(dataset["products"])
+    recorder.request(client, "get", reverse("product_detail", args=[product_id]))
+
+
+def guest_cart(recorder, dataset, rng):
+    """A guest adds three products and changes one quantity."""
+    client = Client()
+    product_ids = rng.sample(dataset["products"], 3)
+    for product_id in product_ids:
+        recorder.request(client, "get", reverse("add_to_cart", args=[product_id]))
+    recorder.request(
+        client, "post", reverse("update_guest_cart_item", args=[product_ids[0]]), quantity=2
+    )
+
+
+def checkout(recorder, dataset, rng):
+    """A logged-in buyer fills a cart, views it and checks out."""
+    client = Client()
+    client.force_login(User.objects.get(id=rng.choice(dataset["buyers"])))
+    for product_id in rng.sample(dataset["products"], 3):
+        recorder.request(client, "get", reverse("add_to_cart", args=[product_id]))
+    recorder.request(client, "get", reverse("view_cart"))
+    recorder.request(client, "post", reverse("checkout"))
+
+
+def seller_dashboard(recorder, dataset, rng):
+    client = Client()
+    client.force_login(User.objects.get(id=rng.choice(dataset["sellers"])))
+    recorder.request(client, "get", reverse("seller_dashboard"))
+
+
+SCENARIOS = {
+    "browse": browse_catalog,
+    "detail": product_detail,
+    "guest_cart": guest_cart,
+    "checkout": checkout,
+    "seller_dashboard": seller_dashboard,
+}
+
+
+# ============================
+# RUNNER
+# ============================
+def _run_worker(scenario, dataset, iterations, seed_value):
+    recorder = Recorder()
+    rng = random.Random(seed_value)
+    try:
+        for _ in range(iterations):
+            SCENARIOS[scenario](recorder, dataset, rng)
+    finally:
+        if threading.current_thread() is not threading.main_thread():
+            connections.close_all()
+    return dict(recorder.samples)
+
+
+def _process_worker(args):
+    return _run_worker(*args)
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def _summarise(samples, wall_seconds):
+    views = {}
+    for name, rows in sorted(samples.items()):
+        latencies = sorted(elapsed * 1000 for elapsed, _ in rows)
+        queries = [count for _, count in rows]
+        views[name] = {
+            "requests": len(rows),
+            "p50_ms": round(_percentile(latencies, 50), 3),
+            "p95_ms": round(_percentile(latencies, 95), 3),
+            "p99_ms": round(_percentile(latencies, 99), 3),
+            "mean_ms": round(statistics.fmean(latencies), 3),
+            "queries_mean": round(statistics.fmean(queries), 2),
+            "queries_max": max(queries),
+        }
+    total = sum(len(rows) for rows in samples.values())
+    return {
+        "requests": total,
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_rps": round(total / wall_seconds, 2) if wall_seconds else None,
+        "views": views,
+    }
+
+
+def run(dataset, scenarios=None, iterations=20, workers=1, processes=False, seed_value=0):
+    """
+    Run each scenario `iterations` times on each of `workers` threads (or
+    forked processes) and return a JSON-serialisable report.
+    """
+    report = {
+        "iterations": iterations,
+        "workers": workers,
+        "mode": "processes" if processes else "threads",
+        "scenarios": {},
+    }
+    for scenario in scenarios or SCENARIOS:
+        jobs = [(scenario, dataset, iterations, seed_value + n) for n in range(workers)]
+        start = time.perf_counter()
+        if workers == 1:
+            results = [_run_worker(*jobs[0])]
+        elif processes:
+            import multiprocessing
+
+            connections.close_all()  # forked workers open their own
+            context = multiprocessing.get_context("fork")
+            with context.Pool(workers) as pool:
+                results = pool.map(_process_worker, jobs)
+        else:
+            with ThreadPoolExecutor(workers) as pool:
+                results = list(pool.map(lambda job: _run_worker(*job), jobs))
+        wall = time.perf_counter() - start
+
+        merged = defaultdict(list)
+        for result in results:
+            for name, rows in result.items():
+                merged[name].extend(rows)
+        report["scenarios"][scenario] = _summarise(merged, wall)
+    return report
+
+
+# ============================
+# WSGI vs ASGI
+# ============================
+def catalog_paths(dataset, count, seed_value=0):
+    """`count` GET paths over the catalog read path: list, detail, reviews."""
+    rng = random.Random(seed_value)
+    paths = []
+    for n in range(count):
+        product_id = rng.choice(dataset["products"])
+        paths.append([
+            reverse("product_list"),
+            reverse("product_detail", args=[product_id]),
+            reverse("product_reviews", args=[product_id]),
+        ][n % 3])
+    return paths
+
+
+def _wsgi_get(handler, path):
+    environ = {
+        "REQUEST_METHOD": "GET",
+        "PATH_INFO": path,
+        "QUERY_STRING": "",
+        "SERVER_NAME": "testserver",
+        "SERVER_PORT": "80",
+        "HTTP_HOST": "testserver",
+        "SERVER_PROTOCOL": "HTTP/1.1",
+        "wsgi.input": io.BytesIO(),
+        "wsgi.url_scheme": "http",
+        "wsgi.errors": io.StringIO(),
+    }
+    status = []
+    body = handler(environ, lambda code, headers, exc_info=None: status.append(code))
+    try:
+        b"".join(body)
+    finally:
+        body.close()
+    return int(status[0].split()[0])
+
+
+async def _asgi_get(handler, path):
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"testserver")],
+        "client": ("127.0.0.1", 50000),
+        "server": ("testserver", 80),
+    }
+    request_sent = False
+    disconnected = asyncio.Event()
+    status = []
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+
+    try:
+        await handler(scope, receive, send)
+    finally:
+        disconnected.set()
+    return status[0]
+
+
+def _timed_summary(latencies, errors, wall_seconds):
+    latencies = sorted(elapsed * 1000 for elapsed in latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_rps": round(len(latencies) / wall_seconds, 2) if wall_seconds else None,
+        "p50_ms": round(_percentile(latencies, 50), 3),
+        "p95_ms": round(_percentile(latencies, 95), 3),
+        "p99_ms": round(_percentile(latencies, 99), 3),
+    }
+
+
+def run_wsgi(paths, concurrency, threads):
+    """
+    A threaded WSGI server: `concurrency` clients share `threads` worker
+    threads, so requests beyond that wait for a free thread.
+    """
+    handler = WSGIHandler()
+    latencies, errors = [], 0
+    lock = threading.Lock()
+
+    def client(chunk):
+        nonlocal errors
+        for path in chunk:
+            start = time.perf_counter()
+            with slots:
+                status = _wsgi_get(handler, path)
+            with lock:
+                latencies.append(time.perf_counter() - start)
+                errors += status >= 400
+
+    slots = threading.Semaphore(threads)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(client, [paths[n::concurrency] for n in range(concurrency)]))
+    return _timed_summary(latencies, errors, time.perf_counter() - start)
+
+
+def run_asgi(paths, concurrency):
+    """An ASGI server: `concurrency` clients as tasks on one event loop."""
+    handler = ASGIHandler()
+    latencies, errors = [], 0
+
+    async def client(chunk):
+        nonlocal errors
+        for path in chunk:
+            start = time.perf_counter()
+            status = await _asgi_get(handler, path)
+            latencies.append(time.perf_counter() - start)
+            errors += status >= 400
+
+    async def main():
+        await asyncio.gather(*(client(paths[n::concurrency]) for n in range(concurrency)))
+
+    start = time.perf_counter()
+    asyncio.run(main())
+    return _timed_summary(latencies, errors, time.perf_counter() - start)
+
+
+def compare_deployments(dataset, requests=600, concurrency=64, wsgi_threads=8, seed_value=0):
+    """
+    Serve the same catalog requests through the WSGI handler (a pool of
+    `wsgi_threads` threads) and the ASGI handler (one event loop), each with
+    `concurrency` clients in flight, and report throughput and latency.
+    """
+    paths = catalog_paths(dataset, requests, seed_value)
+    report = {"requests": requests, "concurrency": concurrency, "wsgi_threads": wsgi_threads}
+    # Warm the product cache and start each run with a cold page cache, so
+    # both runs see the same hit rates.
+    product_cache.get_many(dataset["products"])
+    connections.close_all()
+    page_cache.purge(set(paths))
+    report["wsgi"] = run_wsgi(paths, concurrency, wsgi_threads)
+    connections.close_all()
+    page_cache.purge(set(paths))
+    report["asgi"] = run_asgi(paths, concurrency)
+    connections.close_all()
+    return report
+
+
+# ============================
+# STOCK CONTENTION
+# ============================
+def _buy_until_sold_out(product):
+    """Place single-unit orders for `product` until it sells out."""
+    latencies, errors = [], 0
+    try:
+        while True:
+            start = time.perf_counter()
+            try:
+                place_order([(product, 1)])
+            except InsufficientStock:
+                return latencies, errors
+            except OperationalError:  # e.g. SQLite's "database is locked": retry
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+    finally:
+        connections.close_all()
+
+
+def stock_contention(dataset, stock=2000, threads=8, shards=8):
+    """
+    Sell `stock` units of one product to `threads` concurrent buyers placing
+    single-unit orders: once with the stock in its Product row, once split
+    over `shards` StockShard rows. Each run reports order throughput and
+    latency, and checks that exactly `stock` units were sold (no oversell).
+    """
+    seller = User.objects.get(pk=dataset["sellers"][0])
+    store = Store.objects.filter(owner=seller).first()
+    report = {"stock": stock, "threads": threads, "shards": shards}
+
+    for mode, shard_count in (("single_row", 0), ("sharded", shards)):
+        product = Product.objects.create(
+            seller=seller, store=store, name=f"Hot product ({mode})", price=Decimal("9.99"),
+            stock=stock, stock_shards=shard_count, sku=f"BENCH-HOT-{mode}",
+        )
+        connections.close_all()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(threads) as pool:
+            results = list(pool.map(lambda _: _buy_until_sold_out(product), range(threads)))
+        wall = time.perf_counter() - start
+
+        result = _timed_summary(
+            [elapsed for latencies, _ in results for elapsed in latencies],
+            sum(errors for _, errors in results),
+            wall,
+        )
+        sold = OrderItem.objects.filter(product=product).aggregate(units=Sum("quantity"))["units"] or 0
+        remaining = inventory.stock_levels([product.pk])[product.pk]
+        result.update(units_sold=sold, remaining=remaining, oversold=sold > stock)
+        report[mode] = result
+    connections.close_all()
+    return report
+
+
+def save(report, path):
+    with open(path, "w") as fh:
+        json.dump(report, fh, indent=2, sort_keys=True)
@@ -0,0 +1,123 @@
+# products/cache.py
+#
+# Read-through cache for Product rows (with their Store and Category).
+#
+# Every product has a version token stored under its own cache key; the
+# cached row lives under "product:<id>:<version>". Invalidation only writes
+# a new version, so a stale row can never be read back, and works the same
+# on the local-memory backend and on a shared backend like Redis/Memcached.
+#
+# The catalog as a whole has a version too, moved whenever any product (or
+# the stock on offer) changes; list pages use it as their HTTP validator
+# (products/conditional.py).
+#
+# Misses are read from the primary database, never a read replica
+# (ecommerce/replicas.py): a lagging replica's row would be stored under
+# the new version and served until the next change.
+
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+
+from .models import Product
+
+
+CACHE_ALIAS = getattr(settings, "PRODUCT_CACHE_ALIAS", "default")
+CACHE_TIMEOUT = getattr(settings, "PRODUCT_CACHE_TIMEOUT", 60 * 60)
+
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+
+def _version_key(product_id):
+    return f"product-version:{product_id}"
+
+
+CATALOG_VERSION_KEY = "catalog-version"
+
+
+def _row_key(product_id, version):
+    return f"product:{product_id}:{version}"
+
+
+def _new_version():
+    return time.time_ns()
+
+
+def _versions(ids):
+    """Current version for each id, creating one for ids that have none."""
+    cache = _cache()
+    found = cache.get_many([_version_key(pid) for pid in ids])
+    versions = {}
+    for pid in ids:
+        version = found.get(_version_key(pid))
+        if version is None:
+            version = _new_version()
+            # add() so that a concurrent bump is never overwritten
+            if not cache.add(_version_key(pid), version, timeout=None):
+                version = cache.get(_version_key(pid), version)
+        versions[pid] = version
+    return versions
+
+
+def get_many(ids):
+    """
+    Return {id: Product} for the given ids, with `store` and `category`
+    already loaded. Cache misses are read with one query and stored; ids
+    that do not exist are left out.
+    """
+    ids = list(dict.fromkeys(int(pid) for pid in ids))
+    if not ids:
+        return {}
+
+    cache = _cache()
+    versions = _versions(ids)
+    keys = {_row_key(pid, versions[pid]): pid for pid in ids}
+    cached = cache.get_many(list(keys))
+    products = {keys[key]: product for key, product in cached.items()}
+
+    missing = [pid for pid in ids if pid not in products]
+    if missing:
+        fetched = {
+            p.id: p
+            for p in Product.objects.using(DEFAULT_DB_ALIAS)
+            .select_related("store", "category").filter(id__in=missing)
+        }
+        cache.set_many(
+            {_row_key(pid, versions[pid]): p for pid, p in fetched.items()},
+            timeout=CACHE_TIMEOUT,
+        )
+        products.update(fetched)
+
+    return {pid: products[pid] for pid in ids if pid in products}
+
+
+def get(product_id):
+    """Return one cached Product, or None if it does not exist."""
+    return get_many([product_id]).get(int(product_id))
+
+
+def invalidate(ids):
+    """Move the given products to a new version so their next read misses."""
+    version = _new_version()
+    _cache().set_many({_version_key(pid): version for pid in ids}, timeout=None)
+    bump_catalog_version()
+
+
+def catalog_version():
+    """The catalog version: a time.time_ns() token, created if missing."""
+    cache = _cache()
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        version = _new_version()
+        if not cache.add(CATALOG_VERSION_KEY, version, timeout=None):
+            version = cache.get(CATALOG_VERSION_KEY, version)
+    return version
+
+
+def bump_catalog_version():
+    """Mark the catalog as changed (a product, or what is on offer)."""
+    _cache().set(CATALOG_VERSION_KEY, _new_version(), timeout=None)
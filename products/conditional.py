@@ -0,0 +1,182 @@
+# products/conditional.py
+#
+# Conditional GET for the public catalog pages. A page gets an ETag and a
+# Last-Modified header; a client or CDN revalidating with them is answered
+# 304 Not Modified before the view queries or renders anything.
+#
+#   Product pages - Product.updated_at, the rating summary version, the
+#                   product's available stock and its newest image rendition,
+#                   read in one query.
+#   List pages    - the catalog version (products/cache.py), which lives in
+#                   the cache: revalidation runs no query at all.
+#
+# The ETag covers everything that changes the page, including, on product
+# pages, stock held by other carts; list pages show stock without holds, so
+# a cart edit does not move the catalog version. Last-Modified cannot see changes that leave
+# Product.updated_at alone (holds, sales, new renditions), so on product
+# pages it is only a fallback for clients that do not send If-None-Match.
+#
+# Validators describe what every anonymous visitor sees, plus the guest
+# cart badge. Logged-in users and requests with messages to show get the
+# page rendered as usual, without validators.
+#
+# cache_anonymous_page serves those anonymous pages from the full-page
+# cache (products/page_cache.py), validators included. A page rendered to be
+# stored reads the primary database, not a possibly lagging replica.
+
+import hashlib
+from datetime import datetime, timezone
+from functools import wraps
+
+from django.db.models import OuterRef, Subquery
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from ecommerce import replicas
+from orders.guest_cart import get_storage as get_guest_cart_storage
+from orders.reservations import with_available_stock
+from reviews.models import ProductRatingSummary
+from . import cache as product_cache
+from . import page_cache
+from .models import Product, ProductImageRendition
+
+
+def viewer(request):
+    """
+    (guest cart badge, has messages) for an anonymous GET or HEAD; None
+    for anyone else. The badge is part of the page and so of the ETag; a
+    page with messages to show cannot be a 304.
+    """
+    if request.method not in ("GET", "HEAD") or request.user.is_authenticated:
+        return None
+    badge = sum(get_guest_cart_storage().load(request).values())
+    return badge, bool(len(getattr(request, "_messages", ())))
+
+
+def page_etag(parts, badge):
+    return quote_etag(hashlib.sha1(repr((*parts, badge)).encode()).hexdigest())
+
+
+def reuse(request, name, fetch):
+    """
+    `name` as read by the validator query, if it ran for this request;
+    otherwise `fetch()`. Lets a view skip re-reading what the validators
+    already loaded.
+    """
+    data = getattr(request, "validator_data", {})
+    if name not in data:
+        return fetch()
+    return data[name]
+
+
+def not_modified(request, parts, timestamp, badge):
+    """A 304 response if the request's validators match, else None."""
+    return get_conditional_response(request, etag=page_etag(parts, badge), last_modified=timestamp)
+
+
+def set_validators(response, parts, timestamp, badge):
+    response.headers["ETag"] = page_etag(parts, badge)
+    response.headers["Last-Modified"] = http_date(timestamp)
+    # Cacheable, but always revalidated
+    patch_cache_control(response, no_cache=True)
+    patch_vary_headers(response, ("Cookie",))
+
+
+def conditional_page(validators):
+    """
+    Decorator for a view: `validators(*args, **kwargs)` returns (parts, last_modified datetime, data) for the page,
+    or None to skip conditional handling (e.g. the object does not exist
+    and the view will 404). `data` is kept as request.validator_data for
+    the view to reuse().
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            seen = viewer(request)
+            found = validators(*args, **kwargs) if seen and not seen[1] else None
+            if found is None:
+                return view(request, *args, **kwargs)
+
+            badge = seen[0]
+            parts, last_modified, request.validator_data = found
+            timestamp = int(last_modified.timestamp())
+            # For the page cache (products/page_cache.py)
+            request.page_validators = (parts, timestamp)
+            response = not_modified(request, parts, timestamp, badge)
+            if response is None:
+                response = view(request, *args, **kwargs)
+            if response.status_code in (200, 304):
+                set_validators(response, parts, timestamp, badge)
+            return response
+        return wrapper
+    return decorator
+
+
+def cache_anonymous_page(view):
+    """
+    Decorator for a view wrapped in conditional_page(): serve
+    anonymous visitors from the page cache (products/page_cache.py), and
+    mark everyone else's copy of the page private.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        seen = viewer(request) if page_cache.cacheable(request) else None
+        if seen is None:
+            response = view(request, *args, **kwargs)
+            patch_cache_control(response, private=True)
+            patch_vary_headers(response, ("Cookie",))
+            return response
+
+        badge, has_messages = seen
+        key = page_cache.key_for(request)
+        entry = page_cache.get(key)
+        if entry is not None:
+            parts, timestamp, content_type, body = entry
+            response = None if has_messages else not_modified(request, parts, timestamp, badge)
+            if response is None:
+                body = page_cache.fill(request, body, badge)
+                response = HttpResponse(body, content_type=content_type)
+            if has_messages:
+                patch_cache_control(response, no_cache=True)
+                patch_vary_headers(response, ("Cookie",))
+            else:
+                set_validators(response, parts, timestamp, badge)
+            return response
+
+        # The page is stored for everyone: render it from the primary
+        replicas.read_primary()
+        response = view(request, *args, **kwargs)
+        validators = getattr(request, "page_validators", None)
+        if response.status_code == 200 and not response.streaming and validators is not None:
+            page_cache.store(key, *validators, response)
+        return response
+    return wrapper
+
+
+def product_validators(product_id, **kwargs):
+    newest_rendition = ProductImageRendition.objects.filter(product=OuterRef("pk")).order_by("-pk").values("pk")[:1]
+    product = (
+        with_available_stock(Product.objects.filter(pk=product_id))
+        .annotate(rendition=Subquery(newest_rendition))
+        .select_related("rating_summary")
+        .first()
+    )
+    if product is None:
+        return None
+    try:
+        summary = product.rating_summary
+        changed = max(product.updated_at, summary.updated_at)
+    except ProductRatingSummary.DoesNotExist:
+        summary = ProductRatingSummary(product_id=product.pk)
+        changed = product.updated_at
+    return (
+        (product.pk, product.updated_at.isoformat(), summary.version, product.available, product.rendition),
+        changed,
+        {"available": {product.pk: product.available}, "summary": summary},
+    )
+
+
+def catalog_validators(**kwargs):
+    version = product_cache.catalog_version()
+    return (version,), datetime.fromtimestamp(version / 1e9, tz=timezone.utc), {}
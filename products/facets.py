@@ -0,0 +1,162 @@
+# products/facets.py
+#
+# Facet counts for the catalog filters. ProductFacetCount holds one row per
+# (category, store, price band, in stock) combination; it is kept current by
+# applying +1/-1 deltas as products change, so reading every facet count for
+# a filter combination is one indexed read of a small table.
+
+from collections import defaultdict
+
+from django.db.models import F, Q
+
+from .models import PRICE_BANDS, Product, ProductFacetCount, _facet_key
+
+DIMENSIONS = ("category", "store", "price_band", "in_stock")
+
+
+def _bump(key, delta):
+    category_id, store_id, band, in_stock = key
+    lookup = {"category_id": category_id, "store_id": store_id, "price_band": band, "in_stock": in_stock}
+    if delta > 0:
+        ProductFacetCount.objects.get_or_create(**lookup)
+    ProductFacetCount.objects.filter(**lookup).update(count=F("count") + delta)
+
+
+def move(old_key, new_key):
+    """Move one product from facet `old_key` to `new_key` (either may be None)."""
+    if old_key == new_key:
+        return
+    if old_key is not None:
+        _bump(old_key, -1)
+    if new_key is not None:
+        _bump(new_key, 1)
+
+
+def apply_deltas(deltas):
+    """
+    Apply {facet key: change in count} from a bulk write (see
+    products/importer.py), one update per distinct key.
+    """
+    for key, delta in deltas.items():
+        if key not in (None, "unknown") and delta:
+            _bump(key, delta)
+
+
+def product_saving(product):
+    """
+    Pre-save hook: if the product was loaded with deferred fields, read the
+    facet it counts under from the stored row, so product_saved() can move
+    it out of that facet.
+    """
+    if product.pk is None or getattr(product, "_saved_facet", "unknown") != "unknown":
+        return
+    stored = (
+        Product.objects.only("is_active", "category", "store", "price", "stock")
+        .filter(pk=product.pk)
+        .first()
+    )
+    product._saved_facet = None if stored is None else stored._saved_facet
+
+
+def product_saved(product, created):
+    """Post-save hook: move the product to its new facet if it changed."""
+    old_key = None if created else product._saved_facet
+    new_key = _facet_key(product)
+    if new_key == "unknown":
+        # Saved with deferred fields: read the row as stored.
+        new_key = _facet_key(Product.objects.get(pk=product.pk))
+    move(old_key, new_key)
+    product._saved_facet = new_key
+
+
+def product_deleted(product):
+    """Post-delete hook: take the product out of the facet it counted under."""
+    old_key = getattr(product, "_saved_facet", _facet_key(product))
+    if old_key not in (None, "unknown"):
+        _bump(old_key, -1)
+
+
+def stock_sold_out(product_ids):
+    """
+    After a stock decrement that bypassed save(), move any product that
+    just reached zero from the in-stock facet to the out-of-stock one.
+    """
+    for product in Product.objects.filter(id__in=product_ids, stock=0, is_active=True):
+        key = _facet_key(product)
+        move(key[:3] + (True,), key)
+
+
+def facet_counts(category=None, store=None, price_band=None, in_stock=None):
+    """
+    Counts for every value of every facet, given the selected filters.
+
+    Each dimension is counted with the filters on the *other* dimensions
+    applied (the usual faceted-search behaviour), all from one query.
+    Returns {"category": {id: n}, "store": {id: n}, "price_band": {band: n},
+    "in_stock": {True: n, False: n}}.
+    """
+    selected = {"category": category, "store": store, "price_band": price_band, "in_stock": in_stock}
+    column = {"category": "category_id", "store": "store_id", "price_band": "price_band", "in_stock": "in_stock"}
+    active = {dim: value for dim, value in selected.items() if value is not None}
+
+    def filters_except(skip):
+        return Q(**{column[dim]: value for dim, value in active.items() if dim != skip})
+
+    # Rows that satisfy the filters of all dimensions but (at most) one.
+    condition = Q()
+    for dim in DIMENSIONS:
+        condition |= filters_except(dim)
+    rows = ProductFacetCount.objects.filter(condition, count__gt=0).values_list(
+        "category_id", "store_id", "price_band", "in_stock", "count"
+    )
+
+    counts = {dim: defaultdict(int) for dim in DIMENSIONS}
+    for row in rows:
+        values = dict(zip(DIMENSIONS, row[:4]))
+        for dim in DIMENSIONS:
+            if all(values[other] == value for other, value in active.items() if other != dim):
+                counts[dim][values[dim]] += row[4]
+    return {dim: dict(values) for dim, values in counts.items()}
+
+
+def price_band_label(band):
+    """Human-readable range for a price band index."""
+    if band == 0:
+        return f"Under ${PRICE_BANDS[0]}"
+    if band >= len(PRICE_BANDS):
+        return f"${PRICE_BANDS[-1]} and up"
+    return f"${PRICE_BANDS[band - 1]} – ${PRICE_BANDS[band]}"
+
+
+def rebuild(product_ids=None):
+    """
+    Recount facets from the Product table, for everything or for the facets
+    touched by `product_ids`.
+    """
+    products = Product.objects.filter(is_active=True)
+    if product_ids is not None:
+        keys = {
+            key for key in map(_facet_key, Product.objects.filter(id__in=product_ids))
+            if key is not None
+        }
+        if not keys:
+            return
+        # Recount every (category, store) pair involved, across all bands.
+        pairs = Q()
+        for category_id, store_id, _, _ in keys:
+            pairs |= Q(category_id=category_id, store_id=store_id)
+        products = products.filter(pairs)
+        ProductFacetCount.objects.filter(pairs).delete()
+    else:
+        ProductFacetCount.objects.all().delete()
+
+    counts = defaultdict(int)
+    for product in products.only("category_id", "store_id", "price", "stock", "is_active").iterator(chunk_size=5000):
+        counts[_facet_key(product)] += 1
+    ProductFacetCount.objects.bulk_create(
+        [
+            ProductFacetCount(category_id=c, store_id=s, price_band=b, in_stock=i, count=n)
+            for (c, s, b, i), n in counts.items()
+        ],
+        batch_size=1000,
+    )
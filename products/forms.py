@@ -1,7 +1,74 @@
 from django import forms
-from .models import Product
+from stores.models import Store
+from .models import Category, Product
+from .search import SearchFilters
 
 class ProductForm(forms.ModelForm):
+    # Stock shown when the form was opened: a figure that sales have since
+    # changed is not written back over them.
+    stock_seen = forms.IntegerField(widget=forms.HiddenInput, required=False)
+
     class Meta:
         model = Product
-        fields = ['name', 'description', 'price', 'stock', 'store']
\ No newline at end of file
+        fields = ['name', 'description', 'price', 'stock', 'store', 'image']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk:
+            self.fields['stock_seen'].initial = self.instance.stock
+
+    def clean(self):
+        cleaned_data = super().clean()
+        seen = cleaned_data.get('stock_seen')
+        current = self.instance.stock
+        if self.instance.pk and seen is not None and seen != current and 'stock' in cleaned_data:
+            if cleaned_data['stock'] == seen:
+                # Stock left as shown: keep the current figure
+                cleaned_data['stock'] = current
+            else:
+                self.stock_changed(seen, current)
+        return cleaned_data
+
+    def stock_changed(self, seen, current):
+        """Reject the stock figure, and base the redisplayed form on `current`."""
+        self.add_error(
+            'stock',
+            f"Stock changed from {seen} to {current} since you opened this form. "
+            "Check the figure and save again.",
+        )
+        self.data = self.data.copy()
+        self.data['stock_seen'] = current
+
+class ProductImportUploadForm(forms.Form):
+    file = forms.FileField(label="CSV or JSON Lines file")
+    format = forms.ChoiceField(
+        choices=[("", "Detect from file name"), ("csv", "CSV"), ("jsonl", "JSON Lines")],
+        required=False,
+    )
+
+
+class ProductSearchForm(forms.Form):
+    q = forms.CharField(max_length=200, required=False, label="Search")
+    category = forms.ModelChoiceField(queryset=Category.objects.all(), required=False)
+    store = forms.ModelChoiceField(queryset=Store.objects.all(), required=False)
+    min_price = forms.DecimalField(min_value=0, decimal_places=2, required=False)
+    max_price = forms.DecimalField(min_value=0, decimal_places=2, required=False)
+    in_stock = forms.BooleanField(required=False, label="In stock only")
+
+    def filters(self):
+        cd = self.cleaned_data
+        return SearchFilters(
+            category=cd["category"].pk if cd.get("category") else None,
+            store=cd["store"].pk if cd.get("store") else None,
+            min_price=cd.get("min_price"),
+            max_price=cd.get("max_price"),
+            in_stock=cd.get("in_stock", False),
+        )
+
+
+class ProductFacetForm(forms.Form):
+    """Filter combination for the facet-count API; every field is optional."""
+    category = forms.IntegerField(required=False)
+    store = forms.IntegerField(required=False)
+    price_band = forms.IntegerField(min_value=0, required=False)
+    in_stock = forms.NullBooleanField(required=False)
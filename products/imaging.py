@@ -0,0 +1,44 @@
+# products/imaging.py
+#
+# Pillow-only image resizing, run in the rendition worker processes
+# (products/renditions.py). Nothing here imports Django, so the workers
+# start without setting it up.
+
+import io
+
+from PIL import Image, ImageOps
+
+
+def _for_format(image, fmt):
+    if fmt == "jpeg":
+        if image.mode in ("RGB", "L"):
+            return image
+        # JPEG has no alpha: flatten onto white
+        rgba = image.convert("RGBA")
+        flat = Image.new("RGB", rgba.size, (255, 255, 255))
+        flat.paste(rgba, mask=rgba.getchannel("A"))
+        return flat
+    if image.mode not in ("RGB", "RGBA", "L"):
+        return image.convert("RGBA")
+    return image
+
+
+def render(data, widths, formats, quality=80):
+    """
+    Resize encoded image bytes to each of `widths` (never upscaling: larger
+    widths become the source width) and encode each size in each of
+    `formats`. Returns a list of (width, height, format, bytes).
+    """
+    with Image.open(io.BytesIO(data)) as opened:
+        source = ImageOps.exif_transpose(opened)
+        source.load()
+
+    rendered = []
+    for width in sorted({min(w, source.width) for w in widths}):
+        height = max(1, round(source.height * width / source.width))
+        resized = source if width == source.width else source.resize((width, height), Image.Resampling.LANCZOS)
+        for fmt in formats:
+            buffer = io.BytesIO()
+            _for_format(resized, fmt).save(buffer, format=fmt.upper(), quality=quality)
+            rendered.append((width, height, fmt, buffer.getvalue()))
+    return rendered
@@ -0,0 +1,261 @@
+# products/importer.py
+#
+# Bulk product import for sellers, from CSV or JSON Lines. The file is read
+# row by row and written in batches: each batch costs one query to find the
+# SKUs that already exist plus one bulk INSERT and one bulk UPDATE, so memory
+# and per-row cost stay flat however large the file is. Rows that fail
+# validation are reported with their line number and skipped; the rest of
+# the file is still imported.
+
+import csv
+import io
+import json
+from collections import Counter
+
+from django import forms
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+
+from orders.models import Cart
+from stores.models import Store
+from . import facets, inventory
+from .forms import ProductForm
+from .models import Category, Product, _facet_key
+from .signals import _products_changed_on_commit
+
+
+FORMATS = ("csv", "jsonl")
+IMPORT_BATCH_SIZE = 500
+MAX_REPORTED_ERRORS = 1000
+
+# Columns written on both create and update.
+UPDATE_FIELDS = ["name", "description", "price", "stock", "store", "category", "is_active", "updated_at"]
+
+
+class ImportFileError(ValueError):
+    """The file as a whole cannot be imported (unknown format, bad header)."""
+
+
+class ProductImportRowForm(forms.Form):
+    """
+    One import row: the ProductForm field rules, plus `sku`, `category` and
+    `is_active`. Store and category are given by name and resolved by the
+    importer, not by the form.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        own_fields = [name for name in ProductForm._meta.fields if name not in ("store", "image")]
+        self.fields.update(forms.fields_for_model(Product, fields=["sku", *own_fields]))
+        self.fields["store"] = forms.CharField(required=False)
+        self.fields["category"] = forms.CharField(required=False)
+        self.fields["is_active"] = forms.NullBooleanField(required=False)
+
+
+class ImportResult:
+    """Counts and per-row errors (the first MAX_REPORTED_ERRORS are kept)."""
+
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.error_count = 0
+        self.errors = []
+
+    def add_error(self, line, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, message))
+
+    def __str__(self):
+        return f"{self.created} created, {self.updated} updated, {self.error_count} rows rejected"
+
+
+def detect_format(filename):
+    return "jsonl" if filename.lower().endswith((".jsonl", ".ndjson", ".json")) else "csv"
+
+
+def iter_rows(stream, fmt):
+    """
+    Yield (line number, row dict or None, error or None) from a text stream,
+    one row at a time.
+    """
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        if not reader.fieldnames or "sku" not in reader.fieldnames:
+            raise ImportFileError("The CSV header must include a 'sku' column.")
+        for row in reader:
+            row.pop(None, None)  # values beyond the header
+            yield reader.line_num, row, None
+    elif fmt == "jsonl":
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as exc:
+                yield line_number, None, f"Invalid JSON: {exc}"
+                continue
+            if not isinstance(row, dict):
+                yield line_number, None, "Each line must be a JSON object."
+                continue
+            yield line_number, row, None
+    else:
+        raise ImportFileError(f"Unknown format {fmt!r}; expected one of {', '.join(FORMATS)}.")
+
+
+def _form_errors(form):
+    return "; ".join(
+        f"{field}: {' '.join(messages)}" if field != "__all__" else " ".join(messages)
+        for field, messages in form.errors.items()
+    )
+
+
+class ProductImporter:
+    """
+    Import products for `seller`. Stores are matched by name among the
+    seller's own stores (a seller with a single store may leave it blank)
+    and categories by name or slug; each is loaded with one query up front.
+    """
+
+    def __init__(self, seller, batch_size=IMPORT_BATCH_SIZE):
+        self.seller = seller
+        self.batch_size = batch_size
+        self.stores = {
+            name.casefold(): pk
+            for pk, name in Store.objects.filter(owner=seller).values_list("id", "name")
+        }
+        self.categories = {}
+        for pk, name, slug in Category.objects.values_list("id", "name", "slug"):
+            self.categories[name.casefold()] = pk
+            self.categories[slug.casefold()] = pk
+
+    def run(self, stream, fmt):
+        """Import every row of the text `stream`; returns an ImportResult."""
+        result = ImportResult()
+        batch = {}
+        for line_number, row, error in iter_rows(stream, fmt):
+            if error:
+                result.add_error(line_number, error)
+                continue
+            cleaned = self.clean_row(row, line_number, result)
+            if cleaned is None:
+                continue
+            # A SKU repeated in one batch: the later row wins.
+            batch[cleaned["sku"]] = (line_number, cleaned)
+            if len(batch) >= self.batch_size:
+                self.write_batch(batch, result)
+                batch = {}
+        if batch:
+            self.write_batch(batch, result)
+        return result
+
+    def clean_row(self, row, line_number, result):
+        row = {key.strip(): value for key, value in row.items() if key}
+        form = ProductImportRowForm(row)
+        if not form.is_valid():
+            result.add_error(line_number, _form_errors(form))
+            return None
+        cleaned = form.cleaned_data
+
+        store_name = (cleaned["store"] or "").strip()
+        if store_name:
+            store_id = self.stores.get(store_name.casefold())
+        elif len(self.stores) == 1:
+            store_id = next(iter(self.stores.values()))
+        else:
+            store_id = None
+        if store_id is None:
+            result.add_error(line_number, f"store: {store_name or '(blank)'!r} is not one of your stores.")
+            return None
+
+        category_name = (cleaned["category"] or "").strip()
+        category_id = None
+        if category_name:
+            category_id = self.categories.get(category_name.casefold())
+            if category_id is None:
+                result.add_error(line_number, f"category: unknown category {category_name!r}.")
+                return None
+
+        return {
+            "sku": cleaned["sku"].strip(),
+            "name": cleaned["name"],
+            "description": cleaned["description"],
+            "price": cleaned["price"],
+            "stock": cleaned["stock"],
+            "store_id": store_id,
+            "category_id": category_id,
+            "is_active": True if cleaned["is_active"] is None else cleaned["is_active"],
+        }
+
+    def write_batch(self, batch, result):
+        existing = {
+            p.sku: p
+            for p in Product.objects.filter(sku__in=list(batch)).annotate(live=inventory.live_stock())
+        }
+        for product in existing.values():
+            if product.stock_shards:
+                # Compare the file against the stock as sold, not the column.
+                product.stock = product.live
+                product._saved_stock = (product.stock_shards, product.live)
+        now = timezone.now()
+        to_create, to_update, repriced = [], [], []
+        facet_deltas = Counter()
+
+        for sku, (line_number, values) in batch.items():
+            product = existing.get(sku)
+            if product is None:
+                product = Product(seller=self.seller, **values)
+                to_create.append(product)
+            elif product.seller_id != self.seller.pk:
+                result.add_error(line_number, f"sku: {sku!r} belongs to another seller.")
+                continue
+            else:
+                facet_deltas[product._saved_facet] -= 1
+                old_price = product.price
+                for field, value in values.items():
+                    setattr(product, field, value)
+                if product.price != old_price:
+                    repriced.append(product.pk)
+                product.updated_at = now
+                to_update.append(product)
+            facet_deltas[_facet_key(product)] += 1
+
+        try:
+            with transaction.atomic():
+                Product.objects.bulk_create(to_create)
+                Product.objects.bulk_update(to_update, UPDATE_FIELDS)
+                for product in to_update:
+                    inventory.product_saved(product)  # no-op unless the stock is sharded
+                facets.apply_deltas(facet_deltas)
+                # Bulk writes send no signals: refresh cart totals, cache and
+                # search index here.
+                if repriced:
+                    Cart.objects.filter(items__product__in=repriced).refresh_totals()
+                _products_changed_on_commit(
+                    Product.objects.filter(sku__in=[p.sku for p in to_create + to_update])
+                    .values_list("id", flat=True)
+                )
+        except DatabaseError as exc:
+            # e.g. another seller claimed one of the SKUs meanwhile
+            for sku, (line_number, _) in batch.items():
+                if sku in existing and existing[sku].seller_id != self.seller.pk:
+                    continue  # already reported
+                result.add_error(line_number, f"Not saved, batch failed: {exc}")
+            return
+
+        result.created += len(to_create)
+        result.updated += len(to_update)
+
+
+def import_products(seller, file, fmt, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Import a binary file object (an upload or an open file) in `fmt`.
+    Raises ImportFileError if the file as a whole cannot be read.
+    """
+    stream = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    try:
+        return ProductImporter(seller, batch_size=batch_size).run(stream, fmt)
+    except UnicodeDecodeError as exc:
+        raise ImportFileError(f"The file is not valid UTF-8: {exc}") from None
+    finally:
+        stream.detach()
@@ -0,0 +1,231 @@
+# products/inventory.py
+#
+# Sharded stock counters for hot products. Normally checkout decrements
+# Product.stock, so every sale of a popular product rewrites the same row and
+# concurrent checkouts queue up behind its lock. A product with
+# `stock_shards = N` keeps its stock in N StockShard rows instead: checkout
+# takes units from a random shard with a guarded UPDATE and falls back to the
+# others, so concurrent sales mostly touch different rows.
+#
+# The shards are then the source of truth and a sale never writes the
+# product row: Product.stock is their sum as of the last consolidation
+# (`manage.py rebalance_stock_shards`, which also evens the shards out
+# again), or 0 once a sale empties them (sold_out). So `stock > 0` still
+# answers "in stock?" (search filters, the in_stock facet), but anything
+# that shows the figure uses live_stock(), and a product loaded for editing
+# gets it from use_live_stock(). Stock edits are checked against the
+# shards so a figure read before a sale cannot bring sold units back
+# (StaleStock).
+
+import random
+
+from django.db import DatabaseError, transaction
+from django.db.models import Case, F, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+
+from . import facets
+from .models import Product, StockShard, _facet_key
+
+
+class StaleStock(DatabaseError):
+    """A sharded stock write was based on a figure that sales have since changed."""
+
+
+def live_stock():
+    """
+    Expression for a Product queryset: the shard sum for sharded products,
+    Product.stock for the rest.
+    """
+    shard_sum = (
+        StockShard.objects.filter(product=OuterRef("pk"))
+        .order_by()
+        .values("product")
+        .annotate(total=Sum("stock"))
+        .values("total")
+    )
+    return Case(
+        When(stock_shards=0, then=F("stock")),
+        default=Coalesce(Subquery(shard_sum), 0),
+        output_field=IntegerField(),
+    )
+
+
+def stock_levels(product_ids):
+    """{product_id: current stock} for the given ids, in one query."""
+    return dict(
+        Product.objects.filter(id__in=product_ids)
+        .annotate(live=live_stock())
+        .values_list("id", "live")
+    )
+
+
+def spread(product_id, shards, total, expected=None):
+    """
+    Set the product's shards to `total` units split evenly over `shards`
+    rows. With `expected`, the stock figure the write was based on, raise
+    StaleStock instead if the shards no longer add up to it.
+    """
+    if expected is not None:
+        current = sum(
+            StockShard.objects.select_for_update().filter(product_id=product_id)
+            .values_list("stock", flat=True)
+        )
+        if current != expected:
+            raise StaleStock(
+                f"Stock of product {product_id} changed from {expected} to {current} meanwhile."
+            )
+    StockShard.objects.filter(product_id=product_id, shard__gte=shards).delete()
+    if shards:
+        base, extra = divmod(total, shards)
+        StockShard.objects.bulk_create(
+            [
+                StockShard(product_id=product_id, shard=n, stock=base + (n < extra))
+                for n in range(shards)
+            ],
+            update_conflicts=True,
+            unique_fields=["product", "shard"],
+            update_fields=["stock"],
+        )
+
+
+def product_saved(product):
+    """
+    Post-save hook: when a sharded product is saved with a new stock figure
+    or shard count (a seller edit, an import, set_shards), spread the stock
+    over its shards. Raises StaleStock if the product was already sharded
+    and has sold units since it was loaded; call inside a transaction so
+    the save is rolled back with it.
+    """
+    values = product.__dict__
+    if "stock" not in values or "stock_shards" not in values:
+        return
+    current = (product.stock_shards, product.stock)
+    saved = getattr(product, "_saved_stock", (None, None))
+    if current != saved and (product.stock_shards or saved[0]):
+        spread(product.pk, product.stock_shards, product.stock, expected=saved[1] if saved[0] else None)
+    product._saved_stock = current
+
+
+def use_live_stock(product):
+    """
+    For a sharded product about to be edited: set its stock to the shards'
+    current total, the figure an edit is then based on.
+    """
+    if product.stock_shards:
+        product.stock = stock_levels([product.pk])[product.pk]
+        product._saved_stock = (product.stock_shards, product.stock)
+    return product
+
+
+def _shard_total():
+    """Expression for a StockShard queryset: the total over the row's product."""
+    return Subquery(
+        StockShard.objects.filter(product=OuterRef("product_id"))
+        .order_by()
+        .values("product")
+        .annotate(total=Sum("stock"))
+        .values("total")
+    )
+
+
+def take(product_id, quantity, shards, held=None):
+    """
+    Take `quantity` units from the product's shards without touching the
+    product row. `held` is an expression over a StockShard row: units of
+    its product held by other carts, which must be left unsold.
+
+    The first try is one UPDATE of a random shard that alone covers the
+    held units and more than `quantity`, a stricter test than the
+    product's total, so it needs no sum and cannot empty a shard. Failing
+    that, the fullest shards in turn, guarded by the product's total and
+    splitting the quantity over several if need be; if that empties a
+    shard, sold_out() checks the others. Returns False if the shards
+    together cannot cover it, in which case the caller must roll back any
+    units already taken. Call inside a transaction.
+    """
+    shard_rows = StockShard.objects.filter(product_id=product_id).alias(
+        held=Value(0) if held is None else held
+    )
+    fast = shard_rows.filter(shard=random.randrange(shards), stock__gt=F("held") + quantity)
+    if fast.update(stock=F("stock") - quantity):
+        return True
+
+    remaining = quantity
+    emptied = False
+    rows = shard_rows.filter(stock__gt=0).order_by("-stock").values_list("shard", "stock")
+    for shard, stock in list(rows):
+        units = min(stock, remaining)
+        # Taking `units` still leaves the rest of the line covered
+        guarded = shard_rows.alias(total=_shard_total()).filter(
+            shard=shard, stock__gte=units, total__gte=F("held") + remaining
+        )
+        if guarded.update(stock=F("stock") - units):
+            remaining -= units
+            emptied = emptied or units == stock
+            if not remaining:
+                if emptied:
+                    sold_out(product_id)
+                return True
+    return False
+
+
+def sold_out(product_id):
+    """
+    After a sale that may have emptied a sharded product's shards: if it
+    did, set Product.stock to 0 and move the product to the out-of-stock
+    facet. The only product row write on the sale path, once per sell-out;
+    a sell-out missed by racing sales is caught by rebalance().
+    """
+    if StockShard.objects.filter(product_id=product_id, stock__gt=0).exists():
+        return
+    if Product.objects.filter(pk=product_id, stock__gt=0).update(stock=0):
+        facets.stock_sold_out([product_id])
+
+
+def rebalance(product_ids=None):
+    """
+    Consolidate sharded products: write each one's shard sum to
+    Product.stock (moving its facet and refreshing caches) and spread it
+    evenly over the shards again. Returns the number of products.
+    """
+    from .signals import _products_changed_on_commit  # signals imports this module
+
+    products = Product.objects.filter(stock_shards__gt=0)
+    if product_ids is not None:
+        products = products.filter(id__in=product_ids)
+
+    count = 0
+    for product_id in list(products.values_list("id", flat=True)):
+        with transaction.atomic():
+            # Lock the shards so no sale lands between the sum and the spread.
+            total = sum(
+                StockShard.objects.select_for_update().filter(product_id=product_id)
+                .values_list("stock", flat=True)
+            )
+            product = Product.objects.get(pk=product_id)
+            spread(product_id, product.stock_shards, total)
+            if product.stock != total:
+                Product.objects.filter(pk=product_id).update(stock=total)
+                old_key = product._saved_facet
+                product.stock = total
+                facets.move(old_key, _facet_key(product))
+                _products_changed_on_commit([product_id])
+        count += 1
+    return count
+
+
+def set_shards(product, shards):
+    """
+    Start (shards > 0), resize or stop (0) sharding `product`'s stock,
+    keeping its current total.
+    """
+    with transaction.atomic():
+        list(StockShard.objects.select_for_update().filter(product_id=product.pk).values_list("id"))
+        # The live figure is what this write is based on, whenever `product` was loaded.
+        product._saved_stock = (
+            Product.objects.filter(pk=product.pk).annotate(live=live_stock())
+            .values_list("stock_shards", "live").get()
+        )
+        product.stock = product._saved_stock[1]
+        product.stock_shards = shards
+        product.save(update_fields=["stock", "stock_shards", "updated_at"])
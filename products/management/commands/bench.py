@@ -0,0 +1,136 @@
+import os
+import tempfile
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from products import bench
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway database and drive browse -> cart -> checkout "
+        "scenarios through the URLconf, reporting latency and query counts."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--products", type=int, default=1000)
+        parser.add_argument("--reviews-per-product", type=int, default=5)
+        parser.add_argument("--buyers", type=int, default=20)
+        parser.add_argument("--iterations", type=int, default=20,
+                            help="Iterations of each scenario per worker.")
+        parser.add_argument("--workers", type=int, default=1)
+        parser.add_argument("--processes", action="store_true",
+                            help="Use forked processes instead of threads for workers.")
+        parser.add_argument("--scenario", action="append", choices=sorted(bench.SCENARIOS),
+                            help="Scenario to run (repeatable); defaults to all.")
+        parser.add_argument("--output", help="Write the JSON report to this file.")
+        parser.add_argument("--compare-deployments", action="store_true",
+                            help="Compare the catalog read path under WSGI and ASGI instead.")
+        parser.add_argument("--requests", type=int, default=600,
+                            help="Requests per deployment with --compare-deployments.")
+        parser.add_argument("--concurrency", type=int, default=64,
+                            help="Clients in flight with --compare-deployments.")
+        parser.add_argument("--wsgi-threads", type=int, default=8,
+                            help="WSGI worker threads with --compare-deployments.")
+        parser.add_argument("--stock-contention", action="store_true",
+                            help="Race concurrent checkouts of one product, single-row vs sharded stock.")
+        parser.add_argument("--hot-stock", type=int, default=2000,
+                            help="Units of the hot product with --stock-contention.")
+        parser.add_argument("--threads", type=int, default=8,
+                            help="Concurrent buyers with --stock-contention.")
+        parser.add_argument("--shards", type=int, default=8,
+                            help="Stock shards for the sharded run with --stock-contention.")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite" and options["processes"]:
+            raise CommandError("--processes is only supported on SQLite.")
+
+        setup_test_environment()
+        tmpdir = tempfile.mkdtemp(prefix="bench-")
+        if connection.vendor == "sqlite":
+            # A file, not :memory:, so threads and processes share one DB;
+            # concurrent writers wait for the lock instead of failing.
+            connection.settings_dict.setdefault("TEST", {})["NAME"] = os.path.join(tmpdir, "bench.sqlite3")
+            connection.settings_dict["OPTIONS"].update(timeout=30, transaction_mode="IMMEDIATE")
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            self.stdout.write("Seeding dataset...")
+            dataset = bench.seed(
+                products=options["products"],
+                reviews_per_product=options["reviews_per_product"],
+                buyers=options["buyers"],
+            )
+            if options["stock_contention"]:
+                report = bench.stock_contention(
+                    dataset,
+                    stock=options["hot_stock"],
+                    threads=options["threads"],
+                    shards=options["shards"],
+                )
+            elif options["compare_deployments"]:
+                report = bench.compare_deployments(
+                    dataset,
+                    requests=options["requests"],
+                    concurrency=options["concurrency"],
+                    wsgi_threads=options["wsgi_threads"],
+                )
+            else:
+                report = bench.run(
+                    dataset,
+                    scenarios=options["scenario"],
+                    iterations=options["iterations"],
+                    workers=options["workers"],
+                    processes=options["processes"],
+                )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        if options["stock_contention"]:
+            self.write_contention(report)
+        elif options["compare_deployments"]:
+            self.write_deployments(report)
+        else:
+            self.write_scenarios(report)
+
+        if options["output"]:
+            bench.save(report, options["output"])
+            self.stdout.write(self.style.SUCCESS(f"Saved report to {options['output']}"))
+
+    def write_deployments(self, report):
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{report['requests']} catalog requests, {report['concurrency']} in flight "
+            f"(WSGI with {report['wsgi_threads']} threads)"
+        ))
+        for name in ("wsgi", "asgi"):
+            result = report[name]
+            self.stdout.write(
+                f"  {name.upper():<5} {result['throughput_rps']:>9.2f} req/s  p50 {result['p50_ms']:>8.2f}ms  "
+                f"p95 {result['p95_ms']:>8.2f}ms  p99 {result['p99_ms']:>8.2f}ms  errors {result['errors']}"
+            )
+
+    def write_contention(self, report):
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{report['stock']} units of one product, {report['threads']} concurrent buyers"
+        ))
+        for name in ("single_row", "sharded"):
+            result = report[name]
+            label = name if name == "single_row" else f"{name} ({report['shards']})"
+            self.stdout.write(
+                f"  {label:<12} {result['throughput_rps']:>9.2f} orders/s  p50 {result['p50_ms']:>8.2f}ms  "
+                f"p95 {result['p95_ms']:>8.2f}ms  retries {result['errors']}  "
+                f"sold {result['units_sold']}  left {result['remaining']}  oversold {result['oversold']}"
+            )
+
+    def write_scenarios(self, report):
+        for scenario, result in report["scenarios"].items():
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"{scenario}: {result['requests']} requests, {result['throughput_rps']} req/s"
+            ))
+            for name, view in result["views"].items():
+                self.stdout.write(
+                    f"  {name:<24} p50 {view['p50_ms']:>8.2f}ms  p95 {view['p95_ms']:>8.2f}ms  "
+                    f"p99 {view['p99_ms']:>8.2f}ms  queries {view['queries_mean']:>6.1f} (max {view['queries_max']})"
+                )
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from products import renditions
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Render WebP/JPEG renditions for product images that have none yet "
+        "(uploads the worker pool was too busy for, or lost on a restart)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true",
+                            help="Re-render every product image, not just missing ones.")
+
+    def handle(self, *args, **options):
+        products = renditions.missing()
+        if options["all"]:
+            products = Product.objects.exclude(image="").exclude(image__isnull=True)
+
+        done = failed = 0
+        for product in products.iterator():
+            try:
+                renditions.generate(product)
+            except (OSError, ValueError) as exc:  # missing or unreadable image
+                failed += 1
+                self.stderr.write(f"Product {product.pk}: {exc}")
+            else:
+                done += 1
+        self.stdout.write(self.style.SUCCESS(f"Rendered {done} product images, {failed} failed"))
@@ -0,0 +1,33 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from products.importer import FORMATS, IMPORT_BATCH_SIZE, ImportFileError, detect_format, import_products
+
+
+class Command(BaseCommand):
+    help = "Create or update a seller's products from a CSV or JSON Lines file, upserting by SKU."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--seller", required=True, help="Username of the seller the products belong to.")
+        parser.add_argument("--format", choices=FORMATS, help="Defaults to the file extension.")
+        parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            seller = get_user_model().objects.get(username=options["seller"], is_seller=True)
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"No seller named {options['seller']!r}.")
+
+        fmt = options["format"] or detect_format(options["path"])
+        try:
+            with open(options["path"], "rb") as fh:
+                result = import_products(seller, fh, fmt, batch_size=options["batch_size"])
+        except (OSError, ImportFileError) as exc:
+            raise CommandError(str(exc))
+
+        for line, message in result.errors:
+            self.stderr.write(f"line {line}: {message}")
+        if result.error_count > len(result.errors):
+            self.stderr.write(f"... and {result.error_count - len(result.errors)} more")
+        self.stdout.write(self.style.SUCCESS(f"Imported: {result}"))
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from products import inventory
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Consolidate sharded stock: write each sharded product's shard sum to "
+        "Product.stock and spread it evenly over its shards again. With --shards, "
+        "start, resize or stop (0) sharding the given products instead."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--product", type=int, action="append", dest="products",
+                            help="Product id (repeatable); defaults to every sharded product.")
+        parser.add_argument("--shards", type=int,
+                            help="Set the number of stock shards for the given products.")
+
+    def handle(self, *args, **options):
+        if options["shards"] is None:
+            count = inventory.rebalance(options["products"])
+            self.stdout.write(self.style.SUCCESS(f"Rebalanced {count} sharded products"))
+            return
+
+        if not options["products"]:
+            raise CommandError("--shards needs at least one --product.")
+        if options["shards"] < 0:
+            raise CommandError("--shards cannot be negative.")
+        products = list(Product.objects.filter(id__in=options["products"]))
+        if len(products) != len(set(options["products"])):
+            raise CommandError("Unknown product id.")
+        for product in products:
+            inventory.set_shards(product, options["shards"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Set {len(products)} products to {options['shards']} stock shards"
+        ))
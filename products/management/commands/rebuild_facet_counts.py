@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from products import facets
+from products.models import ProductFacetCount
+
+
+class Command(BaseCommand):
+    help = "Recount ProductFacetCount from the Product table (after bulk loads or drift)."
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            facets.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt {ProductFacetCount.objects.count()} facet rows"
+        ))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from products.models import Product
+from products.search import get_backend
+
+
+class Command(BaseCommand):
+    help = "Reindex every product in the search backend, in id batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        last_id = 0
+        indexed = 0
+
+        while True:
+            ids = list(
+                Product.objects.filter(id__gt=last_id)
+                .order_by("id")
+                .values_list("id", flat=True)[:options["batch_size"]]
+            )
+            if not ids:
+                break
+            last_id = ids[-1]
+
+            backend.index(ids)
+            indexed += len(ids)
+
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} products"))
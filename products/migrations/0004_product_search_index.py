@@ -0,0 +1,37 @@
+# Full-text search index for products (see products/search.py)
+
+from django.db import migrations
+
+
+def create_fts_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS products_product_fts "
+        "USING fts5(name, description, sku, category, store, tokenize = 'unicode61')"
+    )
+    schema_editor.execute(
+        "INSERT INTO products_product_fts (rowid, name, description, sku, category, store) "
+        "SELECT p.id, p.name, p.description, p.sku, COALESCE(c.name, ''), s.name "
+        "FROM products_product p "
+        "JOIN stores_store s ON s.id = p.store_id "
+        "LEFT JOIN products_category c ON c.id = p.category_id"
+    )
+
+
+def drop_fts_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS products_product_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_product_created_at_id_index'),
+        ('stores', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_index, drop_fts_index),
+    ]
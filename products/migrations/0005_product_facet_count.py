@@ -0,0 +1,60 @@
+# Generated by Django 6.0 on 2026-10-17 17:29
+
+import bisect
+from collections import Counter
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Copied from products.models, so later changes there cannot alter this migration.
+PRICE_BANDS = getattr(settings, 'PRODUCT_PRICE_BANDS', [10, 25, 50, 100, 250])
+
+
+def price_band(price):
+    return bisect.bisect_right(PRICE_BANDS, price)
+
+
+def backfill_facet_counts(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    ProductFacetCount = apps.get_model('products', 'ProductFacetCount')
+    counts = Counter(
+        (category_id, store_id, price_band(price), stock > 0)
+        for category_id, store_id, price, stock in Product.objects.filter(is_active=True)
+        .values_list('category_id', 'store_id', 'price', 'stock')
+        .iterator(chunk_size=5000)
+    )
+    ProductFacetCount.objects.bulk_create(
+        [
+            ProductFacetCount(category_id=c, store_id=s, price_band=b, in_stock=i, count=n)
+            for (c, s, b, i), n in counts.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0004_product_search_index'),
+        ('stores', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductFacetCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('price_band', models.PositiveSmallIntegerField()),
+                ('in_stock', models.BooleanField()),
+                ('count', models.IntegerField(default=0)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='products.category')),
+                ('store', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='stores.store')),
+            ],
+            options={
+                'unique_together': {('category', 'store', 'price_band', 'in_stock')},
+            },
+        ),
+        migrations.RunPython(backfill_facet_counts, migrations.RunPython.noop),
+    ]
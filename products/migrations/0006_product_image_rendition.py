@@ -0,0 +1,30 @@
+# Generated by Django 6.0 on 2026-10-17 17:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0005_product_facet_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductImageRendition',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_name', models.CharField(max_length=255)),
+                ('width', models.PositiveIntegerField()),
+                ('height', models.PositiveIntegerField()),
+                ('format', models.CharField(choices=[('webp', 'WebP'), ('jpeg', 'JPEG')], max_length=10)),
+                ('file', models.FileField(max_length=255, upload_to='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='renditions', to='products.product')),
+            ],
+            options={
+                'unique_together': {('product', 'format', 'width')},
+            },
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 6.0 on 2026-10-17 18:46
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_uncategorized_duplicates(apps, schema_editor):
+    """Fold duplicate NULL-category rows into one, summing their counts."""
+    ProductFacetCount = apps.get_model('products', 'ProductFacetCount')
+    duplicates = (
+        ProductFacetCount.objects.filter(category__isnull=True)
+        .values('store_id', 'price_band', 'in_stock')
+        .annotate(rows=Count('id'), keep=Min('id'), total=Sum('count'))
+        .filter(rows__gt=1)
+    )
+    for group in duplicates:
+        rows = ProductFacetCount.objects.filter(
+            category__isnull=True, store_id=group['store_id'],
+            price_band=group['price_band'], in_stock=group['in_stock'],
+        )
+        rows.exclude(id=group['keep']).delete()
+        rows.filter(id=group['keep']).update(count=group['total'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0008_access_path_indexes'),
+        ('stores', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_uncategorized_duplicates, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='productfacetcount',
+            unique_together=set(),
+        ),
+        migrations.AddConstraint(
+            model_name='productfacetcount',
+            constraint=models.UniqueConstraint(condition=models.Q(('category__isnull', False)), fields=('category', 'store', 'price_band', 'in_stock'), name='product_facet_count_unique'),
+        ),
+        migrations.AddConstraint(
+            model_name='productfacetcount',
+            constraint=models.UniqueConstraint(condition=models.Q(('category__isnull', True)), fields=('store', 'price_band', 'in_stock'), name='product_facet_count_uncategorized_unique'),
+        ),
+    ]
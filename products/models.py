@@ -1,3 +1,5 @@
+import bisect
+
 from django.db import models
 from django.conf import settings
 from stores.models import Store
@@ -24,6 +26,8 @@ class Product(models.Model):
     description = models.TextField(blank=True)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.PositiveIntegerField(default=0)
+    # Opt-in: split stock over this many StockShard rows (0 = not sharded)
+    stock_shards = models.PositiveSmallIntegerField(default=0)
     store = models.ForeignKey(Store, on_delete=models.CASCADE, related_name="products") 
     sku = models.CharField(max_length=50, unique=True)
     category = models.ForeignKey(
@@ -41,6 +45,125 @@ class Product(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination of the catalog: active products only,
+            # ORDER BY -created_at, -id
+            models.Index(
+                fields=['created_at', 'id'],
+                condition=models.Q(is_active=True),
+                name='product_active_created_idx',
+            ),
+            # Seller dashboard and per-store listings, newest first
+            models.Index(fields=['seller', 'created_at']),
+            models.Index(fields=['store', 'created_at']),
+        ]
 
     def __str__(self):
         return self.name
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Facet key this product is currently counted under (products/facets.py)
+        instance._saved_facet = _facet_key(instance)
+        # Image name as loaded, to notice uploads (products/renditions.py)
+        instance._saved_image = instance.__dict__.get("image") or None
+        # Stock as loaded, to notice edits to sharded stock (products/inventory.py)
+        instance._saved_stock = (instance.__dict__.get("stock_shards"), instance.__dict__.get("stock"))
+        return instance
+
+
+PRICE_BANDS = getattr(settings, "PRODUCT_PRICE_BANDS", [10, 25, 50, 100, 250])
+
+
+def price_band(price):
+    """Index of the band `price` falls in: 0 is below PRICE_BANDS[0]."""
+    return bisect.bisect_right(PRICE_BANDS, price)
+
+
+def _facet_key(product):
+    """
+    (category_id, store_id, price_band, in_stock) the product counts under,
+    None if it is inactive, or "unknown" if fields were deferred.
+    """
+    values = product.__dict__
+    if any(name not in values for name in ("is_active", "category_id", "store_id", "price", "stock")):
+        return "unknown"
+    if not values["is_active"] or values["price"] is None:
+        return None
+    return (values["category_id"], values["store_id"], price_band(values["price"]), values["stock"] > 0)
+
+
+class ProductFacetCount(models.Model):
+    """
+    Number of active products per (category, store, price band, in stock)
+    combination. Maintained incrementally by the Product signals and
+    rebuilt by `manage.py rebuild_facet_counts` (see products/facets.py).
+    """
+    category = models.ForeignKey(Category, null=True, blank=True, on_delete=models.CASCADE)
+    store = models.ForeignKey(Store, on_delete=models.CASCADE)
+    price_band = models.PositiveSmallIntegerField()
+    in_stock = models.BooleanField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # Two constraints, as NULLs never clash in a plain unique constraint
+            models.UniqueConstraint(
+                fields=['category', 'store', 'price_band', 'in_stock'],
+                condition=models.Q(category__isnull=False),
+                name='product_facet_count_unique',
+            ),
+            models.UniqueConstraint(
+                fields=['store', 'price_band', 'in_stock'],
+                condition=models.Q(category__isnull=True),
+                name='product_facet_count_uncategorized_unique',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.category_id}/{self.store_id}/{self.price_band}/{self.in_stock}: {self.count}"
+
+
+class StockShard(models.Model):
+    """
+    One slice of a sharded product's stock. Checkout decrements a random
+    shard, so concurrent sales of the product update different rows; see
+    products/inventory.py.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_shard_rows')
+    shard = models.PositiveSmallIntegerField()
+    stock = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('product', 'shard')
+
+    def __str__(self):
+        return f"{self.product_id}#{self.shard}: {self.stock}"
+
+
+class ProductImageRendition(models.Model):
+    """
+    A resized copy of a product's image, in one width and format. Files are
+    named after the source image's content hash; `source_name` is the
+    Product.image name they were made from, so renditions of a replaced
+    image are never served (see products/renditions.py).
+    """
+    FORMAT_CHOICES = [
+        ('webp', 'WebP'),
+        ('jpeg', 'JPEG'),
+    ]
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='renditions')
+    source_name = models.CharField(max_length=255)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    format = models.CharField(max_length=10, choices=FORMAT_CHOICES)
+    file = models.FileField(max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('product', 'format', 'width')
+
+    def __str__(self):
+        return f"{self.product_id} {self.width}w {self.format}"
@@ -0,0 +1,120 @@
+# products/page_cache.py
+#
+# Full-page cache for the catalog pages seen by anonymous visitors. A
+# visitor with no session cookie (so nobody logged in, no session-held
+# cart or messages) gets the same page as every other such visitor, bar
+# the per-request bits:
+#
+#   the CSRF token   - cut out of the stored body, and filled in with a
+#                      fresh get_token() for each visitor
+#   the cart badge   - <span data-cart-count> in base.html, likewise cut
+#                      out and filled in from the guest cart cookie
+#   flash messages   - <div data-messages> in base.html, cut out and
+#                      filled in with the visitor's messages, if any
+#
+# A hit is answered from the cache alone, without touching the database,
+# including 304s for the validators stored with the page. The
+# cache_anonymous_page decorator that serves it lives with the validators
+# in products/conditional.py; this module is the store and the purges, and
+# imports nothing from the apps so that any of them can purge.
+#
+# Pages are cached per path and query string under a per-path version, so
+# a purge is one cache write whatever the query strings. Product, store,
+# stock and review changes purge the affected product pages and the list
+# (purge_products / purge_product_pages); holds that merely expire are
+# caught by the next `release_expired_reservations` run or by
+# PAGE_CACHE_TIMEOUT.
+
+import hashlib
+import re
+import time
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import caches
+from django.middleware.csrf import get_token
+from django.template.loader import render_to_string
+from django.urls import reverse
+
+
+PAGE_CACHE_ALIAS = getattr(settings, "PAGE_CACHE_ALIAS", "default")
+PAGE_CACHE_TIMEOUT = getattr(settings, "PAGE_CACHE_TIMEOUT", 10 * 60)
+
+CSRF_INPUT = re.compile(rb'(name="csrfmiddlewaretoken" value=")[^"]*(")')
+CART_BADGE = re.compile(rb"(<span data-cart-count>)\d+(</span>)")
+MESSAGES = re.compile(rb"(<div data-messages>).*?(</div>)", re.DOTALL)
+# Autoescaped page content can never contain "<!--"
+CSRF_HOLE = b"<!--page-cache:csrf-->"
+CART_HOLE = b"<!--page-cache:cart-->"
+MESSAGES_HOLE = b"<!--page-cache:messages-->"
+
+
+def _cache():
+    return caches[PAGE_CACHE_ALIAS]
+
+
+def _version_key(path):
+    return f"page-version:{path}"
+
+
+def _page_key(path, version, query):
+    return f"page:{path}:{version}:{hashlib.md5(query.encode()).hexdigest()}"
+
+
+def cacheable(request):
+    """Whether the request may be served from (and stored in) the cache."""
+    return (
+        request.method in ("GET", "HEAD")
+        and settings.SESSION_COOKIE_NAME not in request.COOKIES
+    )
+
+
+def key_for(request):
+    cache = _cache()
+    version_key = _version_key(request.path)
+    version = cache.get(version_key)
+    if version is None:
+        version = time.time_ns()
+        if not cache.add(version_key, version, timeout=None):
+            version = cache.get(version_key, version)
+    return _page_key(request.path, version, request.META.get("QUERY_STRING", ""))
+
+
+def get(key):
+    """(validator parts, timestamp, content type, body) stored under `key`, or None."""
+    return _cache().get(key)
+
+
+def store(key, parts, timestamp, response):
+    """Store a rendered 200 response, with its per-request bits cut out."""
+    body = CSRF_INPUT.sub(rb"\1" + CSRF_HOLE + rb"\2", response.content)
+    body = CART_BADGE.sub(rb"\1" + CART_HOLE + rb"\2", body)
+    body = MESSAGES.sub(rb"\1" + MESSAGES_HOLE + rb"\2", body)
+    _cache().set(key, (parts, timestamp, response["Content-Type"], body), timeout=PAGE_CACHE_TIMEOUT)
+
+
+def fill(request, body, badge):
+    """A stored body with this request's cart badge, messages and CSRF token put back."""
+    body = body.replace(CART_HOLE, str(badge).encode())
+    if MESSAGES_HOLE in body:
+        messages = render_to_string("messages.html", {"messages": get_messages(request)})
+        body = body.replace(MESSAGES_HOLE, messages.encode())
+    if CSRF_HOLE in body:
+        body = body.replace(CSRF_HOLE, get_token(request).encode())
+    return body
+
+
+def purge(paths):
+    """Drop every cached copy of `paths`, whatever their query strings."""
+    version = time.time_ns()
+    _cache().set_many({_version_key(path): version for path in paths}, timeout=None)
+
+
+def purge_product_pages(ids):
+    """Purge the detail pages of the given products."""
+    purge([reverse("product_detail", args=[pid]) for pid in ids])
+
+
+def purge_products(ids):
+    """Purge the given products' pages and the catalog list."""
+    purge([reverse("product_list"), *(reverse("product_detail", args=[pid]) for pid in ids)])
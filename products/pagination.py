@@ -0,0 +1,137 @@
+# products/pagination.py
+#
+# Keyset (cursor) pagination. Pages are fetched with a WHERE on the sort key
+# of the last row seen instead of OFFSET, and nothing is counted, so page N
+# costs the same single indexed range scan as page 1.
+
+import base64
+import json
+
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class KeysetPage:
+    def __init__(self, items, next_cursor=None, previous_cursor=None):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def _split(ordering):
+    return [(name.lstrip("-"), name.startswith("-")) for name in ordering]
+
+
+def encode_token(values):
+    """Pack a list of JSON-serialisable values into an opaque URL-safe token."""
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_token(token):
+    """Inverse of encode_token. Raises InvalidCursor on malformed input."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except Exception as exc:
+        raise InvalidCursor(token) from exc
+    if not isinstance(values, list):
+        raise InvalidCursor(token)
+    return values
+
+
+def encode_cursor(obj, ordering, direction):
+    """Opaque cursor pointing just past `obj` in `direction` ("next"/"prev")."""
+    values = [
+        obj._meta.get_field(name).value_to_string(obj) for name, _ in _split(ordering)
+    ]
+    return encode_token([direction, *values])
+
+
+def decode_cursor(cursor, model, ordering):
+    """Return (direction, values) for a cursor made by encode_cursor."""
+    try:
+        direction, *values = decode_token(cursor)
+        fields = [model._meta.get_field(name) for name, _ in _split(ordering)]
+        if direction not in ("next", "prev") or len(values) != len(fields):
+            raise InvalidCursor(cursor)
+        return direction, [f.to_python(v) for f, v in zip(fields, values)]
+    except InvalidCursor:
+        raise
+    except Exception as exc:
+        raise InvalidCursor(cursor) from exc
+
+
+def _seek(ordering, values, forward):
+    """
+    Rows strictly after (forward) or before the given sort key, as
+    (a < x) OR (a = x AND b < y) OR ... with comparisons flipped per column.
+    """
+    condition = Q()
+    equal = {}
+    for (name, descending), value in zip(_split(ordering), values):
+        lookup = "lt" if descending == forward else "gt"
+        condition |= Q(**equal, **{f"{name}__{lookup}": value})
+        equal[name] = value
+    return condition
+
+
+def _page_query(queryset, cursor, per_page, ordering):
+    """The queryset for one page (per_page + 1 rows) and its direction."""
+    model = queryset.model
+    forward = True
+    if cursor:
+        direction, values = decode_cursor(cursor, model, ordering)
+        forward = direction == "next"
+        queryset = queryset.filter(_seek(ordering, values, forward))
+
+    if forward:
+        queryset = queryset.order_by(*ordering)
+    else:
+        queryset = queryset.order_by(*[
+            name[1:] if name.startswith("-") else f"-{name}" for name in ordering
+        ])
+    return queryset[:per_page + 1], forward
+
+
+def _make_page(rows, cursor, per_page, ordering, forward):
+    more = len(rows) > per_page
+    rows = rows[:per_page]
+    if not forward:
+        rows.reverse()
+
+    if not rows:
+        return KeysetPage(rows)
+
+    has_next = more if forward else True
+    has_previous = bool(cursor) if forward else more
+    return KeysetPage(
+        rows,
+        next_cursor=encode_cursor(rows[-1], ordering, "next") if has_next else None,
+        previous_cursor=encode_cursor(rows[0], ordering, "prev") if has_previous else None,
+    )
+
+
+def paginate_keyset(queryset, cursor=None, per_page=24, ordering=("-created_at", "-id")):
+    """
+    One page of `queryset` ordered by `ordering`, which must be unique (end
+    it with the primary key). Raises InvalidCursor for a malformed cursor.
+    """
+    page_query, forward = _page_query(queryset, cursor, per_page, ordering)
+    return _make_page(list(page_query), cursor, per_page, ordering, forward)
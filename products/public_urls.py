@@ -3,5 +3,7 @@ from . import views
 
 urlpatterns = [
     path('', views.product_list, name='product_list'),
+    path('search/', views.product_search, name='product_search'),
+    path('facets/', views.product_facets, name='product_facets'),
     path('<int:product_id>/', views.product_detail, name='product_detail'),
 ]
\ No newline at end of file
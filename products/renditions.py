@@ -0,0 +1,193 @@
+# products/renditions.py
+#
+# Resized WebP and JPEG renditions of product images, for srcset.
+#
+# When a product gets a new image, schedule() hands the resizing to a small
+# process pool once the save commits, so the upload request never waits on
+# Pillow. Rendition files are named after a hash of the source image, so a
+# URL always serves the same bytes and can be cached forever.
+# ProductImageRendition records what exists; `manage.py generate_renditions`
+# renders whatever is missing (a full pool, a restarted worker). New or
+# deleted renditions change the product's pages, so they purge them from
+# the page cache and move the catalog version (products/conditional.py).
+
+import hashlib
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from django.db.models import Exists, OuterRef
+
+from . import cache as product_cache
+from . import imaging, page_cache
+from .models import Product, ProductImageRendition
+
+
+RENDITION_WIDTHS = getattr(settings, "PRODUCT_IMAGE_WIDTHS", [160, 320, 640, 1280])
+RENDITION_FORMATS = ["webp", "jpeg"]
+RENDITION_QUALITY = getattr(settings, "PRODUCT_IMAGE_QUALITY", 80)
+RENDITION_DIR = "product_images/renditions"
+
+logger = logging.getLogger(__name__)
+
+# Images queued or in progress per worker process; when the pool is that
+# full, schedule() leaves the product to generate_renditions.
+QUEUE_PER_WORKER = 4
+
+_pool = None
+_slots = None
+_pool_lock = threading.Lock()
+
+
+def _executor():
+    global _pool, _slots
+    with _pool_lock:
+        if _pool is None:
+            workers = getattr(settings, "PRODUCT_IMAGE_WORKERS", 2)
+            # spawn, not fork: the web process has threads and open connections
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+            _slots = threading.BoundedSemaphore(workers * QUEUE_PER_WORKER)
+        return _pool, _slots
+
+
+def rendition_name(digest, width, fmt):
+    extension = "jpg" if fmt == "jpeg" else fmt
+    return f"{RENDITION_DIR}/{digest[:32]}-{width}w.{extension}"
+
+
+def _read_source(product):
+    with product.image.storage.open(product.image.name, "rb") as source:
+        return source.read()
+
+
+def _delete_unused(storage, names):
+    in_use = set(ProductImageRendition.objects.filter(file__in=names).values_list("file", flat=True))
+    for name in set(names) - in_use:
+        storage.delete(name)
+
+
+def save_renditions(product_id, source_name, digest, rendered):
+    """
+    Store rendered (width, height, format, bytes) files and make them the
+    product's renditions, unless its image changed while they were made.
+    """
+    storage = Product._meta.get_field("image").storage
+    rows = []
+    for width, height, fmt, content in rendered:
+        name = rendition_name(digest, width, fmt)
+        if not storage.exists(name):  # another product may have the same image
+            name = storage.save(name, ContentFile(content))
+        rows.append(ProductImageRendition(
+            product_id=product_id, source_name=source_name,
+            width=width, height=height, format=fmt, file=name,
+        ))
+
+    with transaction.atomic():
+        current = Product.objects.select_for_update().filter(pk=product_id, image=source_name).exists()
+        old = ProductImageRendition.objects.filter(product_id=product_id)
+        replaced = list(old.values_list("file", flat=True))
+        if current:
+            old.delete()
+            ProductImageRendition.objects.bulk_create(rows)
+            _renditions_changed(product_id)
+    _delete_unused(storage, replaced + [row.file.name for row in rows])
+    return current
+
+
+def generate(product):
+    """Render and store the product's renditions now, in this process."""
+    if not product.image:
+        clear(product.pk)
+        return False
+    data = _read_source(product)
+    rendered = imaging.render(data, RENDITION_WIDTHS, RENDITION_FORMATS, RENDITION_QUALITY)
+    return save_renditions(product.pk, product.image.name, hashlib.sha256(data).hexdigest(), rendered)
+
+
+def schedule(product):
+    """
+    Render the product's renditions in the worker pool. Returns the Future,
+    or None if nothing was queued (no image, or the pool is full; that is
+    logged, and generate_renditions picks the product up later).
+    """
+    if not product.image:
+        clear(product.pk)
+        return None
+    pool, slots = _executor()
+    if not slots.acquire(blocking=False):
+        logger.warning("Rendition pool full; product %s is left to generate_renditions", product.pk)
+        return None
+
+    product_id, source_name = product.pk, product.image.name
+    try:
+        data = _read_source(product)
+        future = pool.submit(imaging.render, data, RENDITION_WIDTHS, RENDITION_FORMATS, RENDITION_QUALITY)
+    except BaseException:
+        slots.release()
+        raise
+    digest = hashlib.sha256(data).hexdigest()
+    caller = threading.get_ident()
+
+    def finished(future):
+        # Usually runs on the pool's result thread, which outlives any
+        # request: close the connection it opens rather than leave it idle.
+        try:
+            save_renditions(product_id, source_name, digest, future.result())
+        except Exception:
+            logger.exception("Renditions for product %s failed; generate_renditions will retry", product_id)
+        finally:
+            slots.release()
+            if threading.get_ident() != caller:
+                connections.close_all()
+
+    future.add_done_callback(finished)
+    return future
+
+
+def clear(product_id):
+    """Delete a product's renditions and their files."""
+    old = ProductImageRendition.objects.filter(product_id=product_id)
+    names = list(old.values_list("file", flat=True))
+    if names:
+        old.delete()
+        _renditions_changed(product_id)
+        _delete_unused(Product._meta.get_field("image").storage, names)
+
+
+def _renditions_changed(product_id):
+    def refresh():
+        product_cache.bump_catalog_version()
+        page_cache.purge_products([product_id])
+    transaction.on_commit(refresh)
+
+
+def missing():
+    """Products with an image but no renditions of it."""
+    return (
+        Product.objects.exclude(image="").exclude(image__isnull=True)
+        .exclude(Exists(ProductImageRendition.objects.filter(product=OuterRef("pk"), source_name=OuterRef("image"))))
+    )
+
+
+def _set_renditions(products, renditions):
+    by_id = {p.pk: p for p in products}
+    for product in products:
+        product.image_renditions = []
+    for rendition in renditions:
+        product = by_id.get(rendition.product_id)
+        if product is not None and rendition.source_name == product.image.name:
+            product.image_renditions.append(rendition)
+
+
+def attach(products):
+    """
+    Set `image_renditions` (ordered by width) on each product that has an
+    image, with one query. The {% product_image %} tag reads it.
+    """
+    products = [p for p in products if p.image]
+    if products:
+        _set_renditions(products, ProductImageRendition.objects.filter(product__in=products).order_by("width", "format"))
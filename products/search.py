@@ -0,0 +1,228 @@
+# products/search.py
+#
+# Product search. A backend indexes the searchable text of a product (name,
+# description, sku, category name, store name) and answers ranked, filtered,
+# keyset-paginated queries. SQLite gets an FTS5 index ranked with BM25;
+# other databases fall back to a plain LIKE backend until they get their own
+# (set PRODUCT_SEARCH_BACKEND to a dotted path to plug one in).
+
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+from .models import Product
+from .pagination import InvalidCursor, KeysetPage, decode_token, encode_token
+
+
+SEARCH_RESULTS_PER_PAGE = 24
+
+
+class SearchFilters:
+    """Optional filters applied on top of the text match."""
+
+    def __init__(self, category=None, store=None, min_price=None, max_price=None, in_stock=False):
+        self.category = category
+        self.store = store
+        self.min_price = min_price
+        self.max_price = max_price
+        self.in_stock = in_stock
+
+    def apply(self, queryset):
+        queryset = queryset.filter(is_active=True)
+        if self.category is not None:
+            queryset = queryset.filter(category_id=self.category)
+        if self.store is not None:
+            queryset = queryset.filter(store_id=self.store)
+        if self.min_price is not None:
+            queryset = queryset.filter(price__gte=self.min_price)
+        if self.max_price is not None:
+            queryset = queryset.filter(price__lte=self.max_price)
+        if self.in_stock:
+            queryset = queryset.filter(stock__gt=0)
+        return queryset
+
+    def where_sql(self, alias):
+        """The same filters as a raw SQL condition on products_product `alias`."""
+        conditions, params = [f"{alias}.is_active"], []
+        for column, op, value in [
+            ("category_id", "=", self.category),
+            ("store_id", "=", self.store),
+            ("price", ">=", self.min_price),
+            ("price", "<=", self.max_price),
+        ]:
+            if value is not None:
+                conditions.append(f"{alias}.{column} {op} %s")
+                params.append(value)
+        if self.in_stock:
+            conditions.append(f"{alias}.stock > 0")
+        return " AND ".join(conditions), params
+
+
+def _terms(query):
+    return re.findall(r"\w+", query.lower())
+
+
+def _page(ids_and_keys, per_page):
+    """Turn up to per_page + 1 (id, sort key) rows into a KeysetPage of Products."""
+    more = len(ids_and_keys) > per_page
+    rows = ids_and_keys[:per_page]
+    products = Product.objects.select_related("store", "category").in_bulk([pid for pid, _ in rows])
+    items = [products[pid] for pid, _ in rows if pid in products]
+    next_cursor = None
+    if more and rows:
+        last_id, last_key = rows[-1]
+        next_cursor = encode_token([last_key, last_id])
+    return KeysetPage(items, next_cursor=next_cursor)
+
+
+class SearchBackend:
+    """Interface every search backend implements."""
+
+    def index(self, product_ids):
+        """(Re)index the given products."""
+        raise NotImplementedError
+
+    def remove(self, product_ids):
+        """Drop the given products from the index."""
+        raise NotImplementedError
+
+    def search(self, query, filters=None, cursor=None, per_page=SEARCH_RESULTS_PER_PAGE):
+        """
+        Return a KeysetPage of Products matching `query`, best match first.
+        Raises InvalidCursor for a malformed cursor.
+        """
+        raise NotImplementedError
+
+
+class SQLiteFTS5Backend(SearchBackend):
+    """
+    FTS5 virtual table products_product_fts, rowid = product id, created by
+    migration products.0004. Ranked by BM25 with name and sku weighted
+    above the other columns.
+    """
+
+    table = "products_product_fts"
+    weights = (10.0, 1.0, 8.0, 3.0, 2.0)  # name, description, sku, category, store
+
+    def index(self, product_ids):
+        product_ids = list(product_ids)
+        if not product_ids:
+            return
+        placeholders = ", ".join(["%s"] * len(product_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE rowid IN ({placeholders})", product_ids)
+            cursor.execute(
+                f"""
+                INSERT INTO {self.table} (rowid, name, description, sku, category, store)
+                SELECT p.id, p.name, p.description, p.sku, COALESCE(c.name, ''), s.name
+                FROM products_product p
+                JOIN stores_store s ON s.id = p.store_id
+                LEFT JOIN products_category c ON c.id = p.category_id
+                WHERE p.id IN ({placeholders})
+                """,
+                product_ids,
+            )
+
+    def remove(self, product_ids):
+        product_ids = list(product_ids)
+        if not product_ids:
+            return
+        placeholders = ", ".join(["%s"] * len(product_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table} WHERE rowid IN ({placeholders})", product_ids)
+
+    @staticmethod
+    def match_expression(query):
+        """Every term must match, as a prefix; quoting neutralises FTS syntax."""
+        return " AND ".join(f'"{term}"*' for term in _terms(query))
+
+    def search(self, query, filters=None, cursor=None, per_page=SEARCH_RESULTS_PER_PAGE):
+        match = self.match_expression(query)
+        if not match:
+            return KeysetPage([])
+
+        # The MATCH drives the plan; filters are checked per hit by joining
+        # each matching rowid to its product row on the primary key.
+        where, where_params = (filters or SearchFilters()).where_sql("p")
+
+        seek, seek_params = "", []
+        if cursor:
+            try:
+                score, last_id = decode_token(cursor)
+                score, last_id = float.fromhex(score), int(last_id)
+            except (TypeError, ValueError):
+                raise InvalidCursor(cursor)
+            seek = "WHERE score > %s OR (score = %s AND id > %s)"
+            seek_params = [score, score, last_id]
+
+        weights = ", ".join(str(w) for w in self.weights)
+        sql = f"""
+            SELECT id, score FROM (
+                SELECT f.rowid AS id, bm25({self.table}, {weights}) AS score
+                FROM {self.table} f
+                JOIN products_product p ON p.id = f.rowid
+                WHERE {self.table} MATCH %s AND {where}
+            )
+            {seek}
+            ORDER BY score, id
+            LIMIT %s
+        """
+        with connection.cursor() as db:
+            db.execute(sql, [match, *where_params, *seek_params, per_page + 1])
+            rows = db.fetchall()
+        # The score is compared with = on the next page, so carry it in the
+        # cursor as hex, which round-trips the float exactly.
+        return _page([(pid, score.hex()) for pid, score in rows], per_page)
+
+
+class BasicSearchBackend(SearchBackend):
+    """
+    Portable fallback: every term must appear (case-insensitively) in one of
+    the searchable fields. No ranking; results come newest first.
+    """
+
+    def index(self, product_ids):
+        pass
+
+    def remove(self, product_ids):
+        pass
+
+    def search(self, query, filters=None, cursor=None, per_page=SEARCH_RESULTS_PER_PAGE):
+        terms = _terms(query)
+        if not terms:
+            return KeysetPage([])
+
+        queryset = (filters or SearchFilters()).apply(Product.objects.all())
+        for term in terms:
+            queryset = queryset.filter(
+                Q(name__icontains=term) | Q(description__icontains=term) | Q(sku__icontains=term)
+                | Q(category__name__icontains=term) | Q(store__name__icontains=term)
+            )
+        if cursor:
+            try:
+                _, last_id = decode_token(cursor)
+                queryset = queryset.filter(id__lt=int(last_id))
+            except (TypeError, ValueError):
+                raise InvalidCursor(cursor)
+
+        rows = [(pid, 0) for pid in queryset.order_by("-id").values_list("id", flat=True)[:per_page + 1]]
+        return _page(rows, per_page)
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        path = getattr(settings, "PRODUCT_SEARCH_BACKEND", None)
+        if path:
+            _backend = import_string(path)()
+        elif connection.vendor == "sqlite":
+            _backend = SQLiteFTS5Backend()
+        else:
+            _backend = BasicSearchBackend()
+    return _backend
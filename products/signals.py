@@ -0,0 +1,77 @@
+# products/signals.py
+#
+# Keep the product cache (products/cache.py), the page cache
+# (products/page_cache.py), the search index
+# (products/search.py) and the facet counts (products/facets.py) in step
+# with Product, Store and Category changes, spread edited stock over its
+# shards (products/inventory.py) and render image renditions
+# (products/renditions.py) after an upload.
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from stores.models import Store
+from . import cache as product_cache
+from . import facets
+from . import inventory
+from . import page_cache
+from . import renditions
+from .models import Category, Product
+from .search import get_backend
+
+
+def _products_changed_on_commit(ids):
+    ids = list(ids)
+    if ids:
+        def refresh():
+            product_cache.invalidate(ids)
+            page_cache.purge_products(ids)
+            get_backend().index(ids)
+        transaction.on_commit(refresh)
+
+
+@receiver(pre_save, sender=Product)
+def product_saving(sender, instance, raw=False, **kwargs):
+    if not raw:
+        facets.product_saving(instance)
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        facets.product_saved(instance, created)
+        inventory.product_saved(instance)
+        if "image" in instance.__dict__:
+            image = instance.image.name or None
+            if image != getattr(instance, "_saved_image", None):
+                instance._saved_image = image
+                transaction.on_commit(lambda: renditions.schedule(instance))
+    _products_changed_on_commit([instance.pk])
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    facets.product_deleted(instance)
+    ids = [instance.pk]
+    product_cache.invalidate(ids)
+    page_cache.purge_products(ids)
+    get_backend().remove(ids)
+
+
+# pre_delete: once a Store/Category is gone its products are already
+# deleted or detached, so collect the ids while they can still be found.
+@receiver(post_save, sender=Store)
+@receiver(pre_delete, sender=Store)
+def store_changed(sender, instance, **kwargs):
+    _products_changed_on_commit(
+        Product.objects.filter(store_id=instance.pk).values_list("id", flat=True)
+    )
+
+
+@receiver(post_save, sender=Category)
+@receiver(pre_delete, sender=Category)
+def category_changed(sender, instance, **kwargs):
+    _products_changed_on_commit(
+        Product.objects.filter(category_id=instance.pk).values_list("id", flat=True)
+    )
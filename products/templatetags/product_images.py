@@ -0,0 +1,34 @@
+from django import template
+from django.utils.html import format_html
+
+register = template.Library()
+
+
+def _srcset(renditions, fmt):
+    return ", ".join(f"{r.file.url} {r.width}w" for r in renditions if r.format == fmt)
+
+
+@register.simple_tag
+def product_image(product, sizes="100vw", css_class=""):
+    """
+    A <picture> for the product's image: WebP and JPEG srcsets from the
+    renditions set by products.renditions.attach(), or the original image
+    while they are still being made.
+    """
+    if not product.image:
+        return ""
+    renditions = getattr(product, "image_renditions", None)
+    if not renditions:
+        return format_html(
+            '<img src="{}" alt="{}" class="{}" loading="lazy">',
+            product.image.url, product.name, css_class,
+        )
+
+    fallback = [r for r in renditions if r.format == "jpeg"][-1]  # the widest
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" alt="{}" class="{}" loading="lazy"></picture>',
+        _srcset(renditions, "webp"), sizes,
+        fallback.file.url, _srcset(renditions, "jpeg"), sizes,
+        fallback.width, fallback.height, product.name, css_class,
+    )
@@ -1,3 +1,998 @@
-from django.test import TestCase
+import io
+import re
+import os
+import tempfile
+import threading
+from concurrent.futures import Future
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.core.cache import cache
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from PIL import Image
+
+from ecommerce import replicas
+from ecommerce.testing import QueryBudgetMixin, QueryPlanMixin, ReplicaTestMixin
+from orders.checkout import InsufficientStock, place_order
+from orders.models import Cart, CartItem, Order
+from orders.reservations import reserve, with_available_stock
+from reviews.models import Review
+from stores.models import Store
+from . import bench, cache as product_cache, facets, inventory, page_cache, renditions
+from .models import Category, Product, ProductFacetCount, ProductImageRendition, StockShard
+from .importer import import_products
+from .pagination import InvalidCursor, paginate_keyset
+from .search import SearchFilters, get_backend
+
+User = get_user_model()
+
+
+class KeysetPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", password="pw", is_seller=True)
+        cls.store = Store.objects.create(name="Store", owner=cls.seller)
+        Product.objects.bulk_create([
+            Product(seller=cls.seller, store=cls.store, name=f"Product {i}",
+                    price=Decimal("1.00"), stock=1, sku=f"SKU-{i}")
+            for i in range(7)
+        ])
+        cls.expected = list(Product.objects.order_by("-created_at", "-id"))
+
+    def test_walks_forward_and_back_without_gaps(self):
+        first = paginate_keyset(Product.objects.all(), per_page=3)
+        second = paginate_keyset(Product.objects.all(), first.next_cursor, per_page=3)
+        third = paginate_keyset(Product.objects.all(), second.next_cursor, per_page=3)
+
+        self.assertEqual(first.items + second.items + third.items, self.expected)
+        self.assertFalse(first.has_previous)
+        self.assertFalse(third.has_next)
+
+        back = paginate_keyset(Product.objects.all(), third.previous_cursor, per_page=3)
+        self.assertEqual(back.items, second.items)
+        self.assertTrue(back.has_next)
+
+    def test_rejects_malformed_cursor(self):
+        with self.assertRaises(InvalidCursor):
+            paginate_keyset(Product.objects.all(), "not-a-cursor")
+
+        response = self.client.get(reverse("product_list"), {"cursor": "garbage"})
+        self.assertEqual(response.status_code, 404)
+
+    def test_catalog_pages_use_no_offset_or_count(self):
+        page = paginate_keyset(Product.objects.all(), per_page=3)
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("product_list"), {"cursor": page.next_cursor})
+
+        self.assertEqual(response.status_code, 200)
+        sql = " ".join(q["sql"] for q in ctx.captured_queries).upper()
+        self.assertNotIn("OFFSET", sql)
+        self.assertNotIn("COUNT(", sql)
+
+
+class ProductCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", password="pw", is_seller=True)
+        cls.store = Store.objects.create(name="Store", owner=cls.seller)
+
+    def setUp(self):
+        cache.clear()
+        self.product = Product.objects.create(
+            seller=self.seller, store=self.store, name="Lamp",
+            price=Decimal("9.99"), stock=3, sku="LAMP-1",
+        )
+
+    def test_get_many_reads_through_once(self):
+        with self.assertNumQueries(1):
+            first = product_cache.get_many([self.product.id, 999])
+        with self.assertNumQueries(0):
+            again = product_cache.get_many([self.product.id])
+            self.assertEqual(again[self.product.id].store.name, "Store")
+
+        self.assertEqual(list(first), [self.product.id])
+
+    def test_saving_product_or_store_invalidates(self):
+        product_cache.get(self.product.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(id=self.product.id).update(name="Desk Lamp")
+            self.product.refresh_from_db()
+            self.product.save()
+        self.assertEqual(product_cache.get(self.product.id).name, "Desk Lamp")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.store.name = "Renamed"
+            self.store.save()
+        self.assertEqual(product_cache.get(self.product.id).store.name, "Renamed")
+
+    def test_product_detail_serves_product_from_cache(self):
+        self.client.get(reverse("product_detail", args=[self.product.id]))
+
+        # Rendering again (not from the page cache), only the validator
+        # query (availability, which moves with every cart, and the rating
+        # summary) and the review page hit the DB.
+        page_cache.purge_product_pages([self.product.id])
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("product_detail", args=[self.product.id]))
+        self.assertContains(response, "Lamp")
+
+
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", password="pw", is_seller=True)
+        cls.store = Store.objects.create(name="Store", owner=cls.seller)
+        cls.product = Product.objects.create(
+            seller=cls.seller, store=cls.store, name="Lamp", price=Decimal("9.99"), stock=5, sku="LAMP-1",
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def revalidate(self, url, response):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+
+    def test_unchanged_product_page_revalidates_with_one_query(self):
+        url = reverse("product_detail", args=[self.product.id])
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        self.assertIn("no-cache", first["Cache-Control"])
+        self.assertIn("Cookie", first["Vary"])
+
+        page_cache.purge_product_pages([self.product.id])
+        with self.assertNumQueries(1):
+            response = self.revalidate(url, first)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], first["ETag"])
+        self.assertFalse(response.templates)
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=first["Last-Modified"]).status_code, 304)
+
+    def test_product_page_changes_with_product_reviews_and_stock(self):
+        url = reverse("product_detail", args=[self.product.id])
+        buyer = User.objects.create_user("buyer", password="pw")
+        changes = [
+            lambda: Product.objects.get(pk=self.product.pk).save(),
+            lambda: Review.objects.create(product=self.product, user=buyer, rating=4, comment="Nice"),
+            lambda: Review.objects.filter(product=self.product).get().save(),  # comment edit
+            lambda: reserve(self.product, "another-cart", 2),
+        ]
+        response = self.client.get(url)
+        for change in changes:
+            with self.captureOnCommitCallbacks(execute=True):
+                change()
+            fresh = self.revalidate(url, response)
+            self.assertEqual(fresh.status_code, 200)
+            self.assertNotEqual(fresh["ETag"], response["ETag"])
+            response = fresh
+
+    def test_list_page_revalidates_without_queries(self):
+        url = reverse("product_list")
+        first = self.client.get(url)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(self.revalidate(url, first).status_code, 304)
+
+        # Holds are not on the list; a sale is
+        with self.captureOnCommitCallbacks(execute=True):
+            reserve(self.product, "another-cart", 1)
+        self.assertEqual(self.revalidate(url, first).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            place_order([(self.product, 1)])
+        second = self.revalidate(url, first)
+        self.assertEqual(second.status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.save()
+        self.assertEqual(self.revalidate(url, second).status_code, 200)
+
+    def test_guest_cart_and_login_change_the_response(self):
+        url = reverse("product_list")
+        first = self.client.get(url)
+
+        self.client.post(reverse("add_to_cart", args=[self.product.id]))
+        self.assertEqual(self.revalidate(url, first).status_code, 200)
+
+        self.client.force_login(self.seller)
+        response = self.revalidate(url, first)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header("ETag"))
+
+
+class PageCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", password="pw", is_seller=True)
+        cls.store = Store.objects.create(name="Store", owner=cls.seller)
+        cls.product = Product.objects.create(
+            seller=cls.seller, store=cls.store, name="Lamp", price=Decimal("9.99"), stock=5, sku="LAMP-1",
+        )
+        cls.detail_url = reverse("product_detail", args=[cls.product.id])
+
+    def setUp(self):
+        cache.clear()
+
+    def assertRefreshed(self, url, change, text):
+        self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        self.assertContains(self.client.get(url), text)
+
+    def test_anonymous_hits_skip_the_database_and_fill_in_per_visitor_bits(self):
+        first = self.client.get(self.detail_url)
+        self.assertContains(first, "Cart (<span data-cart-count>0</span>)", html=False)
+
+        visitor = self.client_class()
+        visitor.post(reverse("add_to_cart", args=[self.product.id]))
+        with self.assertNumQueries(0):
+            response = visitor.get(self.detail_url)
+
+        self.assertContains(response, "Lamp added to your cart.")
+        self.assertContains(response, "Cart (<span data-cart-count>1</span>)")
+        self.assertNotContains(response, "page-cache:")
+        self.assertFalse(response.has_header("ETag"))  # not with a message in it
+        token = re.search(r'name="csrfmiddlewaretoken" value="(\w+)"', response.content.decode()).group(1)
+        self.assertEqual(len(token), 64)
+        self.assertIn(settings.CSRF_COOKIE_NAME, response.cookies)
+        self.assertIn("no-cache", response["Cache-Control"])
+        self.assertIn("Cookie", response["Vary"])
+
+        with self.assertNumQueries(0):
+            again = visitor.get(self.detail_url)
+        self.assertNotContains(again, "added to your cart")
+        self.assertEqual(visitor.get(self.detail_url, HTTP_IF_NONE_MATCH=again["ETag"]).status_code, 304)
+
+        self.client.get(reverse("product_list"))
+        with self.assertNumQueries(0):
+            self.assertContains(visitor.get(reverse("product_list")), "Lamp")
+
+    def test_logged_in_pages_are_rendered_and_private(self):
+        self.client.get(self.detail_url)
+        self.client.force_login(self.seller)
+
+        response = self.client.get(self.detail_url)
+        self.assertContains(response, "Welcome, seller")
+        self.assertIn("private", response["Cache-Control"])
+        self.assertFalse(response.has_header("ETag"))
+
+    def test_changes_purge_the_affected_pages(self):
+        buyer = User.objects.create_user("buyer", password="pw")
+
+        def rename():
+            product = Product.objects.get(pk=self.product.pk)
+            product.name = "Desk lamp"
+            product.save()
+
+        self.assertRefreshed(reverse("product_list"), rename, "Desk lamp")
+        self.assertRefreshed(self.detail_url, lambda: Review.objects.create(
+            product=self.product, user=buyer, rating=4, comment="Bright enough",
+        ), "Bright enough")
+        self.assertRefreshed(self.detail_url, lambda: reserve(self.product, "another-cart", 2), "Stock:</strong> 3")
+        self.assertRefreshed(self.detail_url, lambda: place_order([(self.product, 3)]), "Stock:</strong> 0")
+
+
+class BenchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_every_scenario_reports_latency_and_queries(self):
+        dataset = bench.seed(products=30, reviews_per_product=2, buyers=3, sellers=2)
+
+        report = bench.run(dataset, iterations=1)
+
+        self.assertEqual(set(report["scenarios"]), set(bench.SCENARIOS))
+        checkout = report["scenarios"]["checkout"]["views"]["checkout"]
+        self.assertEqual(checkout["requests"], 1)
+        self.assertGreater(checkout["queries_max"], 0)
+        self.assertIsNotNone(checkout["p99_ms"])
+
+    def test_browse_follows_cursors_across_cached_pages(self):
+        dataset = bench.seed(products=30, reviews_per_product=0, buyers=1, sellers=1)
+        self.assertEqual(len(get_backend().search("bench", per_page=30).items), 30)
+
+        with mock.patch("products.views.PRODUCTS_PER_PAGE", 10):
+            report = bench.run(dataset, iterations=2, scenarios=["browse"])
+
+        # Three pages per iteration; the second iteration is served from the page cache
+        self.assertEqual(report["scenarios"]["browse"]["views"]["product_list"]["requests"], 6)
+
+
+class AsyncCatalogTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", password="pw", is_seller=True)
+        cls.store = Store.objects.create(name="Store", owner=cls.seller)
+        cls.product = Product.objects.create(
+            seller=cls.seller, store=cls.store, name="Lamp", price=Decimal("5.00"), stock=3, sku="LAMP",
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    async def test_catalog_read_path_runs_under_asgi(self):
+        listing = await self.async_client.get(reverse("product_list"))
+        detail = await self.async_client.get(reverse("product_detail", args=[self.product.id]))
+        reviews = await self.async_client.get(reverse("product_reviews", args=[self.product.id]))
+
+        self.assertEqual(listing.context["page"].items, [self.product])
+        self.assertEqual(detail.context["product"].available, 3)
+        self.assertEqual(reviews.status_code, 200)
+
+        missing = await self.async_client.get(reverse("product_detail", args=[self.product.id + 1]))
+        self.assertEqual(missing.status_code, 404)
+        bad_cursor = await self.async_client.get(
+            reverse("product_detail", args=[self.product.id]), {"reviews": "junk"}
+        )
+        self.assertEqual(bad_cursor.status_code, 404)
+
+
+class DeploymentBenchTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_wsgi_and_asgi_serve_the_same_catalog_requests(self):
+        dataset = bench.seed(products=6, reviews_per_product=1, buyers=2, sellers=1)
+
+        with self.assertLogs("ecommerce.requests", "INFO") as logs:
+            report = bench.compare_deployments(dataset, requests=9, concurrency=3, wsgi_threads=2)
+
+        for name in ("wsgi", "asgi"):
+            self.assertEqual((report[name]["requests"], report[name]["errors"]), (9, 0))
+            self.assertIsNotNone(report[name]["throughput_rps"])
+        # Queries run on the ASGI handler's worker threads are counted
+        # too; each run starts with a cold page cache, so its first requests
+        # render.
+        self.assertEqual(len(logs.records), 18)
+        for records in (logs.records[:9], logs.records[9:]):
+            self.assertGreater(records[0].metrics["queries"], 0)
+
+
+@override_settings(REQUEST_METRICS_SERVER_TIMING=True)
+class ProductQueryBudgetTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", password="pw", is_seller=True)
+        cls.store = Store.objects.create(name="Store", owner=cls.seller)
+        Product.objects.bulk_create([
+            Product(seller=cls.seller, store=cls.store, name=f"Product {i}",
+                    price=Decimal("1.00"), stock=1, sku=f"SKU-{i}")
+            for i in range(30)
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_catalog_views_stay_within_budget(self):
+        product = Product.objects.first()
+
+        response = self.assertQueryBudget(1, reverse("product_list"))
+        self.assertIn('db;dur=', response["Server-Timing"])
+        self.assertQueryBudget(4, reverse("product_detail", args=[product.id]))
+
+        self.client.force_login(self.seller)
+        # session, user, cart badge, products joined to their store
+        self.assertQueryBudget(4, reverse("seller_dashboard"))
+
+    def test_middleware_logs_metrics_by_url_name(self):
+        with self.assertLogs("ecommerce.requests", "INFO") as logs:
+            self.client.get(reverse("product_list"))
+
+        record = logs.records[0].metrics
+        self.assertEqual((record["url_name"], record["queries"]), ("product_list", 1))
+        self.assertGreater(record["template_ms"], 0)
+
+
+class ProductQueryPlanTests(QueryPlanMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", password="pw", is_seller=True)
+        cls.store = Store.objects.create(name="Store", owner=cls.seller)
+        Product.objects.bulk_create([
+            Product(seller=cls.seller, store=cls.store, name=f"Product {i}",
+                    price=Decimal("1.00"), stock=1, sku=f"SKU-{i}", is_active=i % 5 != 0)
+            for i in range(30)
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_catalog_only_lists_active_products(self):
+        response = self.client.get(reverse("product_list"))
+
+        self.assertTrue(response.context["products"].items)
+        self.assertTrue(all(p.is_active for p in response.context["products"]))
+        self.assertNotContains(response, "Product 25<")
+
+    def test_catalog_views_use_indexes(self):
+        with mock.patch("products.views.PRODUCTS_PER_PAGE", 10):
+            first = self.assertIndexedQueries(reverse("product_list"))
+            self.assertIndexedQueries(reverse("product_list"), data={"cursor": first.context["page"].next_cursor})
+        product = Product.objects.filter(is_active=True).first()
+        self.assertIndexedQueries(reverse("product_detail", args=[product.id]))
+        # The filter form lists every category and store as choices
+        self.assertIndexedQueries(
+            reverse("product_search"), data={"q": "product", "store": self.store.id},
+            allow=("products_category", "stores_store"),
+        )
+
+        self.client.force_login(self.seller)
+        self.assertIndexedQueries(reverse("seller_dashboard"))
+
+
+class ReplicaRoutingTests(ReplicaTestMixin, TransactionTestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.seller = User.objects.create_user("seller", password="pw", is_seller=True)
+        self.store = Store.objects.create(name="Store", owner=self.seller)
+        self.product = Product.objects.create(
+            seller=self.seller, store=self.store, name="Lamp", price=Decimal("9.99"), stock=3, sku="LAMP-1",
+        )
+
+    def test_catalog_reads_go_to_the_replica_until_it_catches_up(self):
+        # Logged in: anonymous pages are rendered from the primary for the page cache
+        self.client.force_login(User.objects.create_user("buyer", password="pw"))
+        self.assertNotContains(self.client.get(reverse("product_list")), "Lamp")
+
+        self.sync_replicas()
+        self.assertContains(self.client.get(reverse("product_list")), "Lamp")
+
+    def test_caches_are_filled_from_the_primary(self):
+        self.sync_replicas()
+        Product.objects.filter(pk=self.product.pk).update(name="Desk lamp")
+        product_cache.invalidate([self.product.id])
+
+        token = replicas._current.set(replicas.RoutingState())
+        try:
+            self.assertEqual(product_cache.get(self.product.id).name, "Desk lamp")
+        finally:
+            replicas._current.reset(token)
+
+        # An anonymous page is rendered from the primary, then served from the cache
+        for _ in range(2):
+            response = self.client.get(reverse("product_list"))
+            self.assertContains(response, "Desk lamp")
+
+    def test_catalog_write_pins_the_client_to_the_primary(self):
+        self.sync_replicas()
+        self.client.force_login(self.seller)
+
+        response = self.client.post(reverse("edit_product", args=[self.product.id]), {
+            "name": "Desk lamp", "description": "", "price": "9.99", "stock": 3, "store": self.store.id,
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(replicas.STICKY_COOKIE_NAME, response.cookies)
+        self.assertContains(self.client.get(reverse("product_list")), "Desk lamp")
+
+        # Once the pin expires the replica (not yet caught up) serves reads again
+        del self.client.cookies[replicas.STICKY_COOKIE_NAME]
+        response = self.client.get(reverse("product_list"))
+        self.assertContains(response, "Lamp")
+        self.assertNotContains(response, "Desk lamp")
+        self.assertNotIn(replicas.STICKY_COOKIE_NAME, response.cookies)
+
+    def test_orders_and_transactions_read_the_primary(self):
+        router = replicas.PrimaryReplicaRouter()
+        self.assertEqual(router.db_for_read(Product), "default")  # outside a request
+
+        token = replicas._current.set(replicas.RoutingState())
+        try:
+            self.assertEqual(router.db_for_read(Product), "replica")
+            self.assertEqual(router.db_for_read(Order), "default")
+            with transaction.atomic():
+                self.assertEqual(router.db_for_read(Product), "default")
+        finally:
+            replicas._current.reset(token)
+
+
+class ProductSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", password="pw", is_seller=True)
+        cls.store = Store.objects.create(name="Lighthouse Supplies", owner=cls.seller)
+        cls.other_store = Store.objects.create(name="Other", owner=cls.seller)
+        cls.lighting = Category.objects.create(name="Lighting", slug="lighting")
+
+    def setUp(self):
+        cache.clear()
+
+    def make(self, name, store=None, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Product.objects.create(
+                seller=self.seller, store=store or self.store, name=name,
+                price=fields.pop("price", Decimal("10.00")), stock=fields.pop("stock", 5),
+                sku=fields.pop("sku", name.upper().replace(" ", "-")), **fields,
+            )
+
+    def search(self, query, **filters):
+        return get_backend().search(query, filters=SearchFilters(**filters))
+
+    def test_ranks_name_matches_above_description_matches(self):
+        described = self.make("Desk", description="A lamp stand for your desk lamp")
+        named = self.make("Desk Lamp")
+
+        self.assertEqual(self.search("lamp").items, [named, described])
+        self.assertEqual(self.search("lam des").items[0], named)  # prefix terms
+
+    def test_indexes_store_and_category_names_and_follows_renames(self):
+        product = self.make("Bulb", category=self.lighting)
+
+        self.assertEqual(self.search("lighthouse").items, [product])
+        self.assertEqual(self.search("lighting").items, [product])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.lighting.name = "Bulbs & Bits"
+            self.lighting.save()
+        self.assertEqual(self.search("lighting").items, [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            product.delete()
+        self.assertEqual(self.search("bulb").items, [])
+
+    def test_filters_and_keyset_pages(self):
+        for i in range(5):
+            self.make(f"Lamp {i}", price=Decimal(i + 1))
+        self.make("Lamp out of stock", stock=0)
+        self.make("Lamp elsewhere", store=self.other_store)
+
+        in_range = self.search("lamp", store=self.store.pk, min_price=2, max_price=4, in_stock=True)
+        self.assertEqual(sorted(p.price for p in in_range.items), [2, 3, 4])
+
+        first = get_backend().search("lamp", per_page=4)
+        second = get_backend().search("lamp", cursor=first.next_cursor, per_page=4)
+        self.assertEqual(len(first.items) + len(second.items), 7)
+        self.assertFalse(set(first.items) & set(second.items))
+        self.assertFalse(second.has_next)
+
+    def test_pages_through_tied_scores_without_gaps(self):
+        tied = [self.make("Lamp", sku=f"L{i}") for i in range(5)]
+
+        seen, cursor = [], None
+        while True:
+            page = get_backend().search("lamp", cursor=cursor, per_page=2)
+            seen += page.items
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        self.assertEqual(seen, tied)
+
+    def test_search_view_treats_query_syntax_as_text(self):
+        self.make("Lamp")
+
+        response = self.client.get(reverse("product_search"), {"q": 'lamp" OR NEAR(*'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context["results"]), [])
+
+
+class ProductFacetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", password="pw", is_seller=True)
+        cls.store = Store.objects.create(name="Store", owner=cls.seller)
+        cls.other_store = Store.objects.create(name="Other", owner=cls.seller)
+        cls.lighting = Category.objects.create(name="Lighting", slug="lighting")
+        cls.garden = Category.objects.create(name="Garden", slug="garden")
+
+    def make(self, category, store=None, price="5.00", stock=5, **fields):
+        return Product.objects.create(
+            seller=self.seller, store=store or self.store, category=category,
+            name="Product", price=Decimal(price), stock=stock, sku=f"SKU-{Product.objects.count()}", **fields,
+        )
+
+    def assertMatchesRebuild(self):
+        stored = {
+            row[:4]: row[4] for row in ProductFacetCount.objects.filter(count__gt=0)
+            .values_list("category_id", "store_id", "price_band", "in_stock", "count")
+        }
+        facets.rebuild()
+        rebuilt = {
+            row[:4]: row[4] for row in ProductFacetCount.objects
+            .values_list("category_id", "store_id", "price_band", "in_stock", "count")
+        }
+        self.assertEqual(stored, rebuilt)
+
+    def test_counts_follow_saves_deletes_and_checkout(self):
+        from orders.checkout import place_order
+
+        lamp = self.make(self.lighting, price="5.00", stock=1)
+        bulb = self.make(self.lighting, price="30.00")
+        spade = self.make(self.garden, store=self.other_store)
+        self.make(self.garden, is_active=False)
+
+        bulb.price = Decimal("300.00")
+        bulb.save()
+        spade.category = self.lighting
+        spade.save()
+        place_order([(lamp, 1)], guest_email="g@example.com")
+
+        counts = facets.facet_counts()
+        self.assertEqual(counts["category"], {self.lighting.pk: 3})
+        self.assertEqual(counts["in_stock"], {True: 2, False: 1})
+        self.assertMatchesRebuild()
+
+        bulb.delete()
+        self.assertEqual(facets.facet_counts()["category"], {self.lighting.pk: 2})
+        self.assertMatchesRebuild()
+
+    def test_saving_a_deferred_product_moves_it_out_of_its_old_facet(self):
+        lamp = self.make(self.lighting)
+        self.make(self.garden)
+
+        product = Product.objects.only("id", "name").get(pk=lamp.pk)
+        product.category = self.garden
+        product.save()
+
+        self.assertEqual(facets.facet_counts()["category"], {self.garden.pk: 2})
+        self.assertMatchesRebuild()
+
+    def test_uncategorized_products_share_one_row_per_facet(self):
+        self.make(None)
+        self.make(None)
+        row = ProductFacetCount.objects.get(category=None)
+        self.assertEqual(row.count, 2)
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            ProductFacetCount.objects.create(
+                category=None, store=self.store, price_band=row.price_band, in_stock=True,
+            )
+
+    def test_each_dimension_ignores_its_own_filter(self):
+        self.make(self.lighting, price="5.00")
+        self.make(self.lighting, price="30.00", stock=0)
+        self.make(self.garden, price="30.00", store=self.other_store)
+
+        with self.assertNumQueries(1):
+            counts = facets.facet_counts(category=self.lighting.pk, price_band=2)
+
+        self.assertEqual(counts["category"], {self.lighting.pk: 1, self.garden.pk: 1})
+        self.assertEqual(counts["price_band"], {0: 1, 2: 1})
+        self.assertEqual(counts["store"], {self.store.pk: 1})
+        self.assertEqual(counts["in_stock"], {False: 1})
+
+    def test_facet_view_returns_json_and_rejects_bad_filters(self):
+        self.make(self.lighting)
+
+        response = self.client.get(reverse("product_facets"), {"in_stock": "true"})
+        self.assertEqual(response.json()["category"], {str(self.lighting.pk): 1})
+        self.assertEqual(response.json()["in_stock"], {"true": 1})
+
+        response = self.client.get(reverse("product_facets"), {"store": "x"})
+        self.assertEqual(response.status_code, 400)
+
+
+class ProductImportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", password="pw", is_seller=True)
+        cls.other = User.objects.create_user("other", password="pw", is_seller=True)
+        cls.store = Store.objects.create(name="Main Street", owner=cls.seller)
+        cls.outlet = Store.objects.create(name="Outlet", owner=cls.seller)
+        cls.other_store = Store.objects.create(name="Elsewhere", owner=cls.other)
+        cls.lighting = Category.objects.create(name="Lighting", slug="lighting")
+        Product.objects.create(
+            seller=cls.seller, store=cls.store, name="Old lamp", price=Decimal("1.00"), stock=1, sku="LAMP-1",
+        )
+        Product.objects.create(
+            seller=cls.other, store=cls.other_store, name="Theirs", price=Decimal("1.00"), stock=1, sku="THEIRS",
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def csv_file(self, *rows):
+        header = "sku,name,description,price,stock,store,category\n"
+        return io.BytesIO((header + "".join(row + "\n" for row in rows)).encode())
+
+    def test_upserts_by_sku_and_reports_bad_rows(self):
+        upload = self.csv_file(
+            "LAMP-1,Desk lamp,Brass,12.50,4,main street,Lighting",
+            "LAMP-2,Floor lamp,,80.00,2,Outlet,lighting",
+            "LAMP-3,Bad price,,cheap,2,Outlet,",
+            "LAMP-4,No store,,5.00,2,Nowhere,",
+            "THEIRS,Hijack,,5.00,2,Outlet,",
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            result = import_products(self.seller, upload, "csv")
+
+        self.assertEqual((result.created, result.updated, result.error_count), (1, 1, 3))
+        self.assertEqual([line for line, _ in result.errors], [4, 5, 6])
+        self.assertIn("price", result.errors[0][1])
+        lamp = Product.objects.get(sku="LAMP-1")
+        self.assertEqual((lamp.name, lamp.price, lamp.category, lamp.store), ("Desk lamp", Decimal("12.50"), self.lighting, self.store))
+        self.assertEqual(Product.objects.get(sku="THEIRS").name, "Theirs")
+        self.assertEqual(get_backend().search("floor").items, [Product.objects.get(sku="LAMP-2")])
+        self.assertEqual(facets.facet_counts()["category"], {None: 1, self.lighting.pk: 2})
+
+    def test_price_changes_refresh_cart_totals(self):
+        buyer = User.objects.create_user("buyer", password="pw")
+        cart = Cart.objects.create(user=buyer)
+        CartItem.objects.create(cart=cart, product=Product.objects.get(sku="LAMP-1"), quantity=3)
+
+        import_products(self.seller, self.csv_file("LAMP-1,Old lamp,,4.00,1,Main Street,"), "csv")
+
+        self.assertFalse(Cart.objects.drifted().exists())
+        cart.refresh_from_db()
+        self.assertEqual((cart.item_count, cart.subtotal), (3, Decimal("12.00")))
+
+    def test_query_count_does_not_grow_per_row(self):
+        def queries(count):
+            rows = [f"BULK-{count}-{i},Item {i},,3.00,1,Outlet," for i in range(count)]
+            with CaptureQueriesContext(connection) as ctx:
+                result = import_products(self.seller, self.csv_file(*rows), "csv", batch_size=500)
+            self.assertEqual(result.created, count)
+            return len(ctx.captured_queries)
+
+        # A handful per batch (the INSERT may be split to fit SQL parameter
+        # limits), never one per row.
+        self.assertLess(queries(5), 15)
+        self.assertLess(queries(400), 20)
+
+    def test_jsonl_command_and_upload_endpoint(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".jsonl", delete=False) as fh:
+            fh.write('{"sku": "J-1", "name": "Bulb", "price": 2.5, "stock": 10, "store": "Outlet"}\n')
+            fh.write('not json\n')
+        path = fh.name
+        self.addCleanup(os.remove, path)
+        out, err = io.StringIO(), io.StringIO()
+
+        call_command("import_products", path, "--seller", "seller", stdout=out, stderr=err)
+
+        self.assertIn("1 created", out.getvalue())
+        self.assertIn("line 2: Invalid JSON", err.getvalue())
+
+        self.client.force_login(self.seller)
+        upload = SimpleUploadedFile("products.jsonl", b'{"sku": "J-1", "name": "Bulb", "price": 3, "stock": 1, "store": "Outlet"}\n')
+        response = self.client.post(reverse("import_products"), {"file": upload})
+        self.assertEqual(response.context["result"].updated, 1)
+        self.assertEqual(Product.objects.get(sku="J-1").price, Decimal("3.00"))
+
+
+
+def png_bytes(width, height, color="red"):
+    buffer = io.BytesIO()
+    Image.new("RGBA", (width, height), color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class ProductImageRenditionTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media = tempfile.TemporaryDirectory()
+        cls.enterClassContext(override_settings(MEDIA_ROOT=cls.media.name))
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls.media.cleanup()
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", password="pw", is_seller=True)
+        cls.store = Store.objects.create(name="Store", owner=cls.seller)
+
+    def setUp(self):
+        cache.clear()
+        self.product = Product.objects.create(
+            seller=self.seller, store=self.store, name="Lamp", price=Decimal("5.00"), stock=3, sku="LAMP",
+        )
+
+    def upload(self, color="red"):
+        self.client.force_login(self.seller)
+        with mock.patch.object(renditions, "schedule") as schedule, self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.client.post(reverse("edit_product", args=[self.product.id]), {
+                "name": "Lamp", "description": "", "price": "5.00", "stock": "3", "store": self.store.id,
+                "image": SimpleUploadedFile("lamp.png", png_bytes(800, 400, color), content_type="image/png"),
+            })
+        self.assertTrue(callbacks)
+        schedule.assert_called_once()
+        self.product.refresh_from_db()
+        return schedule.call_args.args[0]
+
+    def test_upload_is_rendered_to_hashed_widths_and_served_as_srcset(self):
+        scheduled = self.upload()
+        self.assertEqual(scheduled.pk, self.product.pk)
+        self.assertEqual(list(renditions.missing()), [self.product])
+
+        renditions.generate(self.product)
+        rows = ProductImageRendition.objects.filter(product=self.product)
+        # 1280 is wider than the source, so it becomes the source width
+        self.assertEqual(
+            sorted(rows.values_list("width", "format")),
+            [(w, f) for w in (160, 320, 640, 800) for f in ("jpeg", "webp")],
+        )
+        self.assertEqual(rows.get(width=160, format="webp").height, 80)
+        self.assertRegex(rows.get(width=320, format="jpeg").file.name, r"renditions/[0-9a-f]{32}-320w\.jpg$")
+        self.assertEqual(list(renditions.missing()), [])
+
+        with CaptureQueriesContext(connection) as queries:
+            html = self.client.get(reverse("product_list")).content.decode()
+        self.assertIn('type="image/webp"', html)
+        self.assertIn("-160w.webp 160w", html)
+        self.assertIn('-800w.jpg" srcset=', html)
+        rendition_queries = [q for q in queries if "productimagerendition" in q["sql"]]
+        self.assertEqual(len(rendition_queries), 1)
+
+    def test_new_image_replaces_renditions_and_command_catches_up(self):
+        self.upload("red")
+        renditions.generate(self.product)
+        old_files = set(ProductImageRendition.objects.values_list("file", flat=True))
+
+        self.upload("blue")
+        # until the new renditions exist, the original image is served
+        self.assertIn(self.product.image.url, self.client.get(reverse("product_list")).content.decode())
+        self.assertEqual(list(renditions.missing()), [self.product])
+
+        call_command("generate_renditions", stdout=io.StringIO())
+        self.assertEqual(list(renditions.missing()), [])
+        self.assertEqual(set(ProductImageRendition.objects.values_list("source_name", flat=True)), {self.product.image.name})
+        storage = self.product.image.storage
+        self.assertFalse(any(storage.exists(name) for name in old_files))
+
+    def test_new_renditions_refresh_cached_pages(self):
+        self.upload()
+        visitor = self.client_class()
+        urls = [reverse("product_detail", args=[self.product.id]), reverse("product_list")]
+        before = [visitor.get(url) for url in urls]
+        self.assertNotIn("srcset", before[0].content.decode())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            renditions.generate(self.product)
+
+        for url, response in zip(urls, before):
+            fresh = visitor.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+            self.assertEqual(fresh.status_code, 200)
+            self.assertIn("-160w.webp 160w", fresh.content.decode())
+
+    @override_settings(PRODUCT_IMAGE_WORKERS=1)
+    def test_schedule_renders_in_worker_process(self):
+        self.upload()
+        with mock.patch.object(renditions, "save_renditions"):
+            future = renditions.schedule(self.product)
+            rendered = future.result(timeout=60)
+        self.assertEqual([(w, f) for w, h, f, data in rendered][:2], [(160, "webp"), (160, "jpeg")])
+        self.assertTrue(rendered[0][3].startswith(b"RIFF"))
+
+    def test_failed_and_skipped_renders_are_logged(self):
+        self.upload()
+        pool, slots = mock.Mock(), threading.BoundedSemaphore(1)
+        pool.submit.return_value = Future()
+        with mock.patch.object(renditions, "_executor", return_value=(pool, slots)), self.assertLogs("products.renditions") as logs:
+            future = renditions.schedule(self.product)
+            self.assertIsNone(renditions.schedule(self.product))  # pool full
+            future.set_exception(RuntimeError("corrupt image"))
+            pool.submit.return_value = Future()
+            self.assertIsNotNone(renditions.schedule(self.product))  # the slot was given back
+
+        self.assertEqual([r.levelname for r in logs.records], ["WARNING", "ERROR"])
+        self.assertIn("corrupt image", logs.output[1])
+
+
+class StockShardTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", password="pw", is_seller=True)
+        cls.store = Store.objects.create(name="Store", owner=cls.seller)
+
+    def setUp(self):
+        cache.clear()
+        self.product = Product.objects.create(
+            seller=self.seller, store=self.store, name="Hot", price=Decimal("5.00"), stock=10, sku="HOT",
+        )
+
+    def shards(self):
+        return list(StockShard.objects.filter(product=self.product).order_by("shard").values_list("stock", flat=True))
+
+    def test_checkout_takes_from_shards_and_rebalance_consolidates(self):
+        call_command("rebalance_stock_shards", "--product", str(self.product.id), "--shards", "4", stdout=io.StringIO())
+        self.product.refresh_from_db()
+        self.assertEqual(self.shards(), [3, 3, 2, 2])
+
+        with CaptureQueriesContext(connection) as queries:
+            place_order([(self.product, 3)])
+        self.assertFalse([q for q in queries if 'UPDATE "products_product"' in q["sql"]])
+        self.assertEqual(sum(self.shards()), 7)
+        self.assertEqual(Product.objects.get(pk=self.product.pk).stock, 10)  # not yet consolidated
+        self.assertEqual(inventory.stock_levels([self.product.id]), {self.product.id: 7})
+        self.assertEqual(with_available_stock(Product.objects.filter(id=self.product.id)).get().available, 7)
+
+        # Needs units from several shards
+        place_order([(self.product, 7)])
+        with self.assertRaises(InsufficientStock) as ctx:
+            place_order([(self.product, 1)])
+        self.assertEqual(ctx.exception.shortages[0][1], 0)
+        self.assertEqual(Product.objects.get(pk=self.product.pk).stock, 0)
+        self.assertEqual(facets.facet_counts()["in_stock"], {False: 1})
+
+        call_command("rebalance_stock_shards", stdout=io.StringIO())
+        self.assertEqual(Product.objects.get(pk=self.product.pk).stock, 0)
+        self.assertEqual(self.shards(), [0, 0, 0, 0])
+        self.assertEqual(facets.facet_counts()["in_stock"], {False: 1})
+
+    def test_units_held_by_other_carts_are_not_sold_from_shards(self):
+        inventory.set_shards(self.product, 2)
+        reserve(self.product, "another-cart", 4)
+
+        place_order([(self.product, 4)])  # one shard cannot cover it with the hold
+        with self.assertRaises(InsufficientStock) as ctx:
+            place_order([(self.product, 3)])
+        self.assertEqual(ctx.exception.shortages[0][1], 2)
+
+        place_order([(self.product, 6)], holder="another-cart")
+        self.assertEqual(self.shards(), [0, 0])
+        self.assertEqual(Product.objects.get(pk=self.product.pk).stock, 0)
+
+    def test_failed_order_leaves_shards_untouched(self):
+        inventory.set_shards(self.product, 3)
+        other = Product.objects.create(
+            seller=self.seller, store=self.store, name="Other", price=Decimal("1.00"), stock=0, sku="OTHER",
+        )
+        with self.assertRaises(InsufficientStock):
+            place_order([(self.product, 10), (other, 1)])
+        self.assertEqual(self.shards(), [4, 3, 3])
+
+    def test_stock_edits_are_spread_and_unsharding_keeps_the_total(self):
+        inventory.set_shards(self.product, 2)
+        place_order([(self.product, 1)])
+
+        self.client.force_login(self.seller)
+        self.client.post(reverse("edit_product", args=[self.product.id]), {
+            "name": "Hot", "description": "", "price": "5.00", "stock": "21", "store": self.store.id,
+        })
+        self.assertEqual(self.shards(), [11, 10])
+
+        place_order([(self.product, 5)])
+        inventory.set_shards(self.product, 0)
+        self.assertEqual(self.shards(), [])
+        self.assertEqual(Product.objects.get(pk=self.product.pk).stock, 16)
+
+    def test_stock_figures_from_before_a_sale_are_rejected(self):
+        inventory.set_shards(self.product, 2)
+        self.client.force_login(self.seller)
+        url = reverse("edit_product", args=[self.product.id])
+        form = self.client.get(url).context["form"]
+        self.assertEqual(form["stock_seen"].value(), 10)
+        place_order([(self.product, 3)])
+
+        dashboard = self.client.get(reverse("seller_dashboard"))
+        self.assertEqual([p.current_stock for p in dashboard.context["products"]], [7])
+
+        data = {"name": "Hotter", "description": "", "price": "5.00", "stock": "10", "stock_seen": "10", "store": self.store.id}
+        # Stock left as shown: the rest of the edit is saved, the sale stands
+        self.assertEqual(self.client.post(url, data).status_code, 302)
+        self.assertEqual((Product.objects.get(pk=self.product.pk).name, sum(self.shards())), ("Hotter", 7))
+
+        response = self.client.post(url, {**data, "stock": "12"})
+        self.assertIn("since you opened this form", response.context["form"].errors["stock"][0])
+        self.assertEqual(response.context["form"]["stock_seen"].value(), 7)
+        self.assertEqual(sum(self.shards()), 7)
+
+        # A product loaded before the sale cannot overwrite it either
+        product = Product.objects.get(pk=self.product.pk)
+        place_order([(self.product, 1)])
+        product.stock = 20
+        with self.assertRaises(inventory.StaleStock), transaction.atomic():
+            product.save()
+        self.assertEqual(inventory.stock_levels([self.product.pk]), {self.product.pk: 6})
+
+
+class StockContentionBenchTests(TransactionTestCase):
+    def test_concurrent_buyers_never_oversell(self):
+        dataset = bench.seed(products=1, reviews_per_product=0, buyers=1, sellers=1)
+        report = bench.stock_contention(dataset, stock=30, threads=3, shards=3)
+
+        for mode in ("single_row", "sharded"):
+            self.assertEqual(report[mode]["units_sold"], 30)
+            self.assertEqual(report[mode]["remaining"], 0)
+            self.assertFalse(report[mode]["oversold"])
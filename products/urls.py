@@ -4,6 +4,7 @@ from . import views
 urlpatterns = [
     path('dashboard/', views.seller_dashboard, name='seller_dashboard'),
     path('add/', views.add_product, name='add_product'),
+    path('import/', views.import_products_view, name='import_products'),
     path('edit/<int:product_id>/', views.edit_product, name='edit_product'),
     path('delete/<int:product_id>/', views.delete_product, name='delete_product'),
 ]
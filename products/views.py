@@ -3,9 +3,21 @@
 # -------------------------
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
+from django.db import transaction
+from django.http import Http404, HttpResponseBadRequest, JsonResponse
 from .models import Product
-from .forms import ProductForm
+from .forms import ProductFacetForm, ProductForm, ProductImportUploadForm, ProductSearchForm
+from .importer import ImportFileError, detect_format, import_products
+from . import inventory
+from .pagination import InvalidCursor, paginate_keyset
+from .search import get_backend
 from stores.models import Store
+from orders.reservations import available_stock
+from reviews.listing import rating_summary, review_page
+from . import cache as product_cache
+from .conditional import cache_anonymous_page, catalog_validators, conditional_page, product_validators, reuse
+from . import facets
+from . import renditions
 import uuid
 
 
@@ -17,7 +29,9 @@ def seller_dashboard(request):
     if not request.user.is_seller:
         return render(request, "not_authorized.html")
 
-    products = Product.objects.filter(seller=request.user)
+    products = Product.objects.filter(seller=request.user).select_related("store").annotate(
+        current_stock=inventory.live_stock()
+    )
 
     return render(request, "products/seller_dashboard.html", {
         "products": products
@@ -30,7 +44,7 @@ def seller_dashboard(request):
 @login_required
 def add_product(request):
     if request.method == "POST":
-        form = ProductForm(request.POST)
+        form = ProductForm(request.POST, request.FILES)
         form.fields['store'].queryset = Store.objects.filter(owner=request.user)
 
         if form.is_valid():
@@ -46,6 +60,30 @@ def add_product(request):
     return render(request, "products/add_product.html", {"form": form})
 
 
+# -------------------------
+# BULK IMPORT PRODUCTS
+# -------------------------
+@login_required
+def import_products_view(request):
+    if not request.user.is_seller:
+        return render(request, "not_authorized.html")
+
+    result = None
+    if request.method == "POST":
+        form = ProductImportUploadForm(request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data["file"]
+            fmt = form.cleaned_data["format"] or detect_format(upload.name)
+            try:
+                result = import_products(request.user, upload.file, fmt)
+            except ImportFileError as exc:
+                form.add_error("file", str(exc))
+    else:
+        form = ProductImportUploadForm()
+
+    return render(request, "products/import_products.html", {"form": form, "result": result})
+
+
 # -------------------------
 # EDIT PRODUCT
 # -------------------------
@@ -54,13 +92,22 @@ def edit_product(request, product_id):
     if not request.user.is_seller:
         return render(request, "products/not_authorized.html")
 
-    product = get_object_or_404(Product, id=product_id, seller=request.user)
+    product = inventory.use_live_stock(get_object_or_404(Product, id=product_id, seller=request.user))
 
     if request.method == "POST":
-        form = ProductForm(request.POST, instance=product)
+        form = ProductForm(request.POST, request.FILES, instance=product)
         if form.is_valid():
-            form.save()
-            return redirect("seller_dashboard")
+            try:
+                with transaction.atomic():
+                    form.save()
+            except inventory.StaleStock:
+                # Sold units between loading the product and saving it
+                form.stock_changed(
+                    product._saved_stock[1],
+                    Product.objects.values_list("stock", flat=True).get(pk=product.pk),
+                )
+            else:
+                return redirect("seller_dashboard")
     else:
         form = ProductForm(instance=product)
 
@@ -84,11 +131,86 @@ def delete_product(request, product_id):
 # -------------------------
 # PUBLIC PRODUCT LIST + DETAIL
 # -------------------------
+PRODUCTS_PER_PAGE = 24
+
+
+@cache_anonymous_page
+@conditional_page(catalog_validators)
 def product_list(request):
-    products = Product.objects.all()
-    return render(request, "products/product_list.html", {"products": products})
+    try:
+        page = paginate_keyset(
+            # Stock less sales, not less other carts' holds: a hold only
+            # changes the product's own page (orders/reservations.py).
+            Product.objects.filter(is_active=True).annotate(available=inventory.live_stock()),
+            cursor=request.GET.get("cursor"),
+            per_page=PRODUCTS_PER_PAGE,
+        )
+    except InvalidCursor:
+        raise Http404("Invalid page cursor")
+    renditions.attach(page.items)
+
+    return render(request, "products/product_list.html", {"products": page, "page": page})
+
+
+def product_search(request):
+    form = ProductSearchForm(request.GET or None)
+    results = None
+
+    # Current filters, for the "next page" link
+    params = request.GET.copy()
+    params.pop("cursor", None)
+
+    if form.is_valid() and form.cleaned_data["q"]:
+        try:
+            results = get_backend().search(
+                form.cleaned_data["q"],
+                filters=form.filters(),
+                cursor=request.GET.get("cursor"),
+            )
+        except InvalidCursor:
+            raise Http404("Invalid page cursor")
+
+    return render(request, "products/product_search.html", {
+        "form": form,
+        "results": results,
+        "query_string": params.urlencode(),
+    })
 
 
+def product_facets(request):
+    """
+    Facet counts for the given filters (?category=&store=&price_band=&in_stock=),
+    as JSON: {"category": {"<id>": n}, "store": {...}, "price_band": {...}, "in_stock": {...}}.
+    """
+    form = ProductFacetForm(request.GET)
+    if not form.is_valid():
+        return HttpResponseBadRequest("Invalid facet filters")
+
+    counts = facets.facet_counts(**form.cleaned_data)
+    return JsonResponse({
+        dimension: {str(value).lower() if dimension == "in_stock" else str(value): n for value, n in values.items()}
+        for dimension, values in counts.items()
+    })
+
+
+@cache_anonymous_page
+@conditional_page(product_validators)
 def product_detail(request, product_id):
-    product = get_object_or_404(Product, id=product_id)
-    return render(request, "products/product_detail.html", {"product": product})
\ No newline at end of file
+    try:
+        product = product_cache.get(product_id)
+        available = reuse(request, "available", lambda: available_stock([product_id]))
+        summary = reuse(request, "summary", lambda: rating_summary(product_id))
+        reviews = review_page(product_id, cursor=request.GET.get("reviews"))
+    except InvalidCursor:
+        raise Http404("Invalid review cursor")
+    if product is None:
+        raise Http404("No Product matches the given query.")
+    product.available = available.get(product.id, 0)
+    renditions.attach([product])
+
+    return render(request, "products/product_detail.html", {
+        "product": product,
+        "summary": summary,
+        "reviews": reviews,
+        "reviews_url": request.path,
+    })
@@ -2,6 +2,8 @@ from django import forms
 from .models import Review
 
 class ReviewForm(forms.ModelForm):
+    rating = forms.IntegerField(min_value=1, max_value=5, initial=5)
+
     class Meta:
         model = Review
-        fields = ["rating", "comment"]
\ No newline at end of file
+        fields = ["rating", "comment"]
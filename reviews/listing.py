@@ -0,0 +1,28 @@
+# reviews/listing.py
+#
+# Read side of reviews: the stored rating summary and keyset-paginated
+# review pages, each a single query regardless of how many reviews exist.
+
+from products.pagination import paginate_keyset
+from .models import ProductRatingSummary, Review
+
+
+REVIEWS_PER_PAGE = 10
+
+
+def rating_summary(product_id):
+    """The product's ProductRatingSummary, or an empty one if it has none."""
+    summary = ProductRatingSummary.objects.filter(product_id=product_id).first()
+    return summary or ProductRatingSummary(product_id=product_id)
+
+
+def review_page(product_id, cursor=None, per_page=REVIEWS_PER_PAGE):
+    """
+    One page of the product's reviews, newest first, with `user` joined.
+    Raises products.pagination.InvalidCursor for a malformed cursor.
+    """
+    return paginate_keyset(
+        Review.objects.filter(product_id=product_id).select_related("user"),
+        cursor=cursor,
+        per_page=per_page,
+    )
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from products.models import Product
+from reviews.models import ProductRatingSummary
+
+
+class Command(BaseCommand):
+    help = "Rebuild every product's rating summary from its reviews, in id batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        last_id = 0
+        rebuilt = 0
+
+        while True:
+            ids = list(
+                Product.objects.filter(id__gt=last_id)
+                .order_by("id")
+                .values_list("id", flat=True)[:options["batch_size"]]
+            )
+            if not ids:
+                break
+            last_id = ids[-1]
+
+            ProductRatingSummary.rebuild(ids)
+            rebuilt += len(ids)
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rebuilt} rating summaries"))
@@ -0,0 +1,61 @@
+# Generated by Django 6.0 on 2026-10-17 17:19
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def backfill_summaries(apps, schema_editor):
+    Review = apps.get_model('reviews', 'Review')
+    ProductRatingSummary = apps.get_model('reviews', 'ProductRatingSummary')
+
+    rows = (
+        Review.objects.order_by()
+        .values('product_id')
+        .annotate(
+            review_count=Count('id'),
+            rating_total=Sum('rating'),
+            verified_count=Count('id', filter=Q(verified=True)),
+            stars_1=Count('id', filter=Q(rating__lte=1)),
+            stars_2=Count('id', filter=Q(rating=2)),
+            stars_3=Count('id', filter=Q(rating=3)),
+            stars_4=Count('id', filter=Q(rating=4)),
+            stars_5=Count('id', filter=Q(rating__gte=5)),
+        )
+    )
+    ProductRatingSummary.objects.bulk_create(
+        [ProductRatingSummary(**row) for row in rows.iterator()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0003_product_created_at_id_index'),
+        ('reviews', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductRatingSummary',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rating_summary', serialize=False, to='products.product')),
+                ('review_count', models.PositiveIntegerField(default=0)),
+                ('rating_total', models.PositiveIntegerField(default=0)),
+                ('verified_count', models.PositiveIntegerField(default=0)),
+                ('stars_1', models.PositiveIntegerField(default=0)),
+                ('stars_2', models.PositiveIntegerField(default=0)),
+                ('stars_3', models.PositiveIntegerField(default=0)),
+                ('stars_4', models.PositiveIntegerField(default=0)),
+                ('stars_5', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['product', 'created_at', 'id'], name='reviews_rev_product_423fb1_idx'),
+        ),
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+    ]
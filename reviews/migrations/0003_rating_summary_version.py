@@ -0,0 +1,24 @@
+# Generated by Django 6.0 on 2026-10-17 18:07
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reviews', '0002_productratingsummary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='productratingsummary',
+            name='updated_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name='productratingsummary',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -1,5 +1,6 @@
 from django.conf import settings
 from django.db import models
+from django.utils import timezone
 from products.models import Product
 
 # Create your models here.
@@ -11,6 +12,100 @@ class Review(models.Model):
     verified = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Keyset pages of a product's reviews: ORDER BY -created_at, -id
+            models.Index(fields=['product', 'created_at', 'id']),
+        ]
+
     def __str__(self):
         return f"{self.product.name} review by {self.user}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # What the rating summary currently counts for this review
+        instance._saved = (
+            instance.__dict__.get("rating"),
+            instance.__dict__.get("verified"),
+        )
+        return instance
+
+
+class ProductRatingSummary(models.Model):
+    """
+    Running totals of a product's reviews, maintained incrementally by the
+    Review signals (see reviews/signals.py) and rebuilt by
+    `manage.py rebuild_rating_summaries`.
+    """
+    product = models.OneToOneField(
+        Product,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='rating_summary'
+    )
+    review_count = models.PositiveIntegerField(default=0)
+    rating_total = models.PositiveIntegerField(default=0)
+    verified_count = models.PositiveIntegerField(default=0)
+    stars_1 = models.PositiveIntegerField(default=0)
+    stars_2 = models.PositiveIntegerField(default=0)
+    stars_3 = models.PositiveIntegerField(default=0)
+    stars_4 = models.PositiveIntegerField(default=0)
+    stars_5 = models.PositiveIntegerField(default=0)
+    # Moved on every review change, including comment edits; part of the
+    # product page's HTTP validators (products/conditional.py)
+    version = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.product_id}: {self.average_rating} ({self.review_count})"
+
+    @classmethod
+    def rebuild(cls, product_ids):
+        """Recompute the summaries of `product_ids` from their reviews."""
+        aggregates = {
+            "review_count": models.Count("id"),
+            "rating_total": models.Sum("rating"),
+            "verified_count": models.Count("id", filter=models.Q(verified=True)),
+            "stars_1": models.Count("id", filter=models.Q(rating__lte=1)),
+            "stars_5": models.Count("id", filter=models.Q(rating__gte=5)),
+            **{
+                f"stars_{stars}": models.Count("id", filter=models.Q(rating=stars))
+                for stars in (2, 3, 4)
+            },
+        }
+        rows = (
+            Review.objects.filter(product_id__in=product_ids)
+            .order_by()
+            .values("product_id")
+            .annotate(**aggregates)
+        )
+        versions = dict(cls.objects.filter(product_id__in=product_ids).values_list("product_id", "version"))
+        now = timezone.now()
+        summaries = {
+            pid: cls(product_id=pid, version=versions.get(pid, 0) + 1, updated_at=now)
+            for pid in product_ids
+        }
+        for row in rows:
+            summary = summaries[row.pop("product_id")]
+            for field, value in row.items():
+                setattr(summary, field, value or 0)
+
+        cls.objects.filter(product_id__in=product_ids).delete()
+        cls.objects.bulk_create(summaries.values())
+
+    @staticmethod
+    def star_field(rating):
+        """Histogram column for a rating, clamped to 1–5."""
+        return f"stars_{min(max(int(rating), 1), 5)}"
+
+    @property
+    def average_rating(self):
+        if not self.review_count:
+            return None
+        return round(self.rating_total / self.review_count, 2)
+
+    @property
+    def histogram(self):
+        """[(stars, count), ...] from 5 stars down to 1."""
+        return [(stars, getattr(self, f"stars_{stars}")) for stars in range(5, 0, -1)]
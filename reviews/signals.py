@@ -0,0 +1,63 @@
+# reviews/signals.py
+#
+# Apply each review's contribution to its ProductRatingSummary as a delta,
+# so the summary never needs to rescan the product's reviews, and purge the
+# product's cached page.
+
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from products import page_cache
+from .models import ProductRatingSummary, Review
+
+
+def _apply(product_id, rating, verified, sign):
+    if sign > 0:
+        # Only additions create the row: a delete may be part of a cascade
+        # that is removing the product (and its summary) as well.
+        ProductRatingSummary.objects.get_or_create(product_id=product_id)
+    star_field = ProductRatingSummary.star_field(rating)
+    ProductRatingSummary.objects.filter(product_id=product_id).update(**{
+        "review_count": F("review_count") + sign,
+        "rating_total": F("rating_total") + sign * rating,
+        "verified_count": F("verified_count") + sign * int(bool(verified)),
+        star_field: F(star_field) + sign,
+        "version": F("version") + 1,
+        "updated_at": timezone.now(),
+    })
+
+
+def _touch(product_id):
+    """Move the summary version for a change that leaves the totals alone."""
+    ProductRatingSummary.objects.filter(product_id=product_id).update(
+        version=F("version") + 1, updated_at=timezone.now(),
+    )
+
+
+def _purge_on_commit(product_id):
+    transaction.on_commit(lambda: page_cache.purge_product_pages([product_id]))
+
+
+@receiver(post_save, sender=Review)
+def add_review_to_summary(sender, instance, created, **kwargs):
+    _purge_on_commit(instance.product_id)
+    current = (instance.rating, instance.verified)
+    previous = None if created else getattr(instance, "_saved", None)
+    if previous == current:
+        _touch(instance.product_id)
+        return
+
+    if previous is not None:
+        _apply(instance.product_id, *previous, sign=-1)
+    _apply(instance.product_id, *current, sign=1)
+    instance._saved = current
+
+
+@receiver(post_delete, sender=Review)
+def remove_review_from_summary(sender, instance, **kwargs):
+    _purge_on_commit(instance.product_id)
+    rating, verified = getattr(instance, "_saved", (instance.rating, instance.verified))
+    _apply(instance.product_id, rating, verified, sign=-1)
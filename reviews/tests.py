@@ -1,3 +1,131 @@
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
 from django.test import TestCase
+from django.urls import reverse
+
+from ecommerce.testing import QueryBudgetMixin, QueryPlanMixin
+from products import page_cache
+from products.models import Product
+from stores.models import Store
+from .models import ProductRatingSummary, Review
+
+User = get_user_model()
+
+
+class RatingSummaryTests(TestCase):
+    TOTALS = [
+        "review_count", "rating_total", "verified_count",
+        "stars_1", "stars_2", "stars_3", "stars_4", "stars_5",
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", password="pw", is_seller=True)
+        cls.buyer = User.objects.create_user("buyer", password="pw")
+        cls.store = Store.objects.create(name="Store", owner=cls.seller)
+        cls.product = Product.objects.create(
+            seller=cls.seller, store=cls.store, name="Lamp",
+            price=Decimal("9.99"), stock=3, sku="LAMP-1",
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_summary_tracks_review_saves_and_deletes(self):
+        Review.objects.create(product=self.product, user=self.buyer, rating=5, comment="a", verified=True)
+        review = Review.objects.create(product=self.product, user=self.buyer, rating=2, comment="b")
+
+        review = Review.objects.get(id=review.id)
+        review.rating = 3
+        review.save()
+
+        summary = ProductRatingSummary.objects.get(product=self.product)
+        self.assertEqual((summary.review_count, summary.average_rating, summary.verified_count), (2, 4.0, 1))
+        self.assertEqual((summary.stars_2, summary.stars_3, summary.stars_5), (0, 1, 1))
+
+        review.delete()
+        summary.refresh_from_db()
+        self.assertEqual((summary.review_count, summary.rating_total, summary.stars_3), (1, 5, 0))
+
+    def test_rebuild_matches_incremental_summary(self):
+        for rating in (1, 4, 4):
+            Review.objects.create(product=self.product, user=self.buyer, rating=rating, comment="x")
+        totals = ProductRatingSummary.objects.values(*self.TOTALS)
+        expected = totals.get(product=self.product)
+        ProductRatingSummary.objects.all().delete()
+
+        call_command("rebuild_rating_summaries", stdout=open("/dev/null", "w"))
+
+        self.assertEqual(totals.get(product=self.product), expected)
+
+    def _detail_queries(self, review_count):
+        Review.objects.bulk_create([
+            Review(product=self.product, user=self.buyer, rating=4, comment=str(i))
+            for i in range(review_count)
+        ])
+        url = reverse("product_detail", args=[self.product.id])
+        self.client.get(url)  # warm the product cache
+        page_cache.purge_product_pages([self.product.id])
+        with self.assertNumQueries(2):  # availability with summary, review page
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_product_page_query_count_is_bounded(self):
+        response = self._detail_queries(25)
+
+        self.assertEqual(len(response.context["reviews"]), 10)
+        self.assertTrue(response.context["reviews"].has_next)
+
+        next_page = self.client.get(
+            reverse("product_reviews", args=[self.product.id]),
+            {"reviews": response.context["reviews"].next_cursor},
+        )
+        self.assertEqual(len(next_page.context["reviews"]), 10)
+
+
+class ReviewQueryBudgetTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seller = User.objects.create_user("seller", password="pw", is_seller=True)
+        cls.product = Product.objects.create(
+            seller=seller, store=Store.objects.create(name="Store", owner=seller),
+            name="Lamp", price=Decimal("9.99"), stock=3, sku="LAMP-1",
+        )
+        Review.objects.bulk_create([
+            Review(product=cls.product, user=seller, rating=3, comment=str(i)) for i in range(30)
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_review_listing_stays_within_budget(self):
+        # product, summary, one page of reviews with authors joined
+        self.assertQueryBudget(3, reverse("product_reviews", args=[self.product.id]))
+
+
+class ReviewQueryPlanTests(QueryPlanMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seller = User.objects.create_user("seller", password="pw", is_seller=True)
+        cls.buyer = User.objects.create_user("buyer", password="pw")
+        cls.product = Product.objects.create(
+            seller=seller, store=Store.objects.create(name="Store", owner=seller),
+            name="Lamp", price=Decimal("9.99"), stock=3, sku="LAMP-1",
+        )
+        Review.objects.bulk_create([
+            Review(product=cls.product, user=seller, rating=4, comment=str(i)) for i in range(10)
+        ])
+
+    def test_review_views_use_indexes(self):
+        self.assertIndexedQueries(reverse("product_reviews", args=[self.product.id]))
 
-# Create your tests here.
+        self.client.force_login(self.buyer)
+        self.assertIndexedQueries(
+            reverse("leave_review", args=[self.product.id]), method="post",
+            data={"rating": 5, "comment": "Bright"},
+        )
+        self.assertTrue(Review.objects.filter(user=self.buyer).exists())
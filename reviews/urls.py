@@ -3,4 +3,5 @@ from . import views
 
 urlpatterns = [
     path("leave/<int:product_id>/", views.leave_review, name="leave_review"),
+    path("product/<int:product_id>/", views.product_reviews, name="product_reviews"),
 ]
\ No newline at end of file
@@ -1,8 +1,13 @@
+from django.http import Http404
 from django.shortcuts import get_object_or_404, redirect, render
 from .models import Review
 from .forms import ReviewForm
+from .listing import rating_summary, review_page
+from products import cache as product_cache
+from products.conditional import conditional_page, product_validators, reuse
 from products.models import Product
-from orders.models import OrderItem
+from products.pagination import InvalidCursor
+from orders.models import Purchase
 
 
 # Create your views here.
@@ -16,13 +21,8 @@ def leave_review(request, product_id):
             review.user = request.user
             review.product = product
 
-            # Determine if verified
-            purchased = OrderItem.objects.filter(
-                order__user=request.user,
-                product=product
-            ).exists()
-
-            review.verified = purchased
+            # Determine if verified (one lookup in the purchase ledger)
+            review.verified = Purchase.has_purchased(request.user, product.id)
             review.save()
 
             return redirect("product_detail", product_id=product.id)
@@ -30,3 +30,22 @@ def leave_review(request, product_id):
         form = ReviewForm()
 
     return render(request, "reviews/leave_review.html", {"form": form, "product": product})
+
+
+@conditional_page(product_validators)
+def product_reviews(request, product_id):
+    try:
+        product = product_cache.get(product_id)
+        summary = reuse(request, "summary", lambda: rating_summary(product_id))
+        reviews = review_page(product_id, cursor=request.GET.get("reviews"))
+    except InvalidCursor:
+        raise Http404("Invalid review cursor")
+    if product is None:
+        raise Http404("No Product matches the given query.")
+
+    return render(request, "reviews/review_list.html", {
+        "product": product,
+        "summary": summary,
+        "reviews": reviews,
+        "reviews_url": request.path,
+    })